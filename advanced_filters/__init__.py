@@ -1 +1,10 @@
 __version__ = '2.0.0'
+
+try:
+    import django
+except ImportError:  # i.e: imported by setup.py before Django is installed
+    pass
+else:
+    # Django < 3.2 doesn't discover the AppConfig of an app by itself
+    if django.VERSION < (3, 2):
+        default_app_config = 'advanced_filters.apps.AdvancedFiltersConfig'
@@ -1,18 +1,51 @@
+from functools import lru_cache
 import logging
+import time
 
+import django
 from django.conf import settings
+from django import forms
 from django.contrib import admin, messages
 from django.contrib.admin.utils import unquote
-from django.http import HttpResponseRedirect
-from django.shortcuts import resolve_url
-from django.utils.translation import gettext_lazy as _
+from django.contrib.admin.views.main import PAGE_VAR
+from django.contrib.auth import get_permission_codename
+from django.core.exceptions import PermissionDenied
+from django.db import router
+from django.db.models import F
+from django.http import (
+    HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, resolve_url
+from django.template.response import TemplateResponse
+from django.urls import NoReverseMatch, path, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _, ngettext
 
+from .admission import (MATERIALIZE, estimate_cost, get_policy,
+                        heavy_filter_slots)
+from .export import CONTENT_TYPES, CSV, ENCODERS, iter_export
 from .forms import AdvancedFilterForm
-from .models import AdvancedFilter
+from .models import AdvancedFilter, AdvancedFilterResult
+from .paginator import (CURSOR_VAR, DEFAULT_LIMIT, AdvancedFilterPaginator,
+                        KeysetPaginator)
+from .query_cache import query_cache
+from .sidebar_cache import sidebar_cache
+from .sql_cache import sql_cache
+from .stats import stats_buffer
+from .timeouts import StatementTimeout, statement_timeout
 
 
 logger = logging.getLogger('advanced_filters.admin')
 
+# the value of PAGE_VAR of the first changelist page
+FIRST_PAGE_NUM = 0 if django.VERSION < (3, 0) else 1
+
+# assets a changelist needs to open the (lazily loaded) advanced filter dialog,
+# the dialog loads the rest of the form media itself
+DIALOG_LAUNCHER_MEDIA = forms.Media(
+    js=['admin/js/vendor/jquery/jquery.min.js',
+        'magnific-popup/jquery.magnific-popup.js'],
+    css={'screen': ['magnific-popup/magnific-popup.css']})
+
 
 class AdvancedListFilters(admin.SimpleListFilter):
     """Allow filtering by stored advanced filters (selection by title)"""
@@ -29,28 +62,218 @@ class AdvancedListFilters(admin.SimpleListFilter):
             f"{model_admin.model._meta.app_label}."
             f"{model_admin.model._meta.object_name}"
         )
-        return AdvancedFilter.objects.filter_by_user(request.user).filter(
-            model=model_name).values_list('id', 'title')
+        return sidebar_cache.get_or_set(
+            request.user, model_name,
+            lambda: AdvancedFilter.objects.filter_by_user(request.user).filter(
+                model=model_name).values_list('id', 'title'))
 
     def queryset(self, request, queryset):
         if self.value():
-            filters = AdvancedFilter.objects.filter(id=self.value())
-            advfilter = None
-            if hasattr(filters, 'first'):
-                advfilter = filters.first()
-            if not advfilter:
+            if self.get_snapshot_time(request, self.value()):
+                # a materialized filter, filter by its snapshot instead
+                return queryset.filter(pk__in=AdvancedFilterResult.subquery(
+                    self.value(), queryset.model._meta.pk))
+            query = self.get_query(self.value())
+            if query is None:
                 logger.error("AdvancedListFilters.queryset: Invalid filter id")
                 return queryset
-            query = advfilter.query
             logger.debug(query.__dict__)
-            return queryset.filter(query).distinct()
+            filtered = sql_cache.filter(queryset, self.value(), query)
+            if not self.admit(request, query, filtered):
+                # not run, so not recorded as an execution either
+                request._advanced_filters_rejected = True
+                return queryset.none()
+            return filtered
         return queryset
 
+    def admit(self, request, query, queryset):
+        """
+        Whether the (estimated) cost of running the filter is admissible,
+        explaining why not to the user otherwise (see the admission module).
+        A heavy filter takes one of the slots of the user, released by the
+        view which ran it (see HeavyFilterSlots.releasing).
+        """
+        cost = estimate_cost(queryset.model, query, queryset)
+        excesses = cost.get_excesses()
+        if excesses:
+            if (get_policy() == MATERIALIZE and
+                    self.may_materialize(request, self.value())):
+                # queue the filter for the next refresh of snapshots
+                if not self.get_filter_options(
+                        request, self.value()).get('materialize'):
+                    AdvancedFilter.objects.filter(pk=self.value()).update(
+                        materialize=True)
+                    query_cache.invalidate(self.value())
+                messages.add_message(request, messages.WARNING, _(
+                    'This filter is too expensive to run, its results will be '
+                    'available once a snapshot of them is taken by the '
+                    'scheduled refresh_advanced_filters command.'))
+            else:
+                messages.add_message(request, messages.ERROR, _(
+                    'This filter is too expensive to run: %s.') %
+                    '; '.join(excesses))
+            return False
+        if cost.heavy and not heavy_filter_slots.acquire_for(request):
+            messages.add_message(request, messages.ERROR, _(
+                'Too many expensive filters are running for you, please '
+                'try again later.'))
+            return False
+        return True
+
+    @staticmethod
+    def may_materialize(request, filter_id):
+        """
+        Whether the user of request may change the filter, i.e: queue it for
+        the next refresh of snapshots
+        """
+        opts = AdvancedFilter._meta
+        if not request.user.has_perm('%s.%s' % (
+                opts.app_label, get_permission_codename('change', opts))):
+            return False
+        return (AdvancedFilterAdmin.user_has_permission(request.user) or
+                AdvancedFilter.objects.filter_by_user(request.user).filter(
+                    pk=filter_id).exists())
+
+    @classmethod
+    def get_filter_id(cls, request):
+        """
+        The id of the filter applied to the changelist of request, None if
+        there is none or it isn't a valid id (left to the changelist to
+        reject)
+        """
+        filter_id = request.GET.get(cls.parameter_name, '')
+        return filter_id if filter_id.isdigit() else None
+
+    @staticmethod
+    def get_query(filter_id):
+        """
+        Return the decoded query of a saved filter, served from the
+        query cache when possible (to avoid fetching and decoding the filter)
+        """
+        query = query_cache.get(filter_id)
+        if query is None:
+            advfilter = AdvancedFilter.objects.filter(id=filter_id).first()
+            if advfilter:
+                query = advfilter.query
+        return query
+
+    @staticmethod
+    def get_filter_options(request, filter_id):
+        """
+        Return the options of a saved filter (empty if it doesn't exist) which
+        apply to a changelist, served from the query cache along with its
+        query when possible, and memoized for the rest of the request
+        """
+        options = getattr(request, '_advanced_filters_options', None)
+        if options is None:
+            options = request._advanced_filters_options = {}
+        if filter_id not in options:
+            filter_options = query_cache.get_options(filter_id)
+            if filter_options is None:
+                advfilter = AdvancedFilter.objects.filter(id=filter_id).first()
+                filter_options = {}
+                if advfilter:
+                    advfilter.query  # caches the query along with options
+                    filter_options = advfilter.get_options()
+            options[filter_id] = filter_options
+        return options[filter_id]
+
+    @classmethod
+    def get_snapshot_time(cls, request, filter_id):
+        """
+        Return when the snapshot of a materialized filter was taken (None if
+        the filter isn't materialized)
+        """
+        options = cls.get_filter_options(request, filter_id)
+        return options.get('materialize') and options['materialized_at'] or None
+
+
+class KeysetChangeListMixin:
+    """
+    Links of a changelist paged by the cursors of a KeysetPaginator, whose
+    other links (orderings, filters) start over from the first page
+    """
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        if CURSOR_VAR not in (new_params or {}):
+            remove = list(remove or []) + [CURSOR_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_cursor_url(self, cursor):
+        if cursor is None:
+            return None
+        return self.get_query_string({CURSOR_VAR: cursor}, [PAGE_VAR])
+
+    @property
+    def keyset_first_url(self):
+        return self.get_query_string(remove=[PAGE_VAR])
+
+    @property
+    def keyset_next_url(self):
+        return self.get_cursor_url(self.paginator.next_cursor)
+
+    @property
+    def keyset_previous_url(self):
+        return self.get_cursor_url(self.paginator.previous_cursor)
+
+
+def get_page_number(request):
+    """
+    The number (from 1) of the changelist page requested, normalized as
+    ChangeList does (whose pages are numbered from 0 before Django 3.0)
+    """
+    try:
+        page_num = int(request.GET.get(PAGE_VAR, FIRST_PAGE_NUM))
+    except ValueError:
+        page_num = FIRST_PAGE_NUM
+    return page_num - FIRST_PAGE_NUM + 1
+
+
+@lru_cache(maxsize=None)
+def get_keyset_changelist(changelist_class):
+    return type('Keyset%s' % changelist_class.__name__,
+                (KeysetChangeListMixin, changelist_class), {})
+
 
 class AdminAdvancedFiltersMixin:
-    """ Generic AdvancedFilters mixin """
+    """
+    Generic AdvancedFilters mixin
+
+    Unless advanced_filter_lazy_form is False, the "Create advanced filter"
+    dialog (and most of its media) is only fetched from the
+    advanced_filter_form_view when opened, rather than rendered within every
+    changelist.
+
+    Setting advanced_filter_count to "bounded" (or "estimate") spares exact
+    counts of changelists filtered by an advanced filter, see
+    AdvancedFilterPaginator.
+
+    Setting advanced_filter_keyset to True pages changelists filtered by an
+    advanced filter by cursors rather than by offsets (unless list_editable),
+    see KeysetPaginator.
+
+    Changelists filtered by an advanced filter are cancelled after the
+    time budget of the filter, or advanced_filter_timeout seconds (default
+    ADVANCED_FILTERS_TIMEOUT, None for no budget), see statement_timeout.
+
+    The results of an advanced filter are exported (streamed) as CSV or JSON
+    lines by the advanced_filter_export_view, limited to the columns of
+    advanced_filter_export_fields (default: the primary key and
+    advanced_filter_fields).
+    """
     advanced_change_list_template = "admin/advanced_filters.html"
+    advanced_filter_dialog_template = "admin/advanced_filters/dialog_fragment.html"
     advanced_filter_form = AdvancedFilterForm
+    advanced_filter_lazy_form = True
+    advanced_filter_count = None
+    advanced_filter_count_limit = DEFAULT_LIMIT
+    advanced_filter_timeout = None
+    advanced_filter_keyset = False
+    advanced_filter_export_fields = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -62,6 +285,93 @@ class AdminAdvancedFiltersMixin:
         # add list filters to filters
         self.list_filter = (AdvancedListFilters,) + tuple(self.list_filter)
 
+    def uses_keyset(self, request):
+        """Whether the changelist is paged by keyset cursors"""
+        return bool(self.advanced_filter_keyset and not self.list_editable and
+                    request.GET.get(AdvancedListFilters.parameter_name))
+
+    def get_changelist(self, request, **kwargs):
+        changelist_class = super().get_changelist(request, **kwargs)
+        if self.uses_keyset(request):
+            return get_keyset_changelist(changelist_class)
+        return changelist_class
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        filter_id = request.GET.get(AdvancedListFilters.parameter_name)
+        keyset = self.uses_keyset(request)
+        if not ((self.advanced_filter_count or keyset) and filter_id):
+            return super().get_paginator(
+                request, queryset, per_page, orphans, allow_empty_first_page)
+        kwargs = {}
+        paginator_class = AdvancedFilterPaginator
+        if keyset:
+            paginator_class = KeysetPaginator
+            kwargs['cursor'] = request.GET.get(CURSOR_VAR)
+        return paginator_class(
+            queryset, per_page, orphans, allow_empty_first_page,
+            filter_id=filter_id, mode=self.advanced_filter_count,
+            # "Show all" must not be offered for an inexact count
+            limit=max(self.advanced_filter_count_limit,
+                      self.list_max_show_all),
+            page_number=get_page_number(request), **kwargs)
+
+    def get_advanced_filter_timeout(self, request, filter_id):
+        """The time budget (in seconds) of a changelist filtered by filter_id"""
+        timeout = AdvancedListFilters.get_filter_options(
+            request, filter_id).get('timeout')
+        if timeout is None:
+            timeout = self.advanced_filter_timeout
+        if timeout is None:
+            timeout = getattr(settings, 'ADVANCED_FILTERS_TIMEOUT', None)
+        return timeout
+
+    def get_changelist_instance(self, request):
+        """
+        Run the advanced filter applied to the changelist within its time
+        budget (fetching the page of results too, so it is), recording the
+        execution (filtering and counting its results, see
+        stats.StatsBuffer) unless the filter wasn't admitted
+        """
+        filter_id = AdvancedListFilters.get_filter_id(request)
+        if filter_id is None:
+            return super().get_changelist_instance(request)
+        start = time.perf_counter()
+        with heavy_filter_slots.releasing(request), statement_timeout(
+                router.db_for_read(self.model),
+                self.get_advanced_filter_timeout(request, filter_id)):
+            changelist = super().get_changelist_instance(request)
+            len(changelist.result_list)
+        elapsed = time.perf_counter() - start
+        count = changelist.result_count
+        if not getattr(changelist.paginator, 'exact', True):
+            count = None
+        if not getattr(request, '_advanced_filters_rejected', False):
+            stats_buffer.record(filter_id, elapsed, count)
+        return changelist
+
+    def advanced_filter_timed_out(self, request, filter_id, error):
+        """
+        Record a timeout of the filter and redirect to the changelist without
+        it, explaining why
+        """
+        logger.warning('Advanced filter %s timed out: %s', filter_id, error)
+        AdvancedFilter.objects.filter(pk=filter_id).update(
+            timeouts=F('timeouts') + 1, last_timeout_at=timezone.now())
+        title = AdvancedListFilters.get_filter_options(
+            request, filter_id).get('title', filter_id)
+        messages.add_message(request, messages.ERROR, _(
+            'The advanced filter "%(title)s" was cancelled after exceeding '
+            'its time budget of %(budget)s seconds.') % {
+                'title': title, 'budget': error.budget})
+        params = request.GET.copy()
+        params.pop(AdvancedListFilters.parameter_name, None)
+        params.pop(PAGE_VAR, None)
+        params.pop(CURSOR_VAR, None)
+        return HttpResponseRedirect('{path}{qparams}'.format(
+            path=request.path,
+            qparams=params and '?' + params.urlencode() or ''))
+
     def save_advanced_filter(self, request, form):
         if form.is_valid():
             afilter = form.save(commit=False)
@@ -81,8 +391,105 @@ class AdminAdvancedFiltersMixin:
         else:
             logger.info('Failed saving advanced filter, params: %s', form.data)
 
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path('advanced_filter_form/',
+                 self.admin_site.admin_view(self.advanced_filter_form_view),
+                 name='%s_%s_advanced_filter_form' % info),
+            path('advanced_filter_export/<int:filter_id>/',
+                 self.admin_site.admin_view(self.advanced_filter_export_view),
+                 name='%s_%s_advanced_filter_export' % info),
+        ] + super().get_urls()
+
+    def get_advanced_filter_export_fields(self, request):
+        """The columns (field paths) filter results may be exported with"""
+        if self.advanced_filter_export_fields is not None:
+            return list(self.advanced_filter_export_fields)
+        pk = self.opts.pk.name
+        fields = [field[0] if isinstance(field, tuple) else field
+                  for field in getattr(self, 'advanced_filter_fields', ())]
+        return [pk] + [field for field in fields if field != pk]
+
+    def advanced_filter_export_view(self, request, filter_id):
+        """
+        Stream the results of a saved filter as CSV (or JSON lines, given
+        format=jsonl), with the given (comma separated) columns
+        """
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        filters = AdvancedFilter.objects.all()
+        if not request.user.is_superuser:
+            filters = AdvancedFilter.objects.filter_by_user(request.user)
+        afilter = get_object_or_404(
+            filters, pk=filter_id, model=self.opts.label)
+
+        export_format = request.GET.get('format', CSV)
+        if export_format not in ENCODERS:
+            return HttpResponseBadRequest(
+                'Unsupported export format: %s' % export_format)
+        allowed = self.get_advanced_filter_export_fields(request)
+        columns = allowed
+        if request.GET.get('columns'):
+            columns = request.GET['columns'].split(',')
+            invalid = set(columns) - set(allowed)
+            if invalid:
+                return HttpResponseBadRequest('Invalid columns: %s' % ', '.join(
+                    sorted(invalid)))
+
+        queryset = self.get_queryset(request)
+        if afilter.materialize and afilter.materialized_at:
+            queryset = queryset.filter(pk__in=AdvancedFilterResult.subquery(
+                afilter.pk, self.opts.pk))
+        else:
+            query = afilter.query
+            queryset = sql_cache.filter(queryset, afilter.pk, query)
+            excesses = estimate_cost(self.model, query, queryset).get_excesses()
+            if excesses:
+                messages.add_message(request, messages.ERROR, _(
+                    'This filter is too expensive to export: %s.') %
+                    '; '.join(excesses))
+                return HttpResponseRedirect(reverse(
+                    'admin:%s_%s_changelist' % (
+                        self.opts.app_label, self.opts.model_name),
+                    current_app=self.admin_site.name))
+
+        response = StreamingHttpResponse(
+            iter_export(queryset, columns, export_format),
+            content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = (
+            'attachment; filename="{}-{}.{}"'.format(
+                self.opts.model_name, afilter.pk, export_format))
+        return response
+
+    @staticmethod
+    def get_advanced_filter_dialog_media(form):
+        """The media of form, without the assets of DIALOG_LAUNCHER_MEDIA"""
+        media = form.media
+        loaded = DIALOG_LAUNCHER_MEDIA
+        return forms.Media(
+            js=[js for js in media._js if js not in loaded._js],
+            css={medium: [css for css in paths
+                          if css not in loaded._css.get(medium, [])]
+                 for medium, paths in media._css.items()})
+
+    def advanced_filter_form_view(self, request):
+        """Render the "Create advanced filter" dialog of the changelist"""
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        form = self.advanced_filter_form(model_admin=self, extra_form=True)
+        context = {
+            **self.admin_site.each_context(request),
+            'advanced_filters': form,
+            'dialog_media': self.get_advanced_filter_dialog_media(form),
+            'opts': self.opts,
+            'app_label': self.opts.app_label,
+        }
+        return TemplateResponse(
+            request, self.advanced_filter_dialog_template, context)
+
     def changelist_view(self, request, extra_context=None):
-        """Add advanced_filters form to changelist context"""
+        """Add advanced_filters form (or the url of it) to changelist context"""
         if extra_context is None:
             extra_context = {}
 
@@ -91,20 +498,46 @@ class AdminAdvancedFiltersMixin:
             if request.POST.get('action') == 'advanced_filters':
                 data = request.POST
 
-        form = self.advanced_filter_form(data=data, model_admin=self, extra_form=True)
+        form = None
+        if data is not None or not self.advanced_filter_lazy_form:
+            form = self.advanced_filter_form(
+                data=data, model_admin=self, extra_form=True)
+        current_afilter = request.GET.get(AdvancedListFilters.parameter_name)
+        filter_id = AdvancedListFilters.get_filter_id(request)
         extra_context.update({
             'original_change_list_template': self.original_change_list_template,
             'advanced_filters': form,
-            'current_afilter': request.GET.get('_afilter'),
+            'current_afilter': current_afilter,
+            'current_afilter_snapshot_at': filter_id and
+            AdvancedListFilters.get_snapshot_time(request, filter_id),
             'app_label': self.opts.app_label,
+            'advanced_filter_export_url': filter_id and reverse(
+                'admin:%s_%s_advanced_filter_export' % (
+                    self.opts.app_label, self.opts.model_name),
+                args=[filter_id], current_app=self.admin_site.name),
         })
+        if form is None:
+            extra_context.update({
+                'advanced_filters_url': reverse(
+                    'admin:%s_%s_advanced_filter_form' % (
+                        self.opts.app_label, self.opts.model_name),
+                    current_app=self.admin_site.name),
+                'advanced_filters_media': DIALOG_LAUNCHER_MEDIA,
+            })
 
-        if request.method == "POST":
+        if form is not None and data is not None:
             response = self.save_advanced_filter(request, form)
             if response:
                 return response
 
-        return super().changelist_view(request, extra_context=extra_context)
+        try:
+            # i.e: admin actions run the filter again, on the changelist's
+            # get_queryset()
+            with heavy_filter_slots.releasing(request):
+                return super().changelist_view(
+                    request, extra_context=extra_context)
+        except StatementTimeout as e:
+            return self.advanced_filter_timed_out(request, filter_id, e)
 
 
 class AdvancedFilterAdmin(admin.ModelAdmin):
@@ -112,13 +545,68 @@ class AdvancedFilterAdmin(admin.ModelAdmin):
     form = AdvancedFilterForm
     extra = 0
 
-    list_display = ('title', 'model', 'created_by', )
-    readonly_fields = ('created_by', 'model', 'created_at', )
+    list_display = ('title', 'model', 'created_by', 'materialize',
+                    'executions', 'cumulative_time', 'p95', 'last_used_at',
+                    'last_count', 'timeouts', )
+    fields = ('title', 'materialize', 'timeout', 'created_by', 'model',
+              'created_at', 'materialized_at', 'timeouts', 'last_timeout_at', )
+    readonly_fields = ('created_by', 'model', 'created_at', 'materialized_at',
+                       'timeouts', 'last_timeout_at', )
     list_filter = ('model', )
+    actions = ('refresh_snapshots', 'export_results', )
 
     def has_add_permission(self, obj=None):
         return False
 
+    def refresh_snapshots(self, request, queryset):
+        """Refresh the snapshots of the selected materialized filters"""
+        refreshed = 0
+        for afilter in queryset.filter(materialize=True):
+            afilter.refresh_snapshot()
+            refreshed += 1
+        messages.add_message(request, messages.SUCCESS, ngettext(
+            'Refreshed the snapshot of %d materialized filter.',
+            'Refreshed the snapshots of %d materialized filters.',
+            refreshed) % refreshed)
+    refresh_snapshots.short_description = _(
+        'Refresh snapshots of selected materialized filters')
+    refresh_snapshots.allowed_permissions = ('change', )
+
+    @staticmethod
+    def _ms(seconds):
+        return '-' if seconds is None else '%.1f ms' % (seconds * 1000)
+
+    def cumulative_time(self, obj):
+        return self._ms(obj.total_time)
+    cumulative_time.short_description = _('Cumulative time')
+    cumulative_time.admin_order_field = 'total_time'
+
+    def p95(self, obj):
+        return self._ms(obj.p95_time)
+    p95.short_description = _('95th percentile time')
+    p95.admin_order_field = 'p95_time'
+
+    def export_results(self, request, queryset):
+        """Export the results of the selected filter (streamed as CSV)"""
+        if queryset.count() != 1:
+            messages.add_message(request, messages.WARNING, _(
+                'Select a single filter to export its results.'))
+            return None
+        afilter = queryset.get()
+        app_label, _sep, model = (afilter.model or '').partition('.')
+        try:
+            url = reverse('admin:%s_%s_advanced_filter_export' % (
+                app_label, model.lower()), args=[afilter.pk],
+                current_app=self.admin_site.name)
+        except NoReverseMatch:
+            messages.add_message(request, messages.ERROR, _(
+                'The results of filters of %s cannot be exported.') %
+                afilter.model)
+            return None
+        return HttpResponseRedirect(url)
+    export_results.short_description = _('Export results of selected filter')
+    export_results.allowed_permissions = ('view', )
+
     def save_model(self, request, new_object, *args, **kwargs):
         if new_object and not new_object.pk:
             new_object.created_by = request.user
@@ -151,15 +639,28 @@ class AdvancedFilterAdmin(admin.ModelAdmin):
         else:
             return self.model.objects.filter_by_user(request.user)
 
+    def is_shared_with(self, request, obj):
+        """
+        Whether obj is shared with the user of request, checked by a single
+        EXISTS query memoized for the rest of the request
+        """
+        shared = getattr(request, '_advanced_filters_shared', None)
+        if shared is None:
+            shared = request._advanced_filters_shared = {}
+        if obj.pk not in shared:
+            shared[obj.pk] = self.model.objects.filter_by_user(
+                request.user).filter(pk=obj.pk).exists()
+        return shared[obj.pk]
+
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return super().has_change_permission(request)
-        return self.user_has_permission(request.user) or obj in self.model.objects.filter_by_user(request.user)
+        return self.user_has_permission(request.user) or self.is_shared_with(request, obj)
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return super().has_delete_permission(request)
-        return self.user_has_permission(request.user) or obj in self.model.objects.filter_by_user(request.user)
+        return self.user_has_permission(request.user) or self.is_shared_with(request, obj)
 
 
 admin.site.register(AdvancedFilter, AdvancedFilterAdmin)
@@ -0,0 +1,232 @@
+"""
+Admission control of saved filters, based on their estimated cost.
+
+The cost of a filter query is estimated before running it, from the joins
+and multi-valued relations (reverse foreign keys, many-to-many) its rules
+traverse, and the "Contains"/regular expression rules no index serves (see
+``index_advisor``), plus on PostgreSQL the planner's total cost (``EXPLAIN``).
+Filters over either limit are too expensive to run, and are either rejected
+or (when ``ADVANCED_FILTERS_HEAVY_FILTERS`` is "materialize") filtered by a
+snapshot taken in the background, by the ``refresh_advanced_filters``
+command.
+
+Filters admitted but still "heavy" are limited in the number a user may run
+at once, using a counter in a shared cache. The slots a request takes are
+counted on it, and released by the code path which took them (see
+``HeavyFilterSlots.releasing``).
+
+Settings:
+
+ADVANCED_FILTERS_MAX_COST
+    Maximum (static) cost of a filter, see ``FilterCost.score`` (default
+    None, unlimited).
+ADVANCED_FILTERS_MAX_PLANNER_COST
+    Maximum total cost of the plan of a filter query on PostgreSQL (default
+    None, unlimited).
+ADVANCED_FILTERS_HEAVY_FILTERS
+    "reject" (default) or "materialize" filters too expensive to run.
+ADVANCED_FILTERS_HEAVY_COST
+    Cost from which filters are heavy (default None, none are).
+ADVANCED_FILTERS_HEAVY_CONCURRENCY
+    Number of heavy filters a user may run at once (default None,
+    unlimited).
+ADVANCED_FILTERS_ADMISSION_CACHE
+    Alias of the Django cache (from ``CACHES``) counting running heavy
+    filters (default "default").
+ADVANCED_FILTERS_HEAVY_SLOT_TIMEOUT
+    Seconds after which a running heavy filter no longer counts, should it
+    never be released (default 300).
+"""
+from contextlib import contextmanager
+import logging
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.translation import gettext as _
+
+from .index_advisor import (SEARCH, TRIGRAM, UPPER_TRIGRAM, existing_indexes,
+                            resolve_rule)
+from .query_analysis import (explain_plan, get_multivalued_hops, iter_lookups,
+                             resolve_lookup)
+
+logger = logging.getLogger('advanced_filters.admission')
+
+REJECT = 'reject'
+MATERIALIZE = 'materialize'
+DEFAULT_SLOT_TIMEOUT = 300
+CACHE_KEY_PREFIX = 'advanced_filters:heavy'
+
+# weights of the components of the static cost of a filter
+JOIN_COST = 1
+MULTIVALUED_HOP_COST = 3
+UNINDEXED_SCAN_COST = 5
+
+
+class FilterCost(NamedTuple):
+    """Estimated cost of a filter query"""
+    joins: int
+    multivalued_hops: int
+    unindexed_scans: int
+    planner_cost: float = None
+
+    @property
+    def score(self):
+        return (self.joins * JOIN_COST +
+                self.multivalued_hops * MULTIVALUED_HOP_COST +
+                self.unindexed_scans * UNINDEXED_SCAN_COST)
+
+    def get_excesses(self):
+        """Descriptions of the limits exceeded by the filter (if any)"""
+        excesses = []
+        max_cost = getattr(settings, 'ADVANCED_FILTERS_MAX_COST', None)
+        if max_cost is not None and self.score > max_cost:
+            excesses.append(_(
+                'its cost of %(score)d (%(joins)d joins, %(hops)d multi-valued '
+                'relations, %(scans)d unindexed text searches) exceeds '
+                '%(max)d') % {
+                    'score': self.score, 'joins': self.joins,
+                    'hops': self.multivalued_hops,
+                    'scans': self.unindexed_scans, 'max': max_cost})
+        max_planner_cost = getattr(
+            settings, 'ADVANCED_FILTERS_MAX_PLANNER_COST', None)
+        if (max_planner_cost is not None and self.planner_cost is not None and
+                self.planner_cost > max_planner_cost):
+            excesses.append(_(
+                'its planner cost of %(cost).0f exceeds %(max).0f') % {
+                    'cost': self.planner_cost, 'max': max_planner_cost})
+        return excesses
+
+    @property
+    def too_expensive(self):
+        return bool(self.get_excesses())
+
+    @property
+    def heavy(self):
+        heavy_cost = getattr(settings, 'ADVANCED_FILTERS_HEAVY_COST', None)
+        return ((heavy_cost is not None and self.score >= heavy_cost) or
+                self.too_expensive)
+
+
+def count_joins(model, query):
+    """The number of distinct relations traversed by the rules of query"""
+    paths = set()
+    for lookup, _value in iter_lookups(query):
+        fields, _rest = resolve_lookup(model, lookup)
+        # a relation compared as is (i.e: "assigned_to") needs no join
+        for i, field in enumerate(fields[:-1]):
+            if field.is_relation:
+                paths.add(LOOKUP_SEP.join(f.name for f in fields[:i + 1]))
+    return len(paths)
+
+
+def count_unindexed_scans(model, query):
+    """The number of text search rules of query no index can serve"""
+    scans = 0
+    for lookup, value in iter_lookups(query):
+        resolved = resolve_rule(model, lookup, value)
+        if resolved is None or resolved[1] not in SEARCH:
+            continue
+        field, name = resolved
+        if connections[model._default_manager.db].vendor == 'postgresql':
+            kind = UPPER_TRIGRAM if name == 'icontains' else TRIGRAM
+            if (kind, field.name) in existing_indexes(field.model):
+                continue
+        scans += 1
+    return scans
+
+
+def get_planner_cost(queryset):
+    """The planner's total cost of queryset, or None if not supported"""
+    plan = explain_plan(queryset)
+    return None if plan is None else float(plan['Total Cost'])
+
+
+def estimate_cost(model, query, queryset=None):
+    """
+    Estimate the cost of filtering model by query, also asking the planner
+    if given the (filtered) queryset and a planner cost limit is set
+    """
+    planner_cost = None
+    if (queryset is not None and
+            getattr(settings, 'ADVANCED_FILTERS_MAX_PLANNER_COST', None)
+            is not None):
+        planner_cost = get_planner_cost(queryset)
+    return FilterCost(
+        joins=count_joins(model, query),
+        multivalued_hops=len(get_multivalued_hops(model, query)),
+        unindexed_scans=count_unindexed_scans(model, query),
+        planner_cost=planner_cost)
+
+
+def get_policy():
+    return getattr(settings, 'ADVANCED_FILTERS_HEAVY_FILTERS', REJECT)
+
+
+class HeavyFilterSlots:
+    """Counters of the heavy filters each user is running"""
+    @property
+    def limit(self):
+        return getattr(settings, 'ADVANCED_FILTERS_HEAVY_CONCURRENCY', None)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'ADVANCED_FILTERS_ADMISSION_CACHE',
+                              'default')]
+
+    def get_key(self, user):
+        return '{prefix}:{user}'.format(prefix=CACHE_KEY_PREFIX, user=user.pk)
+
+    def acquire(self, user):
+        """Take a slot of user, return whether one was available"""
+        if self.limit is None:
+            return True
+        key = self.get_key(user)
+        timeout = getattr(settings, 'ADVANCED_FILTERS_HEAVY_SLOT_TIMEOUT',
+                          DEFAULT_SLOT_TIMEOUT)
+        self.cache.add(key, 0, timeout)
+        try:
+            running = self.cache.incr(key)
+        except ValueError:
+            # expired in the meantime
+            self.cache.add(key, 1, timeout)
+            running = 1
+        if running > self.limit:
+            self.release(user)
+            return False
+        return True
+
+    def release(self, user):
+        if self.limit is None:
+            return
+        try:
+            self.cache.decr(self.get_key(user))
+        except ValueError:
+            pass  # expired
+
+    def acquire_for(self, request):
+        """Take a slot of the user of request, counted on the request"""
+        if not self.acquire(request.user):
+            return False
+        request._advanced_filters_slots = self.taken_by(request) + 1
+        return True
+
+    @staticmethod
+    def taken_by(request):
+        return getattr(request, '_advanced_filters_slots', 0)
+
+    @contextmanager
+    def releasing(self, request):
+        """Release the slots taken by request within the block on exit"""
+        taken = self.taken_by(request)
+        try:
+            yield
+        finally:
+            for _i in range(self.taken_by(request) - taken):
+                self.release(request.user)
+            request._advanced_filters_slots = taken
+
+
+heavy_filter_slots = HeavyFilterSlots()
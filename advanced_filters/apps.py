@@ -0,0 +1,83 @@
+import logging
+
+from django.apps import AppConfig
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.test.signals import setting_changed
+
+logger = logging.getLogger('advanced_filters.apps')
+
+
+class AdvancedFiltersConfig(AppConfig):
+    name = 'advanced_filters'
+    default_auto_field = 'django.db.models.AutoField'
+
+    def ready(self):
+        from django.contrib.auth.models import Group
+
+        from .choices_cache import invalidate_model_choices
+        from .field_index import clear_field_indexes
+        from .lookups import CASE_FOLDED_FIELDS, CaseInsensitiveIn
+        from .models import AdvancedFilter
+        from .query_cache import invalidate_cached_query, query_cache
+        from .sidebar_cache import invalidate_sidebar
+        from .sql_cache import clear_schema_version, invalidate_cached_sql
+
+        # only the fields compared case insensitively, not every field of
+        # the project
+        for field_class in CASE_FOLDED_FIELDS:
+            field_class.register_lookup(CaseInsensitiveIn)
+
+        post_save.connect(
+            invalidate_cached_query, sender=AdvancedFilter,
+            dispatch_uid='advanced_filters_invalidate_query_on_save')
+        post_delete.connect(
+            invalidate_cached_query, sender=AdvancedFilter,
+            dispatch_uid='advanced_filters_invalidate_query_on_delete')
+        post_save.connect(
+            invalidate_cached_sql, sender=AdvancedFilter,
+            dispatch_uid='advanced_filters_invalidate_sql_on_save')
+        post_delete.connect(
+            invalidate_cached_sql, sender=AdvancedFilter,
+            dispatch_uid='advanced_filters_invalidate_sql_on_delete')
+        # choices of any model may be cached, the receiver is a no-op unless
+        # the choices cache is enabled
+        post_save.connect(
+            invalidate_model_choices,
+            dispatch_uid='advanced_filters_invalidate_choices_on_save')
+        post_delete.connect(
+            invalidate_model_choices,
+            dispatch_uid='advanced_filters_invalidate_choices_on_delete')
+        # filters listed to users change along with filters, who they're
+        # shared with and the groups of users
+        post_save.connect(
+            invalidate_sidebar, sender=AdvancedFilter,
+            dispatch_uid='advanced_filters_invalidate_sidebar_on_save')
+        post_delete.connect(
+            invalidate_sidebar, sender=AdvancedFilter,
+            dispatch_uid='advanced_filters_invalidate_sidebar_on_delete')
+        post_delete.connect(
+            invalidate_sidebar, sender=Group,
+            dispatch_uid='advanced_filters_invalidate_sidebar_on_group_delete')
+        for through in (AdvancedFilter.users.through,
+                        AdvancedFilter.groups.through,
+                        get_user_model().groups.through):
+            m2m_changed.connect(
+                invalidate_sidebar, sender=through,
+                dispatch_uid='advanced_filters_invalidate_sidebar_on_%s' %
+                through._meta.label_lower)
+        setting_changed.connect(
+            clear_field_indexes,
+            dispatch_uid='advanced_filters_clear_field_indexes')
+        setting_changed.connect(
+            clear_schema_version,
+            dispatch_uid='advanced_filters_clear_schema_version')
+
+        if getattr(settings, 'ADVANCED_FILTERS_QUERY_CACHE_WARMUP', False):
+            try:
+                query_cache.warm()
+            except DatabaseError as e:
+                # i.e: tables not created yet, before running migrations
+                logger.warning('Skipped warming up the query cache: %s', e)
@@ -0,0 +1,153 @@
+"""
+Shared cache of the distinct values GetFieldChoices looks up for a field.
+
+Entries are keyed by the label of the model holding the field, the field
+name, and a per model version which is replaced whenever an instance of that
+model is saved or deleted (see ``apps.AdvancedFiltersConfig.ready``). A cold
+entry is computed by a single request at a time, others wait for its result.
+Each entry is stored along with a digest of its result, its ETag, which thus
+changes whenever a recomputed entry differs, i.e: after changes sending no
+signals (``QuerySet.update()``) once the previous entry expired.
+
+Settings:
+
+ADVANCED_FILTERS_CHOICES_CACHE
+    Alias of a Django cache (from ``CACHES``) to enable the cache with
+    (default None, disabled).
+ADVANCED_FILTERS_CHOICES_CACHE_TIMEOUT
+    Timeout of entries in seconds (default 300), or a dict mapping
+    "app_label.Model.field" or "app_label.Model" to a timeout, along with an
+    optional "default" key.
+ADVANCED_FILTERS_CHOICES_CACHE_LOCK_TIMEOUT
+    Maximum time in seconds a request waits for another one to compute an
+    entry, before computing it itself (default 10).
+"""
+import hashlib
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('advanced_filters.choices_cache')
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+CACHE_KEY_PREFIX = 'advanced_filters:choices'
+
+
+def get_field_setting(name, model, field, default):
+    """
+    Return the value of a setting which is either a single value, or a dict
+    mapping "app_label.Model.field", "app_label.Model" or "default" to one.
+    """
+    value = getattr(settings, name, default)
+    if not isinstance(value, dict):
+        return value
+    label = model._meta.label
+    for key in (f'{label}.{field.name}', label, 'default'):
+        if key in value:
+            return value[key]
+    return default
+
+
+class ChoicesCache:
+    @property
+    def enabled(self):
+        return bool(getattr(settings, 'ADVANCED_FILTERS_CHOICES_CACHE', None))
+
+    @property
+    def cache(self):
+        return caches[settings.ADVANCED_FILTERS_CHOICES_CACHE]
+
+    @staticmethod
+    def _version_key(model):
+        return f'{CACHE_KEY_PREFIX}:version:{model._meta.label}'
+
+    def get_version(self, model):
+        version = self.cache.get(self._version_key(model))
+        if version is None:
+            version = uuid.uuid4().hex
+            # another request may have set a version in the meantime
+            if not self.cache.add(self._version_key(model), version, None):
+                version = self.cache.get(self._version_key(model), version)
+        return version
+
+    def bump(self, model):
+        """Invalidate all the cached entries of model (and its parents)"""
+        for klass in [model] + model._meta.get_parent_list():
+            self.cache.set(self._version_key(klass), uuid.uuid4().hex, None)
+
+    @staticmethod
+    def get_timeout(model, field):
+        return get_field_setting('ADVANCED_FILTERS_CHOICES_CACHE_TIMEOUT',
+                                 model, field, DEFAULT_TIMEOUT)
+
+    def get_key(self, model, field, variant):
+        return '{prefix}:{label}:{field}:{variant}:{version}'.format(
+            prefix=CACHE_KEY_PREFIX, label=model._meta.label,
+            field=field.name, variant=variant, version=self.get_version(model))
+
+    @staticmethod
+    def get_digest(result):
+        return hashlib.md5(repr(result).encode('utf-8')).hexdigest()
+
+    def get_etag(self, model, field, variant):
+        """
+        A strong ETag of the result of a cached entry, or None if there is no
+        such entry (yet)
+        """
+        entry = self.cache.get(self.get_key(model, field, variant))
+        if entry is None:
+            return None
+        return '"%s"' % entry[1]
+
+    def get_or_set(self, model, field, variant, compute):
+        """
+        Return the cached result of compute() for field of model (variant
+        differentiates results of the same field, i.e: a maximum size), only
+        letting a single caller compute a missing entry at a time.
+        """
+        if not self.enabled:
+            return compute()
+
+        key = self.get_key(model, field, variant)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry[0]
+
+        lock_key = f'{key}:lock'
+        lock_timeout = getattr(
+            settings, 'ADVANCED_FILTERS_CHOICES_CACHE_LOCK_TIMEOUT',
+            DEFAULT_LOCK_TIMEOUT)
+        locked = self.cache.add(lock_key, 1, lock_timeout)
+        if not locked:
+            # wait for the request holding the lock to compute the entry
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry = self.cache.get(key)
+                if entry is not None:
+                    return entry[0]
+                if self.cache.get(lock_key) is None:
+                    break
+            logger.debug('Gave up waiting for choices of %s', key)
+        try:
+            result = compute()
+            self.cache.set(key, (result, self.get_digest(result)),
+                           self.get_timeout(model, field))
+        finally:
+            if locked:
+                self.cache.delete(lock_key)
+        return result
+
+
+choices_cache = ChoicesCache()
+
+
+def invalidate_model_choices(sender, **kwargs):
+    """post_save/post_delete receiver invalidating choices of a model"""
+    if choices_cache.enabled and not sender._meta.abstract:
+        choices_cache.bump(sender)
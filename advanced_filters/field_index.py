@@ -0,0 +1,64 @@
+"""
+Precomputed index of the fields a model may be filtered by.
+
+Resolving the ``advanced_filter_fields`` of a ModelAdmin to model fields and
+sorting the choices built from them used to happen for every query form of
+every request. An index is built once per form class, model, fields and
+language instead, and shared (it is immutable) by all the query forms of all
+formsets.
+
+Indexes live as long as the process does, which the development server
+restarts on code changes, and are dropped whenever settings change.
+"""
+import threading
+from types import MappingProxyType
+from typing import NamedTuple
+
+from django.utils.text import capfirst
+from django.utils.translation import get_language
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+class FieldIndex(NamedTuple):
+    """
+    Fields (path -> verbose name) of a model available for filtering, the
+    (sorted) choices of the "field" select, and the set of its valid values.
+    """
+    fields: MappingProxyType
+    choices: tuple
+    valid_values: frozenset
+
+    @classmethod
+    def build(cls, fields, extra_choices=()):
+        """Index fields, a dict of field paths to verbose names"""
+        choices = tuple(sorted(
+            ((fquery, capfirst(fname)) for fquery, fname in fields.items()),
+            key=lambda f: f[1].lower())) + tuple(extra_choices)
+        return cls(fields=MappingProxyType(dict(fields)), choices=choices,
+                   valid_values=frozenset(str(c[0]) for c in choices))
+
+
+def get_field_index(owner, model, fields, build):
+    """
+    Return the index of fields of model (in the active language), calling
+    build() only if it wasn't built yet for owner (i.e: the form class).
+    """
+    key = (owner, model, tuple(fields), get_language())
+    try:
+        return _indexes[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable fields (i.e: lists), not worth indexing
+        return build()
+    index = build()
+    with _lock:
+        return _indexes.setdefault(key, index)
+
+
+def clear_field_indexes(**kwargs):
+    """Drop all indexes, also a setting_changed receiver"""
+    with _lock:
+        _indexes.clear()
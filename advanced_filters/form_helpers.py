@@ -10,32 +10,56 @@ extra_spaces_pattern = re.compile(r'\s+')
 
 class VaryingTypeCharField(forms.CharField):
     """
-    This CharField subclass returns a regex OR patterns from a
-    comma separated list value.
+    This CharField subclass is able to split a comma separated value into a
+    list of values (i.e: for the "One of" operator).
     """
     _default_separator = ","
 
     def to_python(self, value):
         """
-        Split a string value by separator (default to ",") into a
-        list; then, returns a regex pattern string that ORs the values
-        in the resulting list.
-
         >>> field = VaryingTypeCharField()
         >>> assert field.to_python('') == ''
-        >>> assert field.to_python('test') == 'test'
-        >>> assert field.to_python('and,me') == '(and|me)'
-        >>> assert field.to_python('and,me;too') == '(and|me;too)'
-        """
-        res = super().to_python(value)
-        split_res = res.split(self._default_separator)
-        if not res or len(split_res) < 2:
-            return res.strip()
-
-        # create a regex string out of the list of choices passed, i.e: (a|b)
-        res = r"({pattern})".format(pattern="|".join(
-            map(lambda x: x.strip(), split_res)))
-        return res
+        >>> assert field.to_python(' test ') == 'test'
+        >>> assert field.to_python('and,me') == 'and,me'
+        """
+        return super().to_python(value).strip()
+
+    def split(self, value):
+        """
+        Split a string value by separator (default to ",") into a list of
+        non empty values.
+
+        >>> field = VaryingTypeCharField()
+        >>> assert field.split('test') == ['test']
+        >>> assert field.split('and, me') == ['and', 'me']
+        >>> assert field.split('and,me;too,') == ['and', 'me;too']
+        """
+        return [v.strip() for v in value.split(self._default_separator)
+                if v.strip()]
+
+    def join(self, values):
+        """
+        >>> assert VaryingTypeCharField().join(['and', 'me']) == 'and,me'
+        """
+        return self._default_separator.join(map(str, values))
+
+
+class IndexedChoiceField(forms.ChoiceField):
+    """
+    A ChoiceField which may be given a set of its valid values along with its
+    choices (both shared, and thus never copied, between instances), making
+    validation a constant time lookup.
+    """
+    valid_values = None
+
+    def set_indexed_choices(self, choices, valid_values):
+        self._choices = self.widget.choices = choices
+        self.valid_values = valid_values
+
+    def valid_value(self, value):
+        if self.valid_values is None:
+            return super().valid_value(value)
+        return str(value) in self.valid_values
 
 
 class CleanWhiteSpacesMixin:
@@ -10,16 +10,20 @@ from django.apps import apps
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin.utils import get_fields_from_path
-from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.db.models import Q
 from django.db.models.fields import DateField
 from django.forms.formsets import formset_factory, BaseFormSet
 from functools import reduce
-from django.utils.text import capfirst
 from django.utils.translation import gettext_lazy as _
 
+from .admission import MATERIALIZE, estimate_cost, get_policy
 from .models import AdvancedFilter
-from .form_helpers import CleanWhiteSpacesMixin,  VaryingTypeCharField
+from .field_index import FieldIndex, get_field_index
+from .form_helpers import (
+    CleanWhiteSpacesMixin, IndexedChoiceField, VaryingTypeCharField)
+from .lookups import ONE_OF_LOOKUP, parse_one_of_regex
+from .query_compiler import filter_queryset
 
 
 logger = logging.getLogger('advanced_filters.forms')
@@ -56,7 +60,7 @@ class AdvancedFilterQueryForm(CleanWhiteSpacesMixin, forms.Form):
         ("_OR", _("Or (mark an or between blocks)")),
     )
 
-    field = forms.ChoiceField(required=True, widget=forms.Select(
+    field = IndexedChoiceField(required=True, widget=forms.Select(
         attrs={'class': 'query-field'}), label=_('Field'))
     operator = forms.ChoiceField(
         label=_('Operator'),
@@ -74,10 +78,7 @@ class AdvancedFilterQueryForm(CleanWhiteSpacesMixin, forms.Form):
         """
         Iterate over passed model fields tuple and update initial choices.
         """
-        return tuple(sorted(
-            ((fquery, capfirst(fname)) for fquery, fname in fields.items()),
-            key=lambda f: f[1].lower())
-        ) + self.FIELD_CHOICES
+        return FieldIndex.build(fields, self.FIELD_CHOICES).choices
 
     def _build_query_dict(self, formdata=None):
         """
@@ -93,6 +94,13 @@ class AdvancedFilterQueryForm(CleanWhiteSpacesMixin, forms.Form):
             return {formdata['field']: True}
         elif formdata['operator'] == "isfalse":
             return {formdata['field']: False}
+        elif formdata['operator'] == "iregex":
+            if self.keeps_regex(formdata):
+                return {key: formdata['value']}
+            # "One of" is stored as a list of values
+            values = self.fields['value'].split(formdata['value'])
+            return {"{field}__{lookup}".format(
+                field=formdata['field'], lookup=ONE_OF_LOOKUP): values}
         return {key: formdata['value']}
 
     @staticmethod
@@ -112,9 +120,25 @@ class AdvancedFilterQueryForm(CleanWhiteSpacesMixin, forms.Form):
             if parts[-1] in dict(AdvancedFilterQueryForm.OPERATORS).keys():
                 field = '__'.join(parts[:-1])
                 operator = parts[-1]
+            elif parts[-1] == ONE_OF_LOOKUP:
+                field = '__'.join(parts[:-1])
+                operator = 'iregex'
             else:
                 field = query_data['field']
 
+        if operator == 'iregex':
+            # show "One of" values (or a regex matching the same objects as
+            # them) comma separated
+            values = query_data['value']
+            if not isinstance(values, list):
+                values = parse_one_of_regex(values, exact=True)
+            if values is not None:
+                query_data['value'] = VaryingTypeCharField().join(values)
+            else:
+                # a regex saved by older versions, searching the values: it
+                # is shown and saved as is, unless changed (see keeps_regex)
+                query_data['regex'] = query_data['value']
+
         query_data['field'] = field
         mfield = get_fields_from_path(model, query_data['field'])
         if not mfield:
@@ -156,12 +180,50 @@ class AdvancedFilterQueryForm(CleanWhiteSpacesMixin, forms.Form):
             raise forms.ValidationError([])
         data['value'] = (dtfrom, dtto)
 
+    def get_model_field(self, path):
+        """The model field compared by a rule on path, or None"""
+        if self.model is None or path == '_OR':
+            return None
+        try:
+            field = get_fields_from_path(self.model, path)[-1]
+        except (FieldDoesNotExist, IndexError):
+            return None
+        if field.is_relation and (field.many_to_many or not field.concrete):
+            # i.e: "groups" compares the related primary key
+            field = field.related_model._meta.pk
+        return field
+
+    def keeps_regex(self, formdata):
+        """
+        Whether formdata is the unchanged "One of" rule of a regex saved by
+        older versions, which is saved as is (rather than as values, matched
+        exactly) so that it keeps matching the same objects
+        """
+        regex = self.initial.get('regex')
+        return (regex is not None and formdata.get('value') == regex and
+                formdata.get('field') == self.initial.get('field'))
+
+    def validate_one_of(self, cleaned_data):
+        """Validate each "One of" value as a value of the compared field"""
+        field = self.get_model_field(cleaned_data.get('field'))
+        if field is None or not cleaned_data.get('value'):
+            return
+        for value in self.fields['value'].split(cleaned_data['value']):
+            try:
+                field.to_python(value)
+            except ValidationError as e:
+                self.add_error('value', e)
+                return
+
     def clean(self):
         cleaned_data = super().clean()
         if cleaned_data.get('operator') == "range":
             if ('value_from' in cleaned_data and
                     'value_to' in cleaned_data):
                 self.set_range_value(cleaned_data)
+        elif (cleaned_data.get('operator') == "iregex" and
+                not self.keeps_regex(cleaned_data)):
+            self.validate_one_of(cleaned_data)
         return cleaned_data
 
     def make_query(self, *args, **kwargs):
@@ -174,10 +236,19 @@ class AdvancedFilterQueryForm(CleanWhiteSpacesMixin, forms.Form):
             query = query & Q(**query_dict)
         return query
 
-    def __init__(self, model_fields={}, *args, **kwargs):
+    def __init__(self, model_fields={}, *args, model=None, **kwargs):
+        """
+        model_fields is either a dict of field paths to verbose names, or a
+        (shared) FieldIndex of them, of model (if given, values are validated
+        as values of the fields).
+        """
+        self.model = model
         super().__init__(*args, **kwargs)
-        self.FIELD_CHOICES = self._build_field_choices(model_fields)
-        self.fields['field'].choices = self.FIELD_CHOICES
+        if not isinstance(model_fields, FieldIndex):
+            model_fields = FieldIndex.build(model_fields, self.FIELD_CHOICES)
+        self.FIELD_CHOICES = model_fields.choices
+        self.fields['field'].set_indexed_choices(
+            model_fields.choices, model_fields.valid_values)
         if not self.fields['field'].initial:
             self.fields['field'].initial = self.FIELD_CHOICES[0]
 
@@ -189,6 +260,7 @@ class AdvancedFilterFormSet(BaseFormSet):
 
     def __init__(self, *args, **kwargs):
         self.model_fields = kwargs.pop('model_fields', {})
+        self.model = kwargs.pop('model', None)
         super().__init__(*args, **kwargs)
         if self.forms:
             form = self.forms[0]
@@ -197,6 +269,7 @@ class AdvancedFilterFormSet(BaseFormSet):
     def get_form_kwargs(self, index):
         kwargs = super().get_form_kwargs(index)
         kwargs['model_fields'] = self.model_fields
+        kwargs['model'] = self.model
         return kwargs
 
 
@@ -297,8 +370,30 @@ class AdvancedFilterForm(CleanWhiteSpacesMixin, forms.ModelForm):
             raise forms.ValidationError("Error validating filter forms")
         cleaned_data['model'] = "{}.{}".format(self._model._meta.app_label,
                                                self._model._meta.object_name)
+        self.admit_query(cleaned_data)
         return cleaned_data
 
+    def admit_query(self, cleaned_data):
+        """
+        Reject a filter too expensive to run, or materialize it instead (see
+        the admission module)
+        """
+        query = self.generate_query()
+        cost = estimate_cost(self._model, query, filter_queryset(
+            self._model._default_manager.all(), query))
+        excesses = cost.get_excesses()
+        if not excesses:
+            return
+        if get_policy() == MATERIALIZE:
+            # filtered by a snapshot taken in the background instead
+            self.instance.materialize = True
+            if 'materialize' in self.fields:
+                cleaned_data['materialize'] = True
+            return
+        raise forms.ValidationError(
+            _('This filter is too expensive to run: %s.') %
+            '; '.join(excesses), code='too_expensive')
+
     @property
     def _non_deleted_forms(self):
         forms = []
@@ -326,9 +421,20 @@ class AdvancedFilterForm(CleanWhiteSpacesMixin, forms.ModelForm):
             query = reduce(operator.or_, ORed)
         return query
 
+    def get_field_index(self, model):
+        """
+        Return the (shared) FieldIndex of the filter fields of model, only
+        resolved by get_fields_from_model once per form class and language.
+        """
+        return get_field_index(
+            type(self), model, self._filter_fields,
+            lambda: FieldIndex.build(
+                self.get_fields_from_model(model, self._filter_fields),
+                AdvancedFilterQueryForm.FIELD_CHOICES))
+
     def initialize_form(self, instance, model, data=None, extra=None):
         """ Takes a "finalized" query and generate it's form data """
-        model_fields = self.get_fields_from_model(model, self._filter_fields)
+        model_fields = self.get_field_index(model)
 
         forms = []
         if instance:
@@ -341,7 +447,8 @@ class AdvancedFilterForm(CleanWhiteSpacesMixin, forms.ModelForm):
         self.fields_formset = formset(
             data=data,
             initial=forms or None,
-            model_fields=model_fields
+            model_fields=model_fields,
+            model=model,
         )
 
     def save(self, commit=True):
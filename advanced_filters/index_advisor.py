@@ -0,0 +1,329 @@
+"""
+Index advisor, proposing database indexes which would serve saved filters.
+
+The rules of all saved filters are aggregated by the column they compare and
+their lookup, each weighted by the usage of its filter (1 per filter unless
+given weights). Columns lacking an index their lookups can use are proposed
+one, according to the database of their model:
+
+- Equality (including "Is TRUE/FALSE", ``isnull`` and "One of" on columns
+  compared as is) and range comparisons: an index of the column.
+- ``iexact`` and "One of" (``iin``) on text columns: an index of
+  ``Upper(column)``, the expression these lookups compare, but on MySQL,
+  whose collations are case insensitive (a plain index is used), and
+  ``iexact`` on SQLite, where it's a ``LIKE`` comparison no index serves.
+- ``icontains``/``contains`` and regular expressions: a trigram GIN index on
+  PostgreSQL (requiring the ``pg_trgm`` extension). Other databases scan the
+  table, which is only reported.
+- Columns of a model compared for equality by rules ANDed together: a
+  composite index of both columns.
+
+Indexes of expressions (``Upper()``, trigrams) require Django 3.2, they are
+only reported on older versions.
+
+See the ``advise_advanced_filter_indexes`` management command.
+"""
+from collections import Counter, defaultdict
+from itertools import combinations
+import hashlib
+import logging
+
+import django
+from django.db import connections, models, router
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from .lookups import ONE_OF_LOOKUP, is_case_folded, parse_one_of_regex
+from .query_analysis import resolve_lookup
+
+logger = logging.getLogger('advanced_filters.index_advisor')
+
+EQUALITY = {'exact', 'in', 'isnull'}
+RANGE = {'lt', 'lte', 'gt', 'gte', 'range'}
+CASE_INSENSITIVE = {'iexact', ONE_OF_LOOKUP}
+SEARCH = {'contains', 'icontains', 'regex', 'iregex'}
+
+# kinds of indexes
+COLUMN = 'column'
+UPPER = 'upper'
+TRIGRAM = 'trigram'
+UPPER_TRIGRAM = 'upper_trigram'
+COMPOSITE = 'composite'
+
+EXPRESSION_INDEXES = django.VERSION >= (3, 2)
+
+
+class Proposal:
+    """An index proposed for columns (field names) of model"""
+    def __init__(self, model, kind, columns, weight, lookups, note=''):
+        self.model = model
+        self.kind = kind
+        self.columns = tuple(columns)
+        self.weight = weight
+        self.lookups = lookups
+        self.note = note
+
+    @property
+    def name(self):
+        """An index name in Django's format (at most 30 characters)"""
+        digest = hashlib.md5('{}:{}:{}'.format(
+            self.model._meta.db_table, self.kind, ','.join(self.columns)
+        ).encode('utf-8')).hexdigest()[:6]
+        return '%s_%s_%s' % (self.model._meta.db_table[:12],
+                             '_'.join(self.columns)[:8], 'af' + digest)
+
+    @property
+    def index(self):
+        """The models.Index to add, or None if no index would help"""
+        if self.kind == COLUMN:
+            return models.Index(fields=list(self.columns), name=self.name)
+        if self.kind == COMPOSITE:
+            return models.Index(fields=list(self.columns), name=self.name)
+        if self.kind == UPPER:
+            return models.Index(Upper(self.columns[0]), name=self.name)
+        if self.kind in (TRIGRAM, UPPER_TRIGRAM):
+            from django.contrib.postgres.indexes import GinIndex, OpClass
+            expression = self.columns[0]
+            if self.kind == UPPER_TRIGRAM:
+                expression = Upper(expression)
+            return GinIndex(OpClass(expression, name='gin_trgm_ops'),
+                            name=self.name)
+        return None
+
+    def as_dict(self):
+        index = self.index
+        return {
+            'model': self.model._meta.label,
+            'kind': self.kind,
+            'columns': list(self.columns),
+            'weight': self.weight,
+            'lookups': dict(self.lookups),
+            'index': index and repr(index),
+            'note': self.note,
+        }
+
+    def __repr__(self):
+        return '<Proposal %s %s(%s) weight=%s>' % (
+            self.model._meta.label, self.kind, ', '.join(self.columns),
+            self.weight)
+
+
+def resolve_rule(model, lookup, value):
+    """
+    Return the model field compared by a rule, along with its lookup name
+    (as compiled, i.e: legacy "One of" regexes as iin), or None.
+    """
+    fields, rest = resolve_lookup(model, lookup)
+    if not fields or len(rest) > 1 or not isinstance(lookup, str):
+        return None  # unknown fields, or transforms
+    field = fields[-1]
+    if not field.concrete or field.many_to_many:
+        if not field.is_relation:
+            return None
+        # i.e: "groups" or "client" compare the related primary key
+        field = field.related_model._meta.pk
+    name = rest[0] if rest else 'exact'
+    if name == 'iregex' and parse_one_of_regex(value, exact=True) is not None:
+        name = ONE_OF_LOOKUP
+    if name == ONE_OF_LOOKUP and not is_case_folded(field):
+        name = 'in'
+    if value is None:
+        name = 'isnull'
+    return field, name
+
+
+def _iter_nodes(query):
+    """Yield all the Q nodes of a (nested) query"""
+    yield query
+    for child in query.children:
+        if isinstance(child, Q):
+            yield from _iter_nodes(child)
+
+
+def existing_indexes(model):
+    """
+    Return the set of indexed columns (1-tuples of the first column of an
+    index, n-tuples of the columns of composite indexes), and expressions
+    (("upper", column), ("trigram", column), ("upper_trigram", column)).
+    """
+    indexed = set()
+    opts = model._meta
+    for field in opts.concrete_fields:
+        if field.db_index or field.unique or field.primary_key:
+            indexed.add((field.name,))
+
+    def add_columns(names):
+        names = [name.lstrip('-') for name in names]
+        for i in range(1, len(names) + 1):
+            indexed.add(tuple(names[:i]))
+
+    for names in list(opts.unique_together) + list(
+            getattr(opts, 'index_together', ())):
+        add_columns(names)
+    for index in list(opts.indexes) + list(opts.constraints):
+        if getattr(index, 'fields', None):
+            add_columns(index.fields)
+        for expression in getattr(index, 'expressions', ()):
+            indexed.add(_expression_key(expression))
+    return indexed
+
+
+def _expression_key(expression):
+    """Normalize an index expression into a key of existing_indexes()"""
+    kind = None
+    if getattr(expression, 'name', None) == 'gin_trgm_ops':
+        # an OpClass() of the indexed expression
+        kind, expression = TRIGRAM, expression.get_source_expressions()[0]
+    if isinstance(expression, Upper):
+        kind = UPPER_TRIGRAM if kind == TRIGRAM else UPPER
+        expression = expression.get_source_expressions()[0]
+    column = getattr(expression, 'name', None)
+    if column is None:
+        return (None, None)
+    return (kind, column) if kind else (column,)
+
+
+def _vendor(model):
+    return connections[router.db_for_read(model)].vendor
+
+
+def _single_column_proposal(model, field, lookups, weight, indexed):
+    """Return the proposal of an index of field serving lookups, or None"""
+    vendor = _vendor(model)
+    column = (field.name,)
+    if set(lookups) & (EQUALITY | RANGE):
+        if column not in indexed:
+            return Proposal(model, COLUMN, column, weight, lookups)
+    if set(lookups) & CASE_INSENSITIVE:
+        if vendor == 'mysql':
+            if column not in indexed:
+                return Proposal(model, COLUMN, column, weight, lookups)
+        elif vendor == 'sqlite' and ONE_OF_LOOKUP not in lookups:
+            return Proposal(model, None, column, weight, lookups, note=(
+                'iexact is a LIKE comparison on SQLite, no index is used'))
+        elif is_case_folded(field) and (UPPER, field.name) not in indexed:
+            if not EXPRESSION_INDEXES:
+                return Proposal(model, None, column, weight, lookups, note=(
+                    'an index of UPPER(column) requires Django 3.2'))
+            return Proposal(model, UPPER, column, weight, lookups)
+    if set(lookups) & SEARCH:
+        kind = UPPER_TRIGRAM if 'icontains' in lookups else TRIGRAM
+        if vendor != 'postgresql':
+            return Proposal(model, None, column, weight, lookups, note=(
+                'contains/regex comparisons scan the table, no index helps '
+                'on this database'))
+        if (kind, field.name) not in indexed:
+            if not EXPRESSION_INDEXES:
+                return Proposal(model, None, column, weight, lookups, note=(
+                    'a trigram index requires Django 3.2'))
+            return Proposal(model, kind, column, weight, lookups, note=(
+                'requires the pg_trgm extension'))
+    return None
+
+
+def advise(filters, weights=None, min_weight=1):
+    """
+    Return the list of index proposals (most weighted first) for saved
+    filters, weighted by weights (a dict of filter ids to weights) if given.
+    """
+    columns = defaultdict(Counter)  # (model, field) -> lookups -> weight
+    pairs = Counter()  # (model, name, name) -> weight
+    for afilter in filters:
+        weight = 1 if weights is None else weights.get(afilter.pk, 0)
+        if not weight:
+            continue
+        try:
+            model = afilter.get_model()
+            query = afilter.decode_query()
+        except (LookupError, ValueError) as e:
+            logger.warning('Skipped filter %s: %s', afilter.pk, e)
+            continue
+        if query is None:
+            continue
+        for node in _iter_nodes(query):
+            compared = set()
+            for child in node.children:
+                if not isinstance(child, (tuple, list)):
+                    continue
+                resolved = resolve_rule(model, *child)
+                if resolved is None:
+                    continue
+                field, name = resolved
+                columns[field.model, field][name] += weight
+                if (name in EQUALITY and node.connector == Q.AND and
+                        not node.negated and field.model is model):
+                    # rules on columns of model itself, ANDed together
+                    compared.add(field.name)
+            for pair in combinations(sorted(compared), 2):
+                pairs[(model,) + pair] += weight
+
+    proposals = []
+    indexes = {}
+    for (model, field), lookups in columns.items():
+        weight = sum(lookups.values())
+        if weight < min_weight:
+            continue
+        indexed = indexes.setdefault(model, existing_indexes(model))
+        proposal = _single_column_proposal(
+            model, field, lookups, weight, indexed)
+        if proposal is not None:
+            proposals.append(proposal)
+    for (model, first, second), weight in pairs.items():
+        if weight < min_weight:
+            continue
+        # lead with the most compared column, which then serves it alone too
+        counts = {f.name: sum(lookups.values())
+                  for (m, f), lookups in columns.items()
+                  if m is model and f.name in (first, second)}
+        pair = tuple(sorted((first, second), key=lambda n: -counts.get(n, 0)))
+        indexed = indexes.setdefault(model, existing_indexes(model))
+        if pair not in indexed:
+            proposals.append(Proposal(
+                model, COMPOSITE, pair, weight, Counter(exact=weight)))
+    proposals.sort(key=lambda p: (-p.weight, p.model._meta.label, p.columns))
+    return proposals
+
+
+def migrations_for(proposals):
+    """
+    Return a dict of app labels to Migration instances adding the indexes
+    proposed for the models of the app (after its latest migration), raising
+    ValueError if the latest migrations of an app conflict.
+    """
+    from django.db import migrations
+    from django.db.migrations.loader import MigrationLoader
+
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    by_app = defaultdict(list)
+    for proposal in proposals:
+        if proposal.index is not None:
+            by_app[proposal.model._meta.app_label].append(proposal)
+
+    result = {}
+    for app_label, app_proposals in sorted(by_app.items()):
+        leaves = loader.graph.leaf_nodes(app_label)
+        if len(leaves) > 1:
+            raise ValueError(
+                'Conflicting migrations in %s (%s), merge them with '
+                '"manage.py makemigrations --merge" first' % (
+                    app_label, ', '.join(name for _app, name in leaves)))
+        number = 1
+        if leaves:
+            try:
+                number = int(leaves[-1][1].split('_', 1)[0]) + 1
+            except ValueError:
+                pass
+        operations = []
+        if any(p.kind in (TRIGRAM, UPPER_TRIGRAM) for p in app_proposals):
+            from django.contrib.postgres.operations import TrigramExtension
+            operations.append(TrigramExtension())
+        operations.extend(
+            migrations.AddIndex(model_name=p.model._meta.model_name,
+                                index=p.index)
+            for p in app_proposals)
+        migration = migrations.Migration(
+            '%04d_advanced_filters_indexes' % number, app_label)
+        migration.dependencies = list(leaves)
+        migration.operations = operations
+        result[app_label] = migration
+    return result
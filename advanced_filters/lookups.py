@@ -0,0 +1,89 @@
+"""
+Lookups used by stored advanced filter queries.
+
+The "One of" operator is stored as an ``iin`` lookup with a list of values,
+i.e ``Q(email__iin=['a@b.com', 'c@d.com'])``, and compiled to a (case
+insensitive) ``IN`` clause, which unlike the regular expressions it replaces
+is able to use an index. The lookup is only registered on text fields, rules
+on other fields are compiled into plain ``in`` lookups.
+"""
+import re
+
+from django.db import models
+from django.db.models.lookups import In
+
+ONE_OF_LOOKUP = 'iin'
+# the fields which the iin lookup is registered on (see
+# apps.AdvancedFiltersConfig.ready), "One of" rules on other fields are
+# compiled into in lookups (see query_compiler)
+CASE_FOLDED_FIELDS = (models.CharField, models.TextField)
+
+# characters with a special meaning in regular expressions (the dot excluded,
+# since it's common in values and was never escaped by older versions)
+_special_chars = r'\\^$*+?{}\[\]()|'
+# patterns generated for "One of" by older versions, i.e: "(foo|bar)", or
+# anchored ones (as they may have been entered), i.e: "^(foo|bar)$"
+_one_of_regex = re.compile(
+    r'^(\^?)\(([^{0}]*(?:\|[^{0}]*)+)\)(\$?)$'.format(_special_chars))
+
+
+def parse_one_of_regex(pattern, exact=False):
+    """
+    Return the list of values ORed by a regular expression generated for the
+    "One of" operator (by previous versions), or None for any other pattern.
+
+    Given exact, only return them when the pattern matches exactly the same
+    values as an ``iin`` lookup of them, which older patterns don't: they
+    search the values (unanchored), and their dots match any character.
+
+    >>> parse_one_of_regex('(foo|bar.com)')
+    ['foo', 'bar.com']
+    >>> parse_one_of_regex('(foo|bar)', exact=True) is None
+    True
+    >>> parse_one_of_regex('^(foo|bar)$', exact=True)
+    ['foo', 'bar']
+    >>> parse_one_of_regex('^(foo|bar.com)$', exact=True) is None
+    True
+    >>> parse_one_of_regex('foo') is None
+    True
+    """
+    if not isinstance(pattern, str):
+        return None
+    match = _one_of_regex.match(pattern)
+    if not match:
+        return None
+    start, values, end = match.groups()
+    if exact and not (start and end and '.' not in values):
+        return None
+    return values.split('|')
+
+
+def is_case_folded(field):
+    """Whether values of field are compared case insensitively by iin"""
+    return isinstance(field, CASE_FOLDED_FIELDS) and not field.choices
+
+
+class CaseInsensitiveIn(In):
+    """
+    IN lookup comparing text columns case insensitively, i.e:
+    ``UPPER(col) IN (UPPER(%s), ...)``, which can use an index on
+    ``Upper(col)``. Other columns (and MySQL, whose default collations are
+    case insensitive anyway) are compared as is.
+    """
+    lookup_name = ONE_OF_LOOKUP
+
+    def _fold(self, connection):
+        return (connection.vendor != 'mysql' and
+                is_case_folded(getattr(self.lhs, 'output_field', None)))
+
+    def process_lhs(self, compiler, connection, lhs=None):
+        sql, params = super().process_lhs(compiler, connection, lhs)
+        if self._fold(connection):
+            sql = 'UPPER(%s)' % sql
+        return sql, params
+
+    def batch_process_rhs(self, compiler, connection, rhs=None):
+        sqls, params = super().batch_process_rhs(compiler, connection, rhs)
+        if self._fold(connection):
+            sqls = ['UPPER(%s)' % sql for sql in sqls]
+        return sqls, params
@@ -0,0 +1,120 @@
+import json
+import os
+import site
+import sysconfig
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.migrations.writer import MigrationWriter
+
+from advanced_filters.index_advisor import advise, migrations_for
+from advanced_filters.models import AdvancedFilter
+
+
+class Command(BaseCommand):
+    help = ('Propose database indexes serving the lookups of saved advanced '
+            'filters, optionally as migrations')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', help='Only consider filters of this "app_label.Model"')
+        parser.add_argument(
+            '--min-weight', type=int, default=1,
+            help='Only propose indexes used by at least this many filters, '
+                 'or executions of filters when tracked (default: 1)')
+        parser.add_argument(
+            '--format', choices=('text', 'json'), default='text',
+            help='Format of the report (default: text)')
+        parser.add_argument(
+            '--migrations', action='store_true',
+            help='Print migrations adding the proposed indexes')
+        parser.add_argument(
+            '--write', action='store_true',
+            help='Write migrations adding the proposed indexes to the '
+                 'migration modules of their apps (of installed packages '
+                 'only if set in MIGRATION_MODULES, printed otherwise)')
+
+    def get_weights(self, filters):
+        """
+        Weights of filters (by id): their number of executions when tracked
+        (see ADVANCED_FILTERS_STATS), otherwise None to weight each filter 1
+        """
+        if not any(afilter.executions for afilter in filters):
+            return None
+        return {afilter.pk: max(afilter.executions, 1) for afilter in filters}
+
+    def handle(self, *args, **options):
+        filters = AdvancedFilter.objects.order_by('id')
+        if options['model']:
+            filters = filters.filter(model=options['model'])
+        filters = list(filters)
+        proposals = advise(filters, self.get_weights(filters),
+                           options['min_weight'])
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(
+                [proposal.as_dict() for proposal in proposals], indent=2))
+        else:
+            self.write_text(proposals)
+
+        if options['migrations'] or options['write']:
+            try:
+                migrations = migrations_for(proposals)
+            except ValueError as e:
+                raise CommandError(e)
+            for app_label, migration in migrations.items():
+                writer = MigrationWriter(migration)
+                if options['write'] and self.is_project_app(app_label):
+                    self.write_migration(app_label, writer)
+                    continue
+                if options['write']:
+                    self.stderr.write(
+                        'Not writing migrations of %s, an installed package: '
+                        'set MIGRATION_MODULES for it to do so' % app_label)
+                self.stdout.write('# %s' % writer.path)
+                self.stdout.write(writer.as_string())
+
+    def write_text(self, proposals):
+        if not proposals:
+            self.stdout.write('No index to propose.')
+            return
+        for proposal in proposals:
+            lookups = ', '.join('%s=%s' % item
+                                for item in sorted(proposal.lookups.items()))
+            line = '%-24s  %-16s  %-32s  weight %d  (%s)' % (
+                proposal.model._meta.label, proposal.kind or '-',
+                ', '.join(proposal.columns), proposal.weight, lookups)
+            if proposal.note:
+                line += '  [%s]' % proposal.note
+            self.stdout.write(line)
+
+    @staticmethod
+    def get_library_paths():
+        """The directories of the standard library and installed packages"""
+        paths = {sysconfig.get_paths()[name] for name in (
+            'stdlib', 'platstdlib', 'purelib', 'platlib')}
+        if hasattr(site, 'getsitepackages'):  # missing in old virtualenvs
+            paths.update(site.getsitepackages())
+        return [os.path.realpath(path) for path in paths]
+
+    def is_project_app(self, app_label):
+        """
+        Whether migrations of app_label may be written: its migration module
+        is set in MIGRATION_MODULES, or it is not an installed package
+        """
+        if app_label in getattr(settings, 'MIGRATION_MODULES', {}):
+            return True
+        path = os.path.realpath(apps.get_app_config(app_label).path)
+        return not any(path == library or path.startswith(library + os.sep)
+                       for library in self.get_library_paths())
+
+    def write_migration(self, app_label, writer):
+        directory = os.path.dirname(writer.path)
+        if not os.path.isdir(directory):
+            self.stderr.write('No migrations directory for %s (%s)' % (
+                app_label, apps.get_app_config(app_label).path))
+            return
+        with open(writer.path, 'w', encoding='utf-8') as migration_file:
+            migration_file.write(writer.as_string())
+        self.stdout.write('Wrote %s' % writer.path)
@@ -0,0 +1,134 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from advanced_filters.models import AdvancedFilter
+from advanced_filters.query_compiler import filter_queryset
+from advanced_filters.timeouts import statement_timeout
+
+SORT_KEYS = {
+    'time': lambda entry: -(entry['time'] or 0),
+    'rows': lambda entry: -(entry['rows'] or 0),
+    'id': lambda entry: entry['id'],
+}
+
+
+class Command(BaseCommand):
+    help = ('Run every saved advanced filter against its model, reporting its '
+            'execution time, row count, SQL and query plan')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', help='Only run filters of this "app_label.Model"')
+        parser.add_argument(
+            '--format', choices=('table', 'json'), default='table',
+            help='Format of the report (default: table)')
+        parser.add_argument(
+            '--sort', choices=tuple(SORT_KEYS), default='time',
+            help='Sort the report by (descending) time, rows or by id')
+        parser.add_argument(
+            '--budget', type=float,
+            help='Time budget of a filter in seconds: slower filters are '
+                 'flagged, and cancelled on PostgreSQL and SQLite')
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='EXPLAIN ANALYZE queries (where supported by the database)')
+        parser.add_argument(
+            '--output', help='Also write the JSON report to this file, i.e: to '
+                             'use as a baseline later on')
+        parser.add_argument(
+            '--baseline', help='JSON report to compare execution times with')
+        parser.add_argument(
+            '--threshold', type=float, default=1.5,
+            help='Ratio to the baseline time over which a filter is flagged as '
+                 'regressed (default: 1.5)')
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Exit with an error if any filter regressed')
+
+    def handle(self, *args, **options):
+        filters = AdvancedFilter.objects.order_by('id')
+        if options['model']:
+            filters = filters.filter(model=options['model'])
+
+        report = [self.benchmark(afilter, options['budget'], options['analyze'])
+                  for afilter in filters]
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                self.compare(report, json.load(baseline), options['threshold'])
+        report.sort(key=SORT_KEYS[options['sort']])
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_table(report)
+
+        regressed = [entry['id'] for entry in report if entry.get('regressed')]
+        if regressed and options['fail_on_regression']:
+            raise CommandError('Filters regressed: %s' % ', '.join(
+                map(str, regressed)))
+
+    def benchmark(self, afilter, budget=None, analyze=False):
+        entry = {
+            'id': afilter.pk, 'title': afilter.title, 'model': afilter.model,
+            'time': None, 'rows': None, 'sql': None, 'explain': None,
+            'error': None, 'over_budget': False,
+        }
+        try:
+            model = afilter.get_model()
+            queryset = filter_queryset(
+                model._default_manager.all(), afilter.decode_query())
+            entry['sql'] = str(queryset.query)
+            with statement_timeout(queryset.db, budget):
+                start = time.perf_counter()
+                entry['rows'] = queryset.count()
+                entry['time'] = time.perf_counter() - start
+                explain_options = {'analyze': True} if analyze else {}
+                entry['explain'] = queryset.explain(**explain_options)
+        except Exception as e:
+            # report broken (or cancelled) filters along with the others
+            entry['error'] = '%s: %s' % (type(e).__name__, e)
+        if budget and (entry['error'] or (entry['time'] or 0) > budget):
+            entry['over_budget'] = True
+        return entry
+
+    @staticmethod
+    def compare(report, baseline, threshold):
+        times = {entry['id']: entry['time'] for entry in baseline}
+        for entry in report:
+            baseline_time = times.get(entry['id'])
+            entry['baseline_time'] = baseline_time
+            entry['regressed'] = bool(
+                baseline_time and entry['time'] and
+                entry['time'] > baseline_time * threshold)
+
+    def write_table(self, report):
+        with_baseline = any('baseline_time' in entry for entry in report)
+        header = '%6s  %-24s  %10s  %10s' % ('id', 'model', 'rows', 'time (ms)')
+        if with_baseline:
+            header += '  %13s' % 'baseline (ms)'
+        self.stdout.write(header + '  title')
+
+        def ms(seconds):
+            return '-' if seconds is None else '%.2f' % (seconds * 1000)
+
+        for entry in report:
+            line = '%6d  %-24s  %10s  %10s' % (
+                entry['id'], entry['model'] or '-',
+                '-' if entry['rows'] is None else entry['rows'],
+                ms(entry['time']))
+            if with_baseline:
+                line += '  %13s' % ms(entry.get('baseline_time'))
+            line += '  %s' % entry['title']
+            flags = [flag for flag, key in (('OVER BUDGET', 'over_budget'),
+                                            ('REGRESSED', 'regressed'))
+                     if entry.get(key)]
+            if entry['error']:
+                flags.append(entry['error'])
+            if flags:
+                line += '  [%s]' % '; '.join(flags)
+            self.stdout.write(line)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from advanced_filters.models import AdvancedFilter
+
+
+class Command(BaseCommand):
+    help = 'Refresh the snapshots of materialized advanced filters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'ids', nargs='*', type=int,
+            help='Ids of the filters to refresh (default: all materialized)')
+        parser.add_argument(
+            '--model', help='Only refresh filters of this "app_label.Model"')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Number of primary keys fetched and stored at a time')
+
+    def handle(self, *args, **options):
+        filters = AdvancedFilter.objects.filter(materialize=True)
+        if options['ids']:
+            filters = filters.filter(id__in=options['ids'])
+            missing = set(options['ids']) - set(
+                filters.values_list('id', flat=True))
+            if missing:
+                raise CommandError('No materialized filters with ids: %s' % (
+                    ', '.join(map(str, sorted(missing)))))
+        if options['model']:
+            filters = filters.filter(model=options['model'])
+
+        for afilter in filters.order_by('id'):
+            count = afilter.refresh_snapshot(chunk_size=options['chunk_size'])
+            self.stdout.write('Refreshed "%s" (%d): %d objects' % (
+                afilter.title, afilter.pk, count))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advanced_filters', '0003_auto_20180610_0718'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='advancedfilter',
+            name='b64_query',
+            field=models.TextField(),
+        ),
+    ]
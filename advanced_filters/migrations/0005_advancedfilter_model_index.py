@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advanced_filters', '0004_b64_query_text'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='advancedfilter',
+            name='model',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
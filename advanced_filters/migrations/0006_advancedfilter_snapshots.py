@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 15:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advanced_filters', '0005_advancedfilter_model_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='materialize',
+            field=models.BooleanField(default=False, help_text='Filter by a periodically refreshed snapshot of the matching objects, rather than running the query.', verbose_name='Materialize'),
+        ),
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='materialized_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Snapshot taken at'),
+        ),
+        migrations.CreateModel(
+            name='AdvancedFilterResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_pk', models.CharField(max_length=255)),
+                ('advanced_filter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='advanced_filters.advancedfilter')),
+            ],
+            options={
+                'verbose_name': 'Advanced Filter Result',
+                'verbose_name_plural': 'Advanced Filter Results',
+                'unique_together': {('advanced_filter', 'object_pk')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-17 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advanced_filters', '0006_advancedfilter_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='executions',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Executions'),
+        ),
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='last_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Last result count'),
+        ),
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='last_used_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Last used at'),
+        ),
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='p95_time',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='95th percentile time (s)'),
+        ),
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='recent_times',
+            field=models.TextField(default='[]', editable=False),
+        ),
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='total_time',
+            field=models.FloatField(default=0, editable=False, verbose_name='Cumulative time (s)'),
+        ),
+    ]
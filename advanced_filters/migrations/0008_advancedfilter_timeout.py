@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advanced_filters', '0007_advancedfilter_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='last_timeout_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Last timed out at'),
+        ),
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='timeout',
+            field=models.FloatField(blank=True, help_text='Cancel the query of this filter after this many seconds, overriding the budget of its model admin.', null=True, verbose_name='Time budget (s)'),
+        ),
+        migrations.AddField(
+            model_name='advancedfilter',
+            name='timeouts',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Timeouts'),
+        ),
+    ]
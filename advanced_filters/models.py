@@ -1,16 +1,37 @@
+import json
+
+from django.apps import apps
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
+from django.db.models.functions import Cast
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from .q_serializer import QSerializer
+from .query_cache import query_cache
 
 
 class UserLookupManager(models.Manager):
     def filter_by_user(self, user):
-        """All filters that should be displayed to a user (by users/group)"""
+        """
+        All filters that should be displayed to a user (by users/group)
 
-        return self.filter(Q(users=user) | Q(groups__in=user.groups.all()))
+        Each relation is checked by a subquery of its table (served by its
+        unique index), rather than OR-ing LEFT JOINs of both, which returns
+        a filter once per matching user/group row. (OR-ing Exists() needs
+        Django 3.0.)
+        """
+        users = self.model.users.field
+        groups = self.model.groups.field
+        return self.filter(
+            Q(pk__in=users.remote_field.through._default_manager.filter(**{
+                users.m2m_reverse_field_name(): user.pk,
+            }).values(users.m2m_field_name())) |
+            Q(pk__in=groups.remote_field.through._default_manager.filter(**{
+                '%s__in' % groups.m2m_reverse_field_name():
+                    user.groups.values('pk'),
+            }).values(groups.m2m_field_name())))
 
 
 class AdvancedFilter(models.Model):
@@ -18,6 +39,10 @@ class AdvancedFilter(models.Model):
         verbose_name = _('Advanced Filter')
         verbose_name_plural = _('Advanced Filters')
 
+    # fields applying to a changelist filtered by the filter, cached along
+    # with its query (see get_options)
+    OPTION_FIELDS = ('title', 'materialize', 'materialized_at', 'timeout')
+
     title = models.CharField(max_length=255, null=False, blank=False, verbose_name=_('Title'))
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -32,31 +57,142 @@ class AdvancedFilter(models.Model):
 
     objects = UserLookupManager()
 
-    b64_query = models.CharField(max_length=2048)
-    model = models.CharField(max_length=64, blank=True, null=True)
+    b64_query = models.TextField()
+    model = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+
+    materialize = models.BooleanField(
+        default=False, verbose_name=_('Materialize'),
+        help_text=_('Filter by a periodically refreshed snapshot of the '
+                    'matching objects, rather than running the query.'))
+    materialized_at = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        verbose_name=_('Snapshot taken at'))
+
+    timeout = models.FloatField(
+        null=True, blank=True, verbose_name=_('Time budget (s)'),
+        help_text=_('Cancel the query of this filter after this many '
+                    'seconds, overriding the budget of its model admin.'))
+    timeouts = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name=_('Timeouts'))
+    last_timeout_at = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        verbose_name=_('Last timed out at'))
+
+    # execution statistics, see stats.StatsBuffer
+    executions = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name=_('Executions'))
+    total_time = models.FloatField(
+        default=0, editable=False, verbose_name=_('Cumulative time (s)'))
+    p95_time = models.FloatField(
+        null=True, blank=True, editable=False,
+        verbose_name=_('95th percentile time (s)'))
+    # a JSON list of the latest execution times (JSONField needs Django 3.1)
+    recent_times = models.TextField(default='[]', editable=False)
+    last_used_at = models.DateTimeField(
+        null=True, blank=True, editable=False, verbose_name=_('Last used at'))
+    last_count = models.PositiveIntegerField(
+        null=True, blank=True, editable=False,
+        verbose_name=_('Last result count'))
 
     @property
     def query(self):
         """
         De-serialize, decode and return an ORM query stored in b64_query.
+
+        Decoded queries of saved filters are cached, see ``query_cache``.
         """
         if not self.b64_query:
             return None
-        s = QSerializer(base64=True)
-        return s.loads(self.b64_query)
+        if self.pk is None:
+            return self.decode_query()
+        return query_cache.get_for(self)
 
     @query.setter
     def query(self, value):
         """
-        Serialize an ORM query, Base-64 encode it and set it to
-        the b64_query field
+        Serialize an ORM query, compress it and set it to the b64_query field
+        (filters saved by older versions remain Base-64 encoded until changed)
         """
         if not isinstance(value, Q):
             raise Exception('Must only be passed a Django (Q)uery object')
+        s = QSerializer(base64=True, compress=True)
+        b64_query = s.dumps(value)
+        if b64_query != self.b64_query:
+            # a snapshot of the previous query is no longer valid
+            self.materialized_at = None
+        self.b64_query = b64_query
+
+    def decode_query(self):
+        """Decode the query stored in b64_query, bypassing the cache"""
+        if not self.b64_query:
+            return None
         s = QSerializer(base64=True)
-        self.b64_query = s.dumps(value)
+        return s.loads(self.b64_query)
+
+    def get_options(self):
+        """The values of OPTION_FIELDS, or None if any of them is deferred"""
+        if self.get_deferred_fields() & set(self.OPTION_FIELDS):
+            return None
+        return {name: getattr(self, name) for name in self.OPTION_FIELDS}
+
+    def get_recent_times(self):
+        """The latest execution times (in seconds) recorded"""
+        return json.loads(self.recent_times or '[]')
+
+    def get_model(self):
+        """The model filtered, from its "app_label.Model" label"""
+        return apps.get_model(*self.model.split('.'))
+
+    def refresh_snapshot(self, chunk_size=2000):
+        """
+        Store the primary keys of the objects currently matching the query
+        (replacing the previous snapshot), returns their number.
+        """
+        from .query_compiler import filter_queryset
+
+        model = self.get_model()
+        queryset = filter_queryset(model._default_manager.all(), self.query)
+        pks = queryset.order_by().values_list('pk', flat=True)
+        count = 0
+        with transaction.atomic():
+            self.results.all().delete()
+            batch = []
+            for pk in pks.iterator(chunk_size=chunk_size):
+                batch.append(AdvancedFilterResult(
+                    advanced_filter=self, object_pk=str(pk)))
+                if len(batch) >= chunk_size:
+                    AdvancedFilterResult.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            AdvancedFilterResult.objects.bulk_create(batch)
+            count += len(batch)
+            self.materialized_at = timezone.now()
+            AdvancedFilter.objects.filter(pk=self.pk).update(
+                materialized_at=self.materialized_at)
+        # the cached options of the filter are outdated
+        query_cache.invalidate(self.pk)
+        return count
 
     def list_fields(self):
         s = QSerializer(base64=True)
         d = s.loads(self.b64_query, raw=True)
         return s.get_field_values_list(d)
+
+
+class AdvancedFilterResult(models.Model):
+    """The primary key of an object in the snapshot of a materialized filter"""
+    class Meta:
+        verbose_name = _('Advanced Filter Result')
+        verbose_name_plural = _('Advanced Filter Results')
+        unique_together = ('advanced_filter', 'object_pk')
+
+    advanced_filter = models.ForeignKey(
+        AdvancedFilter, related_name='results', on_delete=models.CASCADE)
+    object_pk = models.CharField(max_length=255)
+
+    @classmethod
+    def subquery(cls, filter_id, pk_field):
+        """Primary keys (cast to pk_field) of the snapshot of a filter"""
+        return cls.objects.filter(advanced_filter_id=filter_id).annotate(
+            pk_value=Cast('object_pk', output_field=pk_field)
+        ).values('pk_value')
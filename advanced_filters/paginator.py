@@ -0,0 +1,265 @@
+"""
+Changelist paginator sparing exact counts of querysets filtered by a saved
+advanced filter (see ``AdminAdvancedFiltersMixin.advanced_filter_count``).
+
+Rather than an exact ``COUNT(*)`` of the filtered queryset, it counts at most
+``limit`` (+1) objects ("bounded"), or on PostgreSQL takes the planner's
+estimate of the number of rows ("estimate"). Exact counts are only computed
+when paging reaches the end of the bounded/estimated count, or whenever the
+count is within the limit anyway, and are then cached for the filter and
+queryset.
+
+Settings:
+
+ADVANCED_FILTERS_COUNT_CACHE
+    Alias of a Django cache (from ``CACHES``) to cache exact counts in
+    (default "default", None disables caching).
+ADVANCED_FILTERS_COUNT_CACHE_TIMEOUT
+    Timeout of cached counts in seconds (default 600).
+
+``KeysetPaginator`` pages by cursors (the values of the ordering fields of the
+first/last object of a page, see ``AdminAdvancedFiltersMixin.
+advanced_filter_keyset``) rather than by offsets, so that deep pages cost as
+much as the first.
+"""
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Page, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .query_analysis import explain_plan
+
+logger = logging.getLogger('advanced_filters.paginator')
+
+BOUNDED = 'bounded'
+ESTIMATE = 'estimate'
+DEFAULT_LIMIT = 1000
+DEFAULT_TIMEOUT = 600
+CACHE_KEY_PREFIX = 'advanced_filters:count'
+CURSOR_VAR = '_acursor'
+NEXT = 'next'
+PREVIOUS = 'prev'
+
+
+class AdvancedFilterPaginator(Paginator):
+    """
+    A Paginator of a queryset filtered by the saved filter filter_id, whose
+    count is only exact when exact is True.
+    """
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, filter_id=None, mode=BOUNDED,
+                 limit=DEFAULT_LIMIT, page_number=1):
+        super().__init__(object_list, per_page, orphans,
+                         allow_empty_first_page)
+        self.filter_id = filter_id
+        self.mode = mode
+        self.limit = limit
+        self.page_number = page_number
+        self.exact = True
+
+    @property
+    def cache(self):
+        alias = getattr(settings, 'ADVANCED_FILTERS_COUNT_CACHE', 'default')
+        return caches[alias] if alias else None
+
+    def get_cache_key(self):
+        # the count doesn't depend on ordering
+        sql, params = self.object_list.order_by().query.sql_with_params()
+        digest = hashlib.md5(repr((sql, params)).encode('utf-8')).hexdigest()
+        return '{prefix}:{filter_id}:{digest}'.format(
+            prefix=CACHE_KEY_PREFIX, filter_id=self.filter_id, digest=digest)
+
+    def reaches(self, count):
+        """Whether the requested page is the last one of count objects"""
+        return self.page_number >= math.ceil(count / self.per_page)
+
+    def estimate_count(self):
+        """The planner's estimate of the number of objects, or None"""
+        plan = explain_plan(self.object_list)
+        return None if plan is None else int(plan['Plan Rows'])
+
+    def exact_count(self, bounded_count=None):
+        if bounded_count is not None and bounded_count <= self.limit:
+            count = bounded_count
+        else:
+            count = self.object_list.count()
+        if self.cache is not None:
+            timeout = getattr(settings, 'ADVANCED_FILTERS_COUNT_CACHE_TIMEOUT',
+                              DEFAULT_TIMEOUT)
+            self.cache.set(self.get_cache_key(), count, timeout)
+        return count
+
+    @cached_property
+    def count(self):
+        if self.cache is not None:
+            count = self.cache.get(self.get_cache_key())
+            if count is not None:
+                return count
+
+        if self.mode == ESTIMATE:
+            estimate = self.estimate_count()
+            if (estimate is not None and estimate > self.limit and
+                    not self.reaches(estimate)):
+                self.exact = False
+                return estimate
+
+        bounded_count = self.object_list.order_by()[:self.limit + 1].count()
+        if bounded_count > self.limit and not self.reaches(bounded_count):
+            self.exact = False
+            return bounded_count
+        logger.debug('Counting all objects of filter %s', self.filter_id)
+        return self.exact_count(bounded_count)
+
+    @property
+    def display_count(self):
+        """The count as displayed, i.e: "1000+" or "~12345" when not exact"""
+        count = self.count
+        if self.exact:
+            return str(count)
+        if self.mode == ESTIMATE and count != self.limit + 1:
+            return '~%d' % count
+        return '%d+' % self.limit
+
+    @property
+    def page_links(self):
+        """Page numbers to link to from the requested page"""
+        if hasattr(self, 'get_elided_page_range'):
+            return list(self.get_elided_page_range(self.page_number))
+        return list(self.page_range)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Encodes times to the microsecond (DjangoJSONEncoder truncates them to
+    milliseconds), as cursors must match the values of their object exactly
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction, values):
+    """Encode a cursor (URL safe) to page in direction from values"""
+    data = json.dumps([direction] + list(values), cls=CursorEncoder)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode(
+        'ascii').rstrip('=')
+
+
+def decode_cursor(cursor, keyset):
+    """
+    Decode a cursor into its direction and the values of the fields of
+    keyset, raising ValueError if invalid
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+        direction, values = data[0], data[1:]
+        if direction not in (NEXT, PREVIOUS) or len(values) != len(keyset):
+            raise ValueError('Invalid cursor: %r' % cursor)
+        return direction, [field.to_python(value)
+                           for (field, _), value in zip(keyset, values)]
+    except (binascii.Error, UnicodeDecodeError, TypeError, IndexError,
+            ValidationError) as e:
+        raise ValueError('Invalid cursor: %r' % cursor) from e
+
+
+class KeysetPaginator(AdvancedFilterPaginator):
+    """
+    A paginator of a queryset filtered by a saved filter, paging from the
+    cursor (see encode_cursor) rather than by page number. Querysets ordered
+    by anything else than non-null columns are paged by offset (keyset is
+    then False). The count is bounded unless given another (count) mode, as
+    an exact count on every page would cost as much as the offsets spared.
+    """
+    def __init__(self, *args, cursor=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mode = self.mode or BOUNDED
+        self.cursor = cursor
+        self.keyset = False
+        self.next_cursor = self.previous_cursor = None
+
+    def get_keyset(self):
+        """
+        The (field, descending) pairs ordering object_list, ending with the
+        primary key, or None if it can't be paged by keyset
+        """
+        opts = self.object_list.model._meta
+        keyset = []
+        for term in self.object_list.query.order_by:
+            if not isinstance(term, str):
+                return None  # i.e: an expression
+            name = term.lstrip('-')
+            try:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if (not field.concrete or field.null or
+                    (field.is_relation and not field.primary_key)):
+                return None
+            keyset.append((field, term.startswith('-')))
+            if field.primary_key:
+                return keyset
+        return keyset + [(opts.pk, False)]
+
+    @staticmethod
+    def get_condition(keyset, values, backwards=False):
+        """
+        Condition of objects following values (preceding them if backwards)
+        in the ordering of keyset, i.e: a > 1 OR (a = 1 AND pk > 2)
+        """
+        condition = Q()
+        for i, (field, descending) in enumerate(keyset):
+            lookup = 'lt' if descending != backwards else 'gt'
+            term = Q(**{'%s__%s' % (field.name, lookup): values[i]})
+            for (previous, _), value in zip(keyset[:i], values):
+                term &= Q(**{previous.name: value})
+            condition |= term
+        return condition
+
+    def page(self, number):
+        keyset = self.get_keyset()
+        if keyset is None:
+            return super().page(number)
+        self.keyset = True
+
+        direction, values = NEXT, None
+        if self.cursor:
+            try:
+                direction, values = decode_cursor(self.cursor, keyset)
+            except ValueError as e:
+                logger.debug('Paging from the first page: %s', e)
+        backwards = direction == PREVIOUS
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(
+                self.get_condition(keyset, values, backwards))
+        if backwards:
+            queryset = queryset.reverse()
+        objects = list(queryset[:self.per_page + 1])
+        more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if backwards:
+            objects.reverse()
+
+        if objects:
+            def cursor(direction, obj):
+                return encode_cursor(direction, [
+                    getattr(obj, field.attname) for field, _ in keyset])
+
+            if more or backwards:
+                self.next_cursor = cursor(NEXT, objects[-1])
+            if values is not None and (more or not backwards):
+                self.previous_cursor = cursor(PREVIOUS, objects[0])
+        return Page(objects, number, self)
@@ -2,6 +2,7 @@
 from datetime import datetime, date
 import base64
 import time
+import zlib
 
 from django.db.models import Q
 from django.core.serializers.base import SerializationError
@@ -24,20 +25,34 @@ def dt2ts(obj):
     return time.mktime(obj.timetuple()) if isinstance(obj, date) else obj
 
 
+# Header of compressed envelopes, followed by the format version. Must not
+# be part of the Base-64 alphabet so legacy strings are never mistaken for it
+ENVELOPE_HEADER = '~'
+ENVELOPE_VERSION = '1'
+
+
 class QSerializer:
     """
     A Q object serializer base class. Pass base64=True when initializing
     to Base-64 encode/decode the returned/passed string.
 
+    Pass compress=True to dump into a versioned envelope instead: a header
+    followed by zlib compressed compact JSON, encoded with Base-85 to keep it
+    text safe. loads() detects envelopes regardless, and falls back to
+    decoding the legacy (plain/Base-64) JSON format otherwise.
+
     By default the class provides loads/dumps methods that wrap around
     json serialization, but they may be easily overwritten to serialize
     into other formats (i.e XML, YAML, etc...)
     """
     b64_enabled = False
+    compress_enabled = False
 
-    def __init__(self, base64=False):
+    def __init__(self, base64=False, compress=False):
         if base64:
             self.b64_enabled = True
+        if compress:
+            self.compress_enabled = True
 
     @staticmethod
     def _is_range(qtuple):
@@ -115,16 +130,42 @@ class QSerializer:
                 fields.append({'field': '_OR', 'value': 'null'})
         return fields
 
+    @staticmethod
+    def is_envelope(string):
+        return string.startswith(ENVELOPE_HEADER)
+
+    @staticmethod
+    def pack_envelope(string):
+        data = zlib.compress(string.encode("utf-8"), 9)
+        return "{header}{version}{payload}".format(
+            header=ENVELOPE_HEADER, version=ENVELOPE_VERSION,
+            payload=base64.b85encode(data).decode("ascii"))
+
+    @staticmethod
+    def unpack_envelope(string):
+        version = string[len(ENVELOPE_HEADER):len(ENVELOPE_HEADER) + 1]
+        if version != ENVELOPE_VERSION:
+            raise SerializationError(
+                "Unsupported query envelope version: %r" % version)
+        payload = string[len(ENVELOPE_HEADER) + 1:]
+        return zlib.decompress(base64.b85decode(payload)).decode("utf-8")
+
     def dumps(self, obj):
         if not isinstance(obj, Q):
             raise SerializationError
+        if self.compress_enabled:
+            string = json.dumps(self.serialize(obj), default=dt2ts,
+                                separators=(',', ':'))
+            return self.pack_envelope(string)
         string = json.dumps(self.serialize(obj), default=dt2ts)
         if self.b64_enabled:
             return base64.b64encode(string.encode("latin-1")).decode("utf-8")
         return string
 
     def loads(self, string, raw=False):
-        if self.b64_enabled:
+        if self.is_envelope(string):
+            d = json.loads(self.unpack_envelope(string))
+        elif self.b64_enabled:
             d = json.loads(base64.b64decode(string))
         else:
             d = json.loads(string)
@@ -0,0 +1,103 @@
+"""
+Static analysis of (saved) filter queries.
+
+Resolves the lookups of a Q object (i.e: "assigned_to__groups__name__iexact")
+against a model, in order to find out which relations each rule traverses
+without compiling the query, and asks the planner about compiled querysets
+on PostgreSQL (``explain_plan``).
+"""
+from functools import lru_cache
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+
+
+def iter_lookups(query):
+    """
+    Yield all (lookup, value) children of a (possibly nested) Q object,
+    skipping expressions (i.e: compiled Exists() subqueries)
+    """
+    for child in query.children:
+        if isinstance(child, Q):
+            yield from iter_lookups(child)
+        elif isinstance(child, (tuple, list)):
+            yield child[0], child[1]
+
+
+def resolve_lookup(model, lookup):
+    """
+    Split a lookup into the model fields it traverses and the remaining
+    lookup/transform names, i.e for Client:
+
+        "assigned_to__email__iexact" -> ([assigned_to, email], ["iexact"])
+    """
+    opts = model._meta
+    fields = []
+    parts = lookup.split(LOOKUP_SEP)
+    for i, part in enumerate(parts):
+        if opts is None:
+            return fields, parts[i:]
+        try:
+            field = opts.pk if part == 'pk' else opts.get_field(part)
+        except FieldDoesNotExist:
+            return fields, parts[i:]
+        fields.append(field)
+        related_model = getattr(field, 'related_model', None)
+        if field.is_relation and related_model and related_model != 'self':
+            opts = related_model._meta
+        else:
+            opts = None
+    return fields, []
+
+
+def is_multivalued(field):
+    """Whether following this relation may yield multiple rows per object"""
+    return bool(field.is_relation and (field.many_to_many or
+                                       field.one_to_many))
+
+
+@lru_cache(maxsize=512)
+def _multivalued_hops(model, lookups):
+    hops = set()
+    for lookup in lookups:
+        fields, _ = resolve_lookup(model, lookup)
+        for i, field in enumerate(fields):
+            if is_multivalued(field):
+                hops.add(LOOKUP_SEP.join(f.name for f in fields[:i + 1]))
+    return frozenset(hops)
+
+
+def get_multivalued_hops(model, query):
+    """
+    Return the set of relation paths in query which cross a reverse foreign
+    key or a many-to-many relation (and thus may duplicate result rows).
+
+    Results are memoized per model and set of lookups.
+    """
+    lookups = tuple(sorted({lookup for lookup, _ in iter_lookups(query)}))
+    return _multivalued_hops(model, lookups)
+
+
+def needs_distinct(model, query):
+    """Whether filtering by query may return duplicate rows of model"""
+    return bool(get_multivalued_hops(model, query))
+
+
+def explain_plan(queryset):
+    """
+    The top node of the plan of queryset (per ``EXPLAIN (FORMAT JSON)``), or
+    None if the database isn't PostgreSQL
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
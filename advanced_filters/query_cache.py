@@ -0,0 +1,225 @@
+"""
+Cache of decoded AdvancedFilter queries.
+
+Decoding a stored filter (base64 -> JSON -> Q tree) is repeated on every
+changelist request that applies it, so decoded queries are kept in a
+size-bounded LRU keyed by the filter id, along with a digest of the
+``b64_query`` they were decoded from. Entries are dropped when the filter is
+saved or deleted (see ``apps.AdvancedFiltersConfig.ready``). A save only
+reaches the process-local LRU of the process it happens in, so entries of
+the LRU also expire after a while, bounding how long other processes apply
+an outdated query.
+
+Settings:
+
+ADVANCED_FILTERS_QUERY_CACHE_SIZE
+    Maximum number of decoded queries kept per process (default 128, 0
+    disables caching).
+ADVANCED_FILTERS_QUERY_CACHE_BACKEND
+    Optional alias of a Django cache (from ``CACHES``) to store the decoded
+    queries in instead of the process-local LRU, so that all processes share
+    (and invalidate) the same entries.
+ADVANCED_FILTERS_QUERY_CACHE_TIMEOUT
+    Timeout in seconds for entries in the Django cache backend (defaults to
+    the backend's own timeout).
+ADVANCED_FILTERS_QUERY_CACHE_LOCAL_TIMEOUT
+    Timeout in seconds for entries of the process-local LRU (default 60,
+    None for no timeout).
+ADVANCED_FILTERS_QUERY_CACHE_WARMUP
+    Decode and cache the most recently created filters when the app is
+    loaded (default False).
+"""
+from collections import OrderedDict
+from copy import deepcopy
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('advanced_filters.query_cache')
+
+DEFAULT_CACHE_SIZE = 128
+DEFAULT_LOCAL_TIMEOUT = 60
+CACHE_KEY_PREFIX = 'advanced_filters:query:'
+
+
+def query_digest(b64_query):
+    """Return a short digest identifying a stored (encoded) query"""
+    return hashlib.sha1((b64_query or '').encode('utf-8')).hexdigest()
+
+
+class LRUStore:
+    """A minimal thread-safe, size-bounded LRU mapping, expiring entries"""
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        return getattr(settings, 'ADVANCED_FILTERS_QUERY_CACHE_SIZE',
+                       DEFAULT_CACHE_SIZE)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'ADVANCED_FILTERS_QUERY_CACHE_LOCAL_TIMEOUT',
+                       DEFAULT_LOCAL_TIMEOUT)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                return None
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        maxsize = self.maxsize
+        if not maxsize:
+            return
+        timeout = self.timeout
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class QueryCache:
+    """
+    Decoded query cache of AdvancedFilter instances.
+
+    Entries are ``(digest, query, options)`` tuples keyed by the filter's
+    primary key, options being the fields of the filter which apply to a
+    changelist (see ``AdvancedFilter.get_options``).
+    Lookups by id alone (``get``) skip fetching the filter row entirely,
+    relying on entries being invalidated whenever a filter is saved or
+    deleted (and on the expiry of process-local entries, for saves in other
+    processes). Lookups through an instance (``get_for``) additionally
+    verify the digest of its ``b64_query``.
+
+    Returned queries are copies, callers may modify them freely.
+    """
+
+    def __init__(self):
+        self._local = LRUStore()
+
+    @property
+    def enabled(self):
+        return bool(getattr(settings, 'ADVANCED_FILTERS_QUERY_CACHE_SIZE',
+                            DEFAULT_CACHE_SIZE))
+
+    @property
+    def _store(self):
+        alias = getattr(settings, 'ADVANCED_FILTERS_QUERY_CACHE_BACKEND', None)
+        if alias:
+            return caches[alias]
+        return self._local
+
+    @staticmethod
+    def _key(pk):
+        return f'{CACHE_KEY_PREFIX}{pk}'
+
+    def _get_entry(self, pk):
+        if pk is None or not self.enabled:
+            return None
+        return self._store.get(self._key(pk))
+
+    def _set_entry(self, pk, digest, query, options=None):
+        if pk is None or not self.enabled:
+            return
+        store = self._store
+        if store is self._local:
+            store.set(self._key(pk), (digest, query, options))
+        else:
+            timeout = getattr(
+                settings, 'ADVANCED_FILTERS_QUERY_CACHE_TIMEOUT', None)
+            kwargs = {'timeout': timeout} if timeout is not None else {}
+            store.set(self._key(pk), (digest, query, options), **kwargs)
+
+    def get(self, pk):
+        """Return a cached query by filter id, or None on a cache miss"""
+        entry = self._get_entry(pk)
+        if entry is None:
+            return None
+        return deepcopy(entry[1])
+
+    def get_options(self, pk):
+        """Return the cached options of a filter by id, or None on a miss"""
+        entry = self._get_entry(pk)
+        if entry is None or entry[2] is None:
+            return None
+        return dict(entry[2])
+
+    def get_for(self, afilter):
+        """
+        Return the decoded query of an AdvancedFilter instance, decoding and
+        caching it on a miss (or when the cached entry is stale).
+        """
+        digest = query_digest(afilter.b64_query)
+        entry = self._get_entry(afilter.pk)
+        if entry is not None and entry[0] == digest:
+            return deepcopy(entry[1])
+        query = afilter.decode_query()
+        if query is not None:
+            self._set_entry(afilter.pk, digest, query, afilter.get_options())
+        return deepcopy(query)
+
+    def invalidate(self, pk):
+        if pk is None:
+            return
+        self._local.delete(self._key(pk))
+        alias = getattr(settings, 'ADVANCED_FILTERS_QUERY_CACHE_BACKEND', None)
+        if alias:
+            caches[alias].delete(self._key(pk))
+
+    def clear(self):
+        """Clear the process-local entries (shared backends are left as is)"""
+        self._local.clear()
+
+    def warm(self, queryset=None):
+        """Decode and cache the most recently created filters"""
+        from .models import AdvancedFilter
+
+        if not self.enabled:
+            return 0
+        if queryset is None:
+            size = getattr(settings, 'ADVANCED_FILTERS_QUERY_CACHE_SIZE',
+                           DEFAULT_CACHE_SIZE)
+            queryset = AdvancedFilter.objects.order_by('-pk')[:size]
+        count = 0
+        for afilter in queryset:
+            try:
+                self.get_for(afilter)
+            except Exception as e:
+                logger.warning('Skipped caching filter %s: %s', afilter.pk, e)
+                continue
+            count += 1
+        return count
+
+
+query_cache = QueryCache()
+
+
+def invalidate_cached_query(sender, instance, **kwargs):
+    """post_save/post_delete receiver dropping the filter's cached query"""
+    query_cache.invalidate(instance.pk)
@@ -0,0 +1,224 @@
+"""
+Compilation of stored filter queries before they are applied to a queryset.
+
+Rules following a reverse foreign key or a many-to-many relation become
+joins, which multiply result rows and force a DISTINCT. ``compile_query``
+rewrites such rules into correlated ``Exists()`` subqueries (semi-joins),
+grouping rules on the same relation that are ANDed together into one
+subquery, the same way a single ``filter()`` call reuses one join for them.
+
+Rules are left as is (and thus still joined) where a rewrite could change the
+results of the query:
+
+- ``isnull``/``None`` rules, which also match objects with no related rows.
+- A relation used by rules in more than one branch of an AND, where the same
+  join would be shared by the branches. This includes negated branches, i.e:
+  in ``Q(client__language="en") & ~Q(client__first_name="p")`` Django checks
+  the negated rule against the client row matching the first rule.
+
+Exists() can only be combined with ``Q`` objects from Django 3.0, rules are
+left joined (with a DISTINCT) on older versions.
+
+"One of" rules are compiled into plain ``IN`` clauses, unless the column is
+compared case insensitively (see ``lookups.CaseInsensitiveIn``). Regular
+expressions of "One of" values are upgraded as well, when anchored (matching
+the same objects, see ``lookups.parse_one_of_regex``).
+"""
+from functools import reduce
+import operator
+
+import django
+from django.conf import settings
+from django.db.models import Exists, ManyToManyField, OuterRef, Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.fields.reverse_related import ForeignObjectRel
+
+from .lookups import ONE_OF_LOOKUP, is_case_folded, parse_one_of_regex
+from .query_analysis import is_multivalued, needs_distinct, resolve_lookup
+
+EXISTS_IN_Q = django.VERSION >= (3, 0)
+
+
+def _multivalued_prefix(model, lookup, value):
+    """
+    Return the path of lookup up to (and including) its first multi-valued
+    relation, or None when the rule should not be rewritten.
+    """
+    if value is None:
+        return None
+    fields, rest = resolve_lookup(model, lookup)
+    if rest and rest[-1] == 'isnull':
+        return None
+    for i, field in enumerate(fields):
+        if is_multivalued(field):
+            return LOOKUP_SEP.join(lookup.split(LOOKUP_SEP)[:i + 1])
+    return None
+
+
+def _relation_subquery(model, prefix, rules):
+    """
+    Build the semi-join of rules (all under the relation path prefix),
+    starting from the related model when the relation is on model itself.
+    """
+    fields, _ = resolve_lookup(model, prefix)
+    field = fields[0]
+    back = None
+    if len(fields) == 1:
+        if isinstance(field, ForeignObjectRel):
+            back = field.field.name
+            outer = ('pk' if field.many_to_many
+                     else field.field.target_field.name)
+        elif isinstance(field, ManyToManyField):
+            back = field.related_query_name()
+            outer = 'pk'
+
+    if back is None:
+        # correlate on the model itself, keeping the original lookups
+        conditions = [Q((lookup, value)) for lookup, value in rules]
+        return Exists(model._base_manager.filter(
+            reduce(operator.and_, conditions), pk=OuterRef('pk')))
+
+    conditions = []
+    for lookup, value in rules:
+        rest = lookup[len(prefix) + len(LOOKUP_SEP):]
+        related_fields, _ = resolve_lookup(field.related_model, rest)
+        if not related_fields:
+            # i.e: "groups" or "groups__in" compare the related primary key
+            rest = LOOKUP_SEP.join(filter(None, ('pk', rest)))
+        conditions.append(Q((rest, value)))
+    return Exists(field.related_model._base_manager.filter(
+        reduce(operator.and_, conditions), **{back: OuterRef(outer)}))
+
+
+def _prefixes(model, query):
+    """
+    Return the multi-valued relation prefixes of the rules in query,
+    negated or not: a negated rule is checked against the related row an
+    earlier sibling rule joined, if any.
+    """
+    prefixes = set()
+    for child in query.children:
+        if isinstance(child, Q):
+            prefixes |= _prefixes(model, child)
+        elif isinstance(child, (tuple, list)):
+            prefixes.add(_multivalued_prefix(model, *child))
+    return prefixes - {None}
+
+
+def _compile_node(model, node, negated=False, blocked=frozenset()):
+    negated = negated or node.negated
+    group = node.connector == Q.AND and not negated
+
+    if group:
+        # a relation shared by several branches of this AND shares its join
+        sites = {}
+        for child in node.children:
+            if isinstance(child, Q):
+                prefixes, nested = _prefixes(model, child), True
+            elif isinstance(child, (tuple, list)):
+                prefixes, nested = {_multivalued_prefix(model, *child)}, False
+            else:
+                continue
+            for prefix in prefixes - {None}:
+                sites.setdefault(prefix, []).append(nested)
+        blocked = blocked | {
+            prefix for prefix, nested in sites.items()
+            if len(nested) > 1 and any(nested)}
+
+    children = []
+    grouped = {}
+    for child in node.children:
+        if isinstance(child, Q):
+            children.append(_compile_node(model, child, negated, blocked))
+            continue
+        if not isinstance(child, (tuple, list)):
+            children.append(child)
+            continue
+        lookup, value = child
+        prefix = _multivalued_prefix(model, lookup, value)
+        if prefix is None or prefix in blocked:
+            children.append(child)
+        elif group:
+            if prefix not in grouped:
+                # keep the position of the first rule on this relation
+                grouped[prefix] = (len(children), [])
+                children.append(None)
+            grouped[prefix][1].append((lookup, value))
+        else:
+            children.append(
+                _relation_subquery(model, prefix, [(lookup, value)]))
+    for prefix, (index, rules) in grouped.items():
+        children[index] = _relation_subquery(model, prefix, rules)
+
+    compiled = Q()
+    compiled.connector = node.connector
+    compiled.negated = node.negated
+    compiled.children = children
+    return compiled
+
+
+def _compile_one_of(model, lookup, value):
+    """Compile a "One of" rule (or a legacy regex of one) into an IN lookup"""
+    parts = lookup.split(LOOKUP_SEP)
+    if parts[-1] == 'iregex':
+        values = parse_one_of_regex(value, exact=True)
+        if values is None:
+            return lookup, value
+        parts[-1], value = ONE_OF_LOOKUP, values
+    if parts[-1] != ONE_OF_LOOKUP:
+        return lookup, value
+    fields, rest = resolve_lookup(model, LOOKUP_SEP.join(parts))
+    if fields and rest == [parts[-1]] and not is_case_folded(fields[-1]):
+        parts[-1] = 'in'
+    return LOOKUP_SEP.join(parts), value
+
+
+def _compile_lookups(model, node):
+    """Compile lookups of the rules in node, returns node if unchanged"""
+    children = []
+    for child in node.children:
+        if isinstance(child, Q):
+            children.append(_compile_lookups(model, child))
+        elif isinstance(child, (tuple, list)):
+            compiled = _compile_one_of(model, *child)
+            changed = compiled != tuple(child)
+            children.append(compiled if changed else child)
+        else:
+            children.append(child)
+    if all(new is old for new, old in zip(children, node.children)):
+        return node
+    compiled = Q()
+    compiled.connector = node.connector
+    compiled.negated = node.negated
+    compiled.children = children
+    return compiled
+
+
+def compile_query(model, query):
+    """
+    Return a query equivalent to the given (stored) query, with "One of"
+    rules compiled into IN lookups, and rules on multi-valued relations of
+    model rewritten into Exists() subqueries.
+
+    Exists() subqueries are disabled by setting
+    ADVANCED_FILTERS_EXISTS_SUBQUERIES to False.
+    """
+    query = _compile_lookups(model, query)
+    if not (EXISTS_IN_Q and
+            getattr(settings, 'ADVANCED_FILTERS_EXISTS_SUBQUERIES', True)):
+        return query
+    if not _prefixes(model, query):
+        return query
+    return _compile_node(model, query)
+
+
+def filter_queryset(queryset, query):
+    """
+    Filter queryset by a (stored) query, compiled by compile_query(), only
+    resorting to DISTINCT when a rule may still yield duplicate rows.
+    """
+    query = compile_query(queryset.model, query)
+    queryset = queryset.filter(query)
+    if needs_distinct(queryset.model, query):
+        queryset = queryset.distinct()
+    return queryset
@@ -0,0 +1,84 @@
+"""
+Shared cache of the saved filters listed to a user in a changelist sidebar.
+
+Entries are keyed by user, model label and an "ACL version" which is replaced
+whenever a filter is saved or deleted, the users or groups a filter is shared
+with change, or the groups of a user change (see
+``apps.AdvancedFiltersConfig.ready``). Listing the filters then costs no
+queries until any of them changes.
+
+Settings:
+
+ADVANCED_FILTERS_SIDEBAR_CACHE
+    Alias of a Django cache (from ``CACHES``) to enable the cache with
+    (default None, disabled).
+ADVANCED_FILTERS_SIDEBAR_CACHE_TIMEOUT
+    Timeout of entries in seconds (default 300), which bounds how long changes
+    not sending signals (i.e: ``QuerySet.update()``) go unnoticed.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_TIMEOUT = 300
+CACHE_KEY_PREFIX = 'advanced_filters:sidebar'
+VERSION_KEY = f'{CACHE_KEY_PREFIX}:version'
+
+
+class SidebarCache:
+    @property
+    def enabled(self):
+        return bool(getattr(settings, 'ADVANCED_FILTERS_SIDEBAR_CACHE', None))
+
+    @property
+    def cache(self):
+        return caches[settings.ADVANCED_FILTERS_SIDEBAR_CACHE]
+
+    def get_version(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            # another request may have set a version in the meantime
+            if not self.cache.add(VERSION_KEY, version, None):
+                version = self.cache.get(VERSION_KEY, version)
+        return version
+
+    def bump(self):
+        """Invalidate the cached filters of all users"""
+        self.cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+    def get_key(self, user, model_label):
+        return '{prefix}:{user}:{model}:{version}'.format(
+            prefix=CACHE_KEY_PREFIX, user=user.pk, model=model_label,
+            version=self.get_version())
+
+    def get_or_set(self, user, model_label, compute):
+        """
+        Return the cached (list of the) result of compute(), the filters of
+        model_label visible to user.
+        """
+        if not self.enabled:
+            return compute()
+        key = self.get_key(user, model_label)
+        result = self.cache.get(key)
+        if result is None:
+            result = list(compute())
+            timeout = getattr(settings, 'ADVANCED_FILTERS_SIDEBAR_CACHE_TIMEOUT',
+                              DEFAULT_TIMEOUT)
+            self.cache.set(key, result, timeout)
+        return result
+
+
+sidebar_cache = SidebarCache()
+
+
+def invalidate_sidebar(sender, **kwargs):
+    """
+    Receiver of post_save/post_delete/m2m_changed signals which may change
+    the filters visible to users
+    """
+    if kwargs.get('action', 'post_').startswith('pre_'):
+        return
+    if sidebar_cache.enabled:
+        sidebar_cache.bump()
@@ -0,0 +1,162 @@
+"""
+Cache of the SQL compiled from saved filter queries.
+
+Filtering a changelist by a saved filter resolves every lookup of its query,
+sets up the joins and compiles the conditions on every request. Instead, the
+query is compiled once into a subquery selecting the primary keys of the
+matching objects (``SELECT pk FROM ... WHERE ...``), whose SQL and parameters
+are cached, and later requests filter by ``pk IN (<cached SQL>)``.
+
+As this turns every filtered changelist into a semi-join of the model's table
+on itself, the cache is off by default: only enable it where resolving the
+saved queries was measured to cost more than the semi-join.
+
+Entries are keyed by the filter id, and stamped with the query, model,
+database and migration state ("schema version") they were compiled for,
+along with the settings affecting compilation: an entry compiled for another
+stamp is stale, and the query is compiled again. Entries are dropped when the
+filter is saved or deleted (see ``apps.AdvancedFiltersConfig.ready``).
+
+Settings:
+
+ADVANCED_FILTERS_SQL_CACHE_SIZE
+    Maximum number of compiled queries kept per process (default 0, which
+    disables caching, filtering by the query itself).
+ADVANCED_FILTERS_SQL_CACHE_BACKEND
+    Optional alias of a Django cache (from ``CACHES``) to store compiled
+    queries in instead of the process-local LRU.
+"""
+from functools import lru_cache
+import hashlib
+import logging
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.expressions import RawSQL
+
+from .query_cache import LRUStore, query_digest
+from .query_compiler import compile_query, filter_queryset
+
+logger = logging.getLogger('advanced_filters.sql_cache')
+
+DEFAULT_CACHE_SIZE = 0
+CACHE_KEY_PREFIX = 'advanced_filters:sql:'
+
+
+@lru_cache(maxsize=None)
+def get_schema_version():
+    """A digest of the latest migrations of all apps (on disk)"""
+    from django.db.migrations.loader import MigrationLoader
+
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    leaves = sorted(loader.graph.leaf_nodes())
+    return hashlib.md5(repr(leaves).encode('utf-8')).hexdigest()
+
+
+class UnparenthesizedSQL(RawSQL):
+    """
+    Raw SQL left unparenthesized, as the IN lookup of Django < 3.0 adds the
+    parentheses of the subquery whatever RawSQL has
+    """
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+if django.VERSION < (3, 0):
+    CompiledSQL = UnparenthesizedSQL
+else:
+    CompiledSQL = RawSQL
+
+
+class SQLStore(LRUStore):
+    # entries are checked against their stamp instead
+    timeout = None
+
+    @property
+    def maxsize(self):
+        return getattr(settings, 'ADVANCED_FILTERS_SQL_CACHE_SIZE',
+                       DEFAULT_CACHE_SIZE)
+
+
+class SQLCache:
+    """
+    Compiled SQL of saved filter queries, entries are
+    ``(stamp, sql, params)`` tuples keyed by the filter's primary key.
+    """
+    def __init__(self):
+        self._local = SQLStore()
+
+    @property
+    def enabled(self):
+        return bool(getattr(settings, 'ADVANCED_FILTERS_SQL_CACHE_SIZE',
+                            DEFAULT_CACHE_SIZE))
+
+    @property
+    def _store(self):
+        alias = getattr(settings, 'ADVANCED_FILTERS_SQL_CACHE_BACKEND', None)
+        if alias:
+            return caches[alias]
+        return self._local
+
+    @staticmethod
+    def _key(pk):
+        return f'{CACHE_KEY_PREFIX}{pk}'
+
+    @staticmethod
+    def get_stamp(model, using, query):
+        return (query_digest(repr(query)), model._meta.label, using,
+                get_schema_version(),
+                getattr(settings, 'ADVANCED_FILTERS_EXISTS_SUBQUERIES', True))
+
+    @staticmethod
+    def compile(model, using, query):
+        """The SQL (and parameters) selecting the pks of model matching query"""
+        pks = model._base_manager.db_manager(using).filter(
+            compile_query(model, query)).order_by().values('pk')
+        return pks.query.get_compiler(using=using).as_sql()
+
+    def filter(self, queryset, filter_id, query):
+        """
+        Filter queryset by the query of the saved filter filter_id, using its
+        cached SQL when up to date
+        """
+        if not self.enabled or filter_id is None:
+            return filter_queryset(queryset, query)
+        model, using = queryset.model, queryset.db
+        stamp = self.get_stamp(model, using, query)
+        key = self._key(filter_id)
+        entry = self._store.get(key)
+        if entry is not None and entry[0] == stamp:
+            sql, params = entry[1], entry[2]
+        else:
+            if entry is not None:
+                logger.debug('Recompiling stale SQL of filter %s', filter_id)
+            sql, params = self.compile(model, using, query)
+            self._store.set(key, (stamp, sql, tuple(params)))
+        return queryset.filter(pk__in=CompiledSQL(sql, params))
+
+    def invalidate(self, pk):
+        if pk is None:
+            return
+        self._local.delete(self._key(pk))
+        alias = getattr(settings, 'ADVANCED_FILTERS_SQL_CACHE_BACKEND', None)
+        if alias:
+            caches[alias].delete(self._key(pk))
+
+    def clear(self):
+        """Clear the process-local entries (shared backends are left as is)"""
+        self._local.clear()
+
+
+sql_cache = SQLCache()
+
+
+def invalidate_cached_sql(sender, instance, **kwargs):
+    """post_save/post_delete receiver dropping the filter's compiled SQL"""
+    sql_cache.invalidate(instance.pk)
+
+
+def clear_schema_version(**kwargs):
+    """setting_changed receiver, i.e: of MIGRATION_MODULES"""
+    get_schema_version.cache_clear()
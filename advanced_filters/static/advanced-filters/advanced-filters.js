@@ -63,6 +63,34 @@ var OperatorHandlers = function($) {
 		}
 	};
 
+	self.choices = {};
+
+	self.prefetch_choices = function(callback) {
+		// fetch choices of all the fields used by rows in a single request
+		var fields = [];
+		$('.form-row select.query-field').each(function() {
+			var field = $(this).val();
+			if (field && field != "_OR" && !self.choices.hasOwnProperty(field) &&
+					$.inArray(field, fields) < 0) {
+				fields.push(field);
+			}
+		});
+		if (fields.length < 2) {
+			callback();
+			return;
+		}
+		var batch_url = ADVANCED_FILTER_CHOICES_LOOKUP_URL + (FORM_MODEL ||
+						MODEL_LABEL) + '/';
+		$.get(batch_url, $.param({'field': fields}, true), function(data) {
+			$.each(data.results, function(field, results) {
+				self.choices[field] = {
+					'results': results,
+					'lazy': $.inArray(field, data.lazy || []) >= 0
+				};
+			});
+		}).always(callback);
+	};
+
 	self.initialize_select2 = function(elm) {
 		// initialize select2 widget and populate field choices
 		var field = $(elm).val();
@@ -70,10 +98,41 @@ var OperatorHandlers = function($) {
 						  MODEL_LABEL) + '/' + field + '/';
 		var input = $(elm).parents('tr').find('input.query-value');
 		input.select2("destroy");
+		if (self.choices.hasOwnProperty(field)) {
+			self.apply_choices(input, choices_url, self.choices[field]);
+			return;
+		}
 		$.get(choices_url, function(data) {
-			input.select2({'data': data, 'createSearchChoice': function(term) {
-                return { 'id': term, 'text': term };
-            }});
+			self.apply_choices(input, choices_url, data);
+		});
+	};
+
+	self.apply_choices = function(input, choices_url, data) {
+		var create_choice = function(term) {
+			return { 'id': term, 'text': term };
+		};
+		if (!data.lazy) {
+			input.select2({'data': data, 'createSearchChoice': create_choice});
+			return;
+		}
+		// too many choices to list: search them as the user types
+		input.select2({
+			'minimumInputLength': 1,
+			'createSearchChoice': create_choice,
+			'initSelection': function(element, callback) {
+				callback(create_choice(element.val()));
+			},
+			'ajax': {
+				'url': choices_url,
+				'dataType': 'json',
+				'quietMillis': 250,
+				'data': function(term, page) {
+					return {'term': term, 'page': page};
+				},
+				'results': function(data, page) {
+					return data;
+				}
+			}
 		});
 	};
 
@@ -127,8 +186,15 @@ var OperatorHandlers = function($) {
 				$(this).data('pre_change', $(this).val());
 			}).change();
 		});
-		self.field_selected($('.form-row select.query-field').first());
-
+		self.prefetch_choices(function() {
+			var fields = $('.form-row select.query-field');
+			self.field_selected(fields.first());
+			fields.slice(1).each(function() {
+				if ($(this).val() && $(this).val() != "_OR") {
+					self.initialize_select2(this);
+				}
+			});
+		});
 	};
 
 	self.destroy = function() {
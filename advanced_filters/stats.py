@@ -0,0 +1,156 @@
+"""
+Execution statistics of saved filters, as applied to admin changelists.
+
+Executions are recorded in a per-process buffer, which is flushed to the
+``AdvancedFilter`` rows (execution count, cumulative and 95th percentile
+time, last use and result count) in bulk, every
+``ADVANCED_FILTERS_STATS_FLUSH_INTERVAL`` seconds, rather than writing them
+on every request. Flushes run in a background thread of the process, so that
+requests don't wait for them (nor for the row locks they take), and which
+stops once there is nothing left to flush.
+
+Counters are incremented by the database, and the rows are locked while their
+recent times are merged, so that processes flushing the same filters don't
+overwrite each other's executions. The 95th percentile is computed over the
+latest ``ADVANCED_FILTERS_STATS_SAMPLES`` executions of a filter.
+
+Settings:
+
+ADVANCED_FILTERS_STATS
+    Whether to record statistics (default False).
+ADVANCED_FILTERS_STATS_FLUSH_INTERVAL
+    Seconds between flushes of the buffer (default 60).
+ADVANCED_FILTERS_STATS_SAMPLES
+    Number of execution times kept per filter (default 100).
+"""
+import atexit
+import json
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger('advanced_filters.stats')
+
+DEFAULT_FLUSH_INTERVAL = 60
+DEFAULT_SAMPLES = 100
+
+
+def percentile(values, fraction):
+    """The nearest-rank percentile of values, i.e: fraction 0.95 for p95"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class StatsBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executions = {}
+        self._flusher = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'ADVANCED_FILTERS_STATS', False)
+
+    def record(self, filter_id, elapsed, count=None):
+        """
+        Buffer an execution of filter filter_id which took elapsed seconds
+        and matched count objects (None if unknown), to be flushed by the
+        background flusher (started if it isn't running).
+        """
+        if not self.enabled:
+            return
+        try:
+            filter_id = int(filter_id)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._executions.setdefault(filter_id, []).append(
+                (elapsed, count, timezone.now()))
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name='advanced-filters-stats',
+                    daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        """Flush the buffer every flush interval, until it stays empty"""
+        while True:
+            time.sleep(getattr(
+                settings, 'ADVANCED_FILTERS_STATS_FLUSH_INTERVAL',
+                DEFAULT_FLUSH_INTERVAL))
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed flushing filter statistics')
+            finally:
+                # the connections of this thread would be left open otherwise
+                connections.close_all()
+            with self._lock:
+                if not self._executions:
+                    # the next recorded execution starts another flusher
+                    self._flusher = None
+                    return
+
+    def clear(self):
+        with self._lock:
+            self._executions = {}
+
+    def flush(self):
+        """Write buffered executions to their filters, return their number"""
+        from .models import AdvancedFilter
+
+        with self._lock:
+            executions, self._executions = self._executions, {}
+        if not executions:
+            return 0
+
+        samples = getattr(settings, 'ADVANCED_FILTERS_STATS_SAMPLES',
+                          DEFAULT_SAMPLES)
+        try:
+            with transaction.atomic():
+                # lock the rows (in a consistent order) until their recent
+                # times are merged, as other processes flush them too
+                filters = list(AdvancedFilter.objects.select_for_update().filter(
+                    pk__in=executions).only('pk', 'recent_times').order_by('pk'))
+                for afilter in filters:
+                    entries = executions[afilter.pk]
+                    times = [elapsed for elapsed, _, _ in entries]
+                    counts = [count for _, count, _ in entries
+                              if count is not None]
+                    afilter.executions = F('executions') + len(entries)
+                    afilter.total_time = F('total_time') + sum(times)
+                    recent_times = (
+                        afilter.get_recent_times() + times)[-samples:]
+                    afilter.recent_times = json.dumps(recent_times)
+                    afilter.p95_time = percentile(recent_times, 0.95)
+                    afilter.last_used_at = entries[-1][2]
+                    afilter.last_count = (
+                        counts[-1] if counts else F('last_count'))
+                AdvancedFilter.objects.bulk_update(filters, [
+                    'executions', 'total_time', 'recent_times', 'p95_time',
+                    'last_used_at', 'last_count'])
+        except DatabaseError as e:
+            # statistics aren't worth failing a request for
+            logger.warning('Failed flushing filter statistics: %s', e)
+            return 0
+        return sum(len(entries) for entries in executions.values())
+
+
+stats_buffer = StatsBuffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    if stats_buffer.enabled:
+        try:
+            stats_buffer.flush()
+        except Exception:  # i.e: the database is gone already
+            pass
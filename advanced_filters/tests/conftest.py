@@ -0,0 +1,11 @@
+import pytest
+
+from ..query_cache import query_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_query_cache():
+    """Rolled back test transactions don't send post_delete signals"""
+    query_cache.clear()
+    yield
+    query_cache.clear()
@@ -1,6 +1,8 @@
 import pytest
-from django.contrib.auth.models import Permission
+from django.contrib.auth.models import Group, Permission
+from django.db import connection
 from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from advanced_filters.models import AdvancedFilter
@@ -53,3 +55,51 @@ def test_create_page_disabled(client, user):
     res = client.get(url)
     assert res.status_code == 403
     assert AdvancedFilter.objects.count() == 0
+
+
+def test_change_page_queries_constant(client, user, advanced_filter):
+    user.user_permissions.add(Permission.objects.get(codename="change_advancedfilter"))
+    advanced_filter.users.add(user)
+    url = reverse(URL_NAME_CHANGE, args=(advanced_filter.pk,))
+
+    def get_queries():
+        with CaptureQueriesContext(connection) as ctx:
+            res = client.get(url)
+        assert res.status_code == 200
+        return [q["sql"] for q in ctx.captured_queries]
+
+    def sharing_checks(queries):
+        return [sql for sql in queries
+                if "advanced_filters_advancedfilter_users" in sql]
+
+    get_queries()  # i.e: the first request updates the session
+    queries = get_queries()
+    # besides fetching the filter (through get_queryset), access to it is
+    # checked once, by an EXISTS query, rather than listing shared filters
+    checks = sharing_checks(queries)
+    assert len(checks) == 2
+    exists = [sql for sql in checks
+              if sql.startswith(("SELECT 1 AS", "SELECT (1) AS"))]
+    assert len(exists) == 1
+    pk_lookup = '"advanced_filters_advancedfilter"."id" = %d' % advanced_filter.pk
+    assert all(pk_lookup in sql for sql in checks)
+
+    for i in range(20):
+        other = AdvancedFilterFactory.build(created_by=user, title=f"f{i}")
+        other.query = Q(email__iexact="a@a.com")
+        other.save()
+        other.users.add(user)
+    more_queries = get_queries()
+    assert len(more_queries) == len(queries)
+    assert sharing_checks(more_queries) == checks
+
+
+def test_change_page_shared_by_group(client, user, advanced_filter):
+    user.user_permissions.add(Permission.objects.get(codename="change_advancedfilter"))
+    url = reverse(URL_NAME_CHANGE, args=(advanced_filter.pk,))
+    assert client.get(url).status_code == 302  # not visible to user
+
+    group = Group.objects.create(name="reps")
+    user.groups.add(group)
+    advanced_filter.groups.add(group)
+    assert client.get(url).status_code == 200
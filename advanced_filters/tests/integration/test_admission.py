@@ -0,0 +1,115 @@
+import pytest
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+
+from advanced_filters.admission import heavy_filter_slots
+from advanced_filters.models import AdvancedFilter
+from advanced_filters.tests.factories import AdvancedFilterFactory
+from tests.factories import ClientFactory
+
+URL_CLIENT_CHANGELIST = reverse_lazy("admin:customers_client_changelist")
+
+
+@pytest.fixture(autouse=True)
+def setup(user):
+    user.user_permissions.add(Permission.objects.get(codename="change_client"))
+    ClientFactory.create_batch(3, assigned_to=user, email="a@example.com")
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def search_filter(user):
+    # one unindexed text search, cost 5
+    af = AdvancedFilterFactory.build(created_by=user, title="Example")
+    af.query = Q(email__icontains="example")
+    af.save()
+    af.users.add(user)
+    return af
+
+
+def get_changelist(client, afilter):
+    res = client.get(URL_CLIENT_CHANGELIST, {"_afilter": afilter.pk})
+    assert res.status_code == 200
+    return res, res.content.decode("utf-8")
+
+
+def test_admitted(client, settings, search_filter):
+    settings.ADVANCED_FILTERS_MAX_COST = 5
+    res, _ = get_changelist(client, search_filter)
+    assert res.context_data["cl"].result_count == 3
+
+
+def test_rejected(client, settings, search_filter):
+    settings.ADVANCED_FILTERS_MAX_COST = 4
+    res, content = get_changelist(client, search_filter)
+    assert res.context_data["cl"].result_count == 0
+    assert "This filter is too expensive to run: its cost of 5" in content
+
+
+def test_materialized(client, settings, user, search_filter):
+    user.user_permissions.add(
+        Permission.objects.get(codename="change_advancedfilter"))
+    settings.ADVANCED_FILTERS_MAX_COST = 4
+    settings.ADVANCED_FILTERS_HEAVY_FILTERS = "materialize"
+    res, content = get_changelist(client, search_filter)
+    assert res.context_data["cl"].result_count == 0
+    assert "scheduled refresh_advanced_filters command" in content
+    assert AdvancedFilter.objects.get(pk=search_filter.pk).materialize
+
+    # already queued, the filter isn't updated again
+    with CaptureQueriesContext(connection) as queries:
+        get_changelist(client, search_filter)
+    assert not [q for q in queries if q["sql"].startswith("UPDATE")]
+
+    search_filter.refresh_from_db()
+    search_filter.refresh_snapshot()
+    res, _ = get_changelist(client, search_filter)
+    assert res.context_data["cl"].result_count == 3
+
+
+def test_materialize_requires_change_permission(client, settings,
+                                                search_filter):
+    settings.ADVANCED_FILTERS_MAX_COST = 4
+    settings.ADVANCED_FILTERS_HEAVY_FILTERS = "materialize"
+    with CaptureQueriesContext(connection) as queries:
+        res, content = get_changelist(client, search_filter)
+    assert "This filter is too expensive to run: its cost of 5" in content
+    assert not [q for q in queries if q["sql"].startswith("UPDATE")]
+    assert not AdvancedFilter.objects.get(pk=search_filter.pk).materialize
+
+
+def test_concurrency(client, settings, user, search_filter):
+    settings.ADVANCED_FILTERS_HEAVY_COST = 5
+    settings.ADVANCED_FILTERS_HEAVY_CONCURRENCY = 1
+    res, _ = get_changelist(client, search_filter)
+    assert res.context_data["cl"].result_count == 3
+    # the slot was released
+    assert cache.get(heavy_filter_slots.get_key(user)) == 0
+
+    # another heavy filter running
+    assert heavy_filter_slots.acquire(user)
+    res, content = get_changelist(client, search_filter)
+    assert res.context_data["cl"].result_count == 0
+    assert "Too many expensive filters are running for you" in content
+    assert cache.get(heavy_filter_slots.get_key(user)) == 1
+
+
+def test_slots_released_after_actions(client, settings, user, search_filter):
+    user.user_permissions.add(Permission.objects.get(codename="delete_client"))
+    settings.ADVANCED_FILTERS_HEAVY_COST = 5
+    settings.ADVANCED_FILTERS_HEAVY_CONCURRENCY = 1
+    url = "%s?_afilter=%s" % (URL_CLIENT_CHANGELIST, search_filter.pk)
+    selected = list(user.client_set.values_list("pk", flat=True))
+    for _ in range(3):
+        # the action filters the changelist's queryset again
+        res = client.post(url, {"action": "delete_selected", "index": 0,
+                                "_selected_action": selected})
+        assert res.status_code == 200
+        assert "Are you sure" in res.content.decode("utf-8")
+        assert cache.get(heavy_filter_slots.get_key(user)) == 0
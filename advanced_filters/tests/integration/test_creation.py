@@ -3,15 +3,49 @@ from django.contrib.auth.models import Permission
 from django.urls import reverse_lazy
 
 from advanced_filters.models import AdvancedFilter
+from tests.customers.admin import ClientAdmin
 
 URL_CLIENT_CHANGELIST = reverse_lazy("admin:customers_client_changelist")
+URL_CLIENT_FILTER_FORM = reverse_lazy("admin:customers_client_advanced_filter_form")
 
 
-def test_changelist_includes_form(user, settings, client):
+def test_changelist_links_to_form(user, settings, client):
     user.user_permissions.add(Permission.objects.get(codename="change_client"))
     settings.ADVANCED_FILTER_EDIT_BY_USER = False
     res = client.get(URL_CLIENT_CHANGELIST)
     assert res.status_code == 200
+    assert res.context_data["advanced_filters"] is None
+    response_content = res.content.decode("utf-8")
+    assert f'data-form-url="{URL_CLIENT_FILTER_FORM}"' in response_content
+    assert "Create advanced filter" not in response_content
+    assert "select2.min.js" not in response_content
+
+
+def test_form_fragment(user, client):
+    user.user_permissions.add(Permission.objects.get(codename="change_client"))
+    res = client.get(URL_CLIENT_FILTER_FORM)
+    assert res.status_code == 200
+    title = ["Create advanced filter"]
+    fields = ["First name", "Language", "Sales Rep"]
+    response_content = res.content.decode("utf-8")
+    for part in title + fields:
+        assert part in response_content
+    # only media missing from the changelist is loaded
+    assert "select2.min.js" in response_content
+    assert "jquery.magnific-popup.js" not in response_content
+    assert "jquery.min.js" not in response_content
+
+
+def test_form_fragment_requires_perms(client):
+    res = client.get(URL_CLIENT_FILTER_FORM)
+    assert res.status_code == 403
+
+
+def test_changelist_includes_form(user, client, monkeypatch):
+    monkeypatch.setattr(ClientAdmin, "advanced_filter_lazy_form", False)
+    user.user_permissions.add(Permission.objects.get(codename="change_client"))
+    res = client.get(URL_CLIENT_CHANGELIST)
+    assert res.status_code == 200
     title = ["Create advanced filter"]
     fields = ["First name", "Language", "Sales Rep"]
     response_content = res.content.decode("utf-8")
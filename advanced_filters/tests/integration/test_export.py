@@ -0,0 +1,102 @@
+import pytest
+from django.contrib.auth.models import Permission
+from django.db.models import Q
+from django.urls import reverse
+
+from advanced_filters.tests.factories import AdvancedFilterFactory
+from tests.factories import ClientFactory, SalesRepFactory
+
+URL_FILTER_CHANGELIST = "admin:advanced_filters_advancedfilter_changelist"
+
+
+def export_url(afilter):
+    return reverse("admin:customers_client_advanced_filter_export",
+                   args=[afilter.pk])
+
+
+@pytest.fixture(autouse=True)
+def clients(user):
+    user.user_permissions.add(Permission.objects.get(codename="view_client"))
+    ClientFactory.create_batch(2, assigned_to=user, language="en",
+                               first_name="Ann")
+    ClientFactory.create_batch(1, assigned_to=user, language="it")
+
+
+@pytest.fixture
+def english_filter(user):
+    af = AdvancedFilterFactory.build(created_by=user, title="English")
+    af.query = Q(language="en")
+    af.save()
+    af.users.add(user)
+    return af
+
+
+def content(res):
+    return b"".join(res.streaming_content).decode("utf-8")
+
+
+def test_export_csv(client, user, english_filter):
+    res = client.get(export_url(english_filter))
+    assert res.status_code == 200
+    assert res.streaming
+    assert res["Content-Type"] == "text/csv; charset=utf-8"
+    assert res["Content-Disposition"] == (
+        'attachment; filename="client-%d.csv"' % english_filter.pk)
+    lines = content(res).splitlines()
+    assert lines[0] == "id,language,first_name,assigned_to__email"
+    assert len(lines) == 3
+    assert lines[1].endswith(",en,Ann,%s" % user.email)
+
+
+def test_export_jsonl_columns(client, english_filter):
+    res = client.get(export_url(english_filter),
+                     {"format": "jsonl", "columns": "first_name"})
+    assert res["Content-Type"] == "application/x-ndjson; charset=utf-8"
+    assert content(res) == '{"first_name": "Ann"}\n' * 2
+
+
+def test_invalid_requests(client, english_filter):
+    url = export_url(english_filter)
+    assert client.get(url, {"format": "xml"}).status_code == 400
+    assert client.get(url, {"columns": "password"}).status_code == 400
+
+
+def test_filter_not_shared(client, english_filter):
+    other = AdvancedFilterFactory.build(created_by=SalesRepFactory(
+        username="other"))
+    other.query = Q(language="en")
+    other.save()
+    assert client.get(export_url(other)).status_code == 404
+
+
+def test_too_expensive(client, settings, english_filter):
+    settings.ADVANCED_FILTERS_MAX_COST = -1
+    res = client.get(export_url(english_filter))
+    assert res.status_code == 302
+    res = client.get(res.url)
+    assert "This filter is too expensive to export" in res.content.decode()
+
+
+def test_export_action(client, user, english_filter):
+    user.is_superuser = True
+    user.save()
+    url = reverse(URL_FILTER_CHANGELIST)
+    res = client.post(url, {"action": "export_results",
+                            "_selected_action": [english_filter.pk]})
+    assert res.status_code == 302
+    assert res.url == export_url(english_filter)
+
+    other = AdvancedFilterFactory.build(created_by=user)
+    other.query = Q(language="it")
+    other.save()
+    res = client.post(url, {"action": "export_results",
+                            "_selected_action": [english_filter.pk, other.pk]},
+                      follow=True)
+    assert "Select a single filter to export its results." in (
+        res.content.decode())
+
+
+def test_changelist_link(client, english_filter):
+    res = client.get(reverse("admin:customers_client_changelist"),
+                     {"_afilter": english_filter.pk})
+    assert 'href="%s"' % export_url(english_filter) in res.content.decode()
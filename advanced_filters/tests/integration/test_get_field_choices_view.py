@@ -4,10 +4,14 @@ from operator import itemgetter
 
 import factory
 import pytest
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.encoding import force_str
 
+from advanced_filters.choices_cache import choices_cache
+from advanced_filters.views import GetFieldChoices
+from tests.customers.models import Client
 from tests.factories import ClientFactory
 
 URL_NAME = "afilters_get_field_choices"
@@ -21,6 +25,10 @@ def assert_json(content, expect):
     assert parse_json(content) == expect
 
 
+def cache_control(response):
+    return {d.strip() for d in response["Cache-Control"].split(",")}
+
+
 def assert_view_error(client, error, exception=None, **view_kwargs):
     """Ensure view either raises exception or returns a 400 json error"""
     view_url = reverse(URL_NAME, kwargs=view_kwargs)
@@ -106,7 +114,7 @@ def test_more_than_max_database_choices(user, client, settings):
     ClientFactory.create_batch(5, assigned_to=user)
     view_url = reverse(URL_NAME, kwargs=dict(model="customers.Client", field_name="id"))
     response = client.get(view_url)
-    assert_json(response.content, {"results": []})
+    assert_json(response.content, {"results": [], "lazy": True})
 
 
 def test_distinct_database_choices(user, client, settings):
@@ -148,3 +156,170 @@ def test_choices_has_null(user, client, settings):
         response.content,
         {"results": [{"id": name, "text": str(name)} for name in names]},
     )
+
+
+def test_database_choices_single_query(db, user, django_assert_num_queries):
+    ClientFactory.create_batch(5, assigned_to=user)
+    field = Client._meta.get_field("email")
+    with django_assert_num_queries(1):
+        values = GetFieldChoices.get_distinct_values(Client, field, 5)
+    assert len(values) == 5
+    with django_assert_num_queries(1):
+        assert GetFieldChoices.get_distinct_values(Client, field, 4) is None
+
+
+def test_search_database_choices(user, client, settings):
+    settings.ADVANCED_FILTERS_MAX_CHOICES = 4
+    emails = ["foo%d@bar.com" % i for i in range(5)]
+    ClientFactory.create_batch(
+        5, assigned_to=user, email=factory.Iterator(emails))
+    ClientFactory(assigned_to=user, email="baz@bar.com")
+    view_url = reverse(
+        URL_NAME, kwargs=dict(model="customers.Client", field_name="email")
+    )
+    response = client.get(view_url, data={"term": "FOO", "page_size": 3})
+    assert_json(response.content, {
+        "results": [{"id": e, "text": e} for e in emails[:3]], "more": True})
+
+    response = client.get(
+        view_url, data={"term": "FOO", "page_size": 3, "page": 2})
+    assert_json(response.content, {
+        "results": [{"id": e, "text": e} for e in emails[3:]], "more": False})
+
+
+def test_search_choices(client):
+    view_url = reverse(
+        URL_NAME, kwargs=dict(model="customers.Client", field_name="language")
+    )
+    response = client.get(view_url, data={"term": "ish"})
+    assert_json(response.content, {
+        "results": [{"id": "en", "text": "English"},
+                    {"id": "sp", "text": "Spanish"}], "more": False})
+
+
+def test_search_relation_field(three_clients, client):
+    view_url = reverse(
+        URL_NAME, kwargs=dict(model="customers.Client", field_name="assigned_to")
+    )
+    response = client.get(view_url, data={"term": "c"})
+    assert response.status_code == 400
+    assert_json(response.content, {
+        "error": "Cannot search relation field assigned_to, search one of the "
+                 "fields of reps.SalesRep instead"})
+
+    view_url = reverse(URL_NAME, kwargs=dict(
+        model="customers.Client", field_name="assigned_to__email"))
+    response = client.get(view_url, data={"term": "c"})
+    assert response.status_code == 200
+
+
+def test_search_disabled_field(three_clients, client, settings):
+    settings.ADVANCED_FILTERS_DISABLE_FOR_FIELDS = ("email",)
+    view_url = reverse(
+        URL_NAME, kwargs=dict(model="customers.Client", field_name="email")
+    )
+    response = client.get(view_url, data={"term": "c"})
+    assert_json(response.content, {"results": [], "more": False})
+
+
+def test_static_choices_cache_headers(client):
+    view_url = reverse(
+        URL_NAME, kwargs=dict(model="customers.Client", field_name="language")
+    )
+    response = client.get(view_url)
+    assert cache_control(response) == {"max-age=300", "private"}
+    assert "Accept-Language" in response["Vary"]
+    etag = response["ETag"]
+
+    response = client.get(view_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+
+
+def test_database_choices_not_modified(three_clients, client, settings,
+                                       django_assert_num_queries):
+    settings.ADVANCED_FILTERS_CHOICES_CACHE = "default"
+    settings.ADVANCED_FILTERS_CHOICES_MAX_AGE = {"customers.Client.email": 60}
+    view_url = reverse(
+        URL_NAME, kwargs=dict(model="customers.Client", field_name="email")
+    )
+    response = client.get(view_url)
+    assert cache_control(response) == {"max-age=60", "private"}
+    etag = response["ETag"]
+
+    # only the session and user are queried
+    with django_assert_num_queries(2):
+        response = client.get(view_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    # saved unchanged, the recomputed choices keep their ETag
+    three_clients[0].save()
+    response = client.get(view_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    three_clients[0].email = "changed@foo.com"
+    three_clients[0].save()
+    response = client.get(view_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+def test_database_choices_changed_without_signals(three_clients, client,
+                                                  settings):
+    settings.ADVANCED_FILTERS_CHOICES_CACHE = "default"
+    view_url = reverse(
+        URL_NAME, kwargs=dict(model="customers.Client", field_name="email")
+    )
+    etag = client.get(view_url)["ETag"]
+    assert client.get(view_url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    # no signal is sent, the cached entry is served until it expires
+    Client.objects.filter(pk=three_clients[0].pk).update(email="new@foo.com")
+    assert client.get(view_url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    field = Client._meta.get_field("email")
+    cache.delete(choices_cache.get_key(Client, field, 254))
+    response = client.get(view_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert "new@foo.com" in force_str(response.content)
+
+
+BATCH_URL_NAME = "afilters_get_fields_choices"
+
+
+def test_batch_choices(user, client, settings, django_assert_num_queries):
+    ClientFactory.create_batch(2, assigned_to=user, email="foo@bar.com")
+    view_url = reverse(BATCH_URL_NAME, kwargs=dict(model="customers.Client"))
+    fields = ["language", "email", "assigned_to__email", "is_active", "baz"]
+    # session, user and one query per (non-static) field
+    with django_assert_num_queries(4):
+        response = client.get(view_url, data={"field": fields})
+    assert_json(response.content, {
+        "results": {
+            "language": [
+                {"id": "en", "text": "English"},
+                {"id": "it", "text": "Italian"},
+                {"id": "sp", "text": "Spanish"},
+            ],
+            "email": [{"id": "foo@bar.com", "text": "foo@bar.com"}],
+            "assigned_to__email": [{"id": user.email, "text": user.email}],
+            "is_active": [],
+        },
+        "errors": {"baz": "Client has no field named 'baz'"},
+    })
+
+    # fields with too many values are flagged, not disabled or empty ones
+    settings.ADVANCED_FILTERS_MAX_CHOICES = 1
+    ClientFactory(assigned_to=user, email="bar@foo.com")
+    response = client.get(view_url, data={"field": fields})
+    assert json.loads(response.content)["lazy"] == ["email"]
+
+
+def test_batch_choices_invalid(client):
+    view_url = reverse(BATCH_URL_NAME, kwargs=dict(model="customers.Client"))
+    response = client.get(view_url)
+    assert response.status_code == 400
+
+    view_url = reverse(BATCH_URL_NAME, kwargs=dict(model="foo.Bar"))
+    response = client.get(view_url, data={"field": "baz"})
+    assert_json(response.content, {"error": NO_APP_INSTALLED_ERROR})
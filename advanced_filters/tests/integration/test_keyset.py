@@ -0,0 +1,184 @@
+import datetime
+
+import pytest
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from django.utils import timezone
+
+from advanced_filters.paginator import (CURSOR_VAR, NEXT, KeysetPaginator,
+                                        decode_cursor, encode_cursor)
+from advanced_filters.tests.factories import AdvancedFilterFactory
+from tests.customers.admin import ClientAdmin
+from tests.customers.models import Client
+from tests.factories import ClientFactory
+
+URL_CLIENT_CHANGELIST = reverse_lazy("admin:customers_client_changelist")
+
+
+@pytest.fixture(autouse=True)
+def keyset(monkeypatch, user):
+    user.user_permissions.add(Permission.objects.get(codename="change_client"))
+    monkeypatch.setattr(ClientAdmin, "advanced_filter_keyset", True)
+    monkeypatch.setattr(ClientAdmin, "list_per_page", 2)
+    monkeypatch.setattr(ClientAdmin, "list_max_show_all", 2)
+
+
+@pytest.fixture
+def english_filter(user):
+    af = AdvancedFilterFactory.build(created_by=user)
+    af.query = Q(language="en")
+    af.save()
+    af.users.add(user)
+    return af
+
+
+@pytest.fixture
+def english_clients(user):
+    ClientFactory.create_batch(2, assigned_to=user, language="it")
+    return ClientFactory.create_batch(5, assigned_to=user, language="en")
+
+
+def get_changelist(client, url):
+    res = client.get(url)
+    assert res.status_code == 200
+    return res.context_data["cl"], res
+
+
+def pks(changelist):
+    return [obj.pk for obj in changelist.result_list]
+
+
+def test_cursor_round_trip():
+    keyset = [(Client._meta.get_field("last_name"), False),
+              (Client._meta.pk, False)]
+    cursor = encode_cursor(NEXT, ["Smith", 42])
+    assert "=" not in cursor
+    assert decode_cursor(cursor, keyset) == (NEXT, ["Smith", 42])
+    for invalid in ("garbage", encode_cursor(NEXT, [42]),
+                    encode_cursor("up", ["Smith", 42]),
+                    encode_cursor(NEXT, ["Smith", "x"])):
+        with pytest.raises(ValueError):
+            decode_cursor(invalid, keyset)
+
+
+def test_get_keyset():
+    def get_keyset(*ordering):
+        queryset = Client.objects.order_by(*ordering)
+        keyset = KeysetPaginator(queryset, 2).get_keyset()
+        return keyset and [(f.name, desc) for f, desc in keyset]
+
+    assert get_keyset("pk") == [("id", False)]
+    assert get_keyset("-pk") == [("id", True)]
+    assert get_keyset("last_name") == [("last_name", False), ("id", False)]
+    assert get_keyset("-last_name", "-id") == [
+        ("last_name", True), ("id", True)]
+    # nullable, related or computed orderings are paged by offset
+    assert get_keyset("first_name") is None
+    assert get_keyset("assigned_to") is None
+    assert get_keyset("assigned_to__email") is None
+
+
+def test_datetime_ordering(user):
+    start = timezone.now()
+    clients = [ClientFactory(assigned_to=user, date_joined=start +
+                             datetime.timedelta(microseconds=i))
+               for i in range(6)]
+    queryset = Client.objects.order_by("date_joined", "pk")
+    seen, cursor = [], None
+    for _ in range(len(clients)):
+        paginator = KeysetPaginator(queryset, 2, cursor=cursor)
+        seen += [obj.pk for obj in paginator.page(1)]
+        cursor = paginator.next_cursor
+        if cursor is None:
+            break
+    assert seen == [c.pk for c in clients]
+
+
+def test_pages_by_cursor(client, english_filter, english_clients):
+    expected = sorted((c.pk for c in english_clients), reverse=True)
+    url = "%s?_afilter=%s" % (URL_CLIENT_CHANGELIST, english_filter.pk)
+    changelist, res = get_changelist(client, url)
+    assert changelist.paginator.keyset
+    assert changelist.result_count == 5
+    assert pks(changelist) == expected[:2]
+    assert changelist.keyset_previous_url is None
+    assert "5 clients" in res.content.decode("utf-8")
+
+    pages = [pks(changelist)]
+    while changelist.keyset_next_url:
+        assert CURSOR_VAR in changelist.keyset_next_url
+        with CaptureQueriesContext(connection) as queries:
+            changelist, res = get_changelist(
+                client, URL_CLIENT_CHANGELIST + changelist.keyset_next_url)
+        selects = [q["sql"] for q in queries.captured_queries
+                   if '"customers_client"."language"' in q["sql"]]
+        assert selects and not any("OFFSET" in sql for sql in selects)
+        pages.append(pks(changelist))
+    assert pages == [expected[:2], expected[2:4], expected[4:]]
+
+    # and back
+    changelist, _ = get_changelist(
+        client, URL_CLIENT_CHANGELIST + changelist.keyset_previous_url)
+    assert pks(changelist) == expected[2:4]
+    assert changelist.keyset_next_url
+    changelist, _ = get_changelist(
+        client, URL_CLIENT_CHANGELIST + changelist.keyset_previous_url)
+    assert pks(changelist) == expected[:2]
+    assert changelist.keyset_previous_url is None
+
+    # other links start over from the first page
+    assert CURSOR_VAR not in changelist.get_query_string({"o": "2"})
+
+
+def test_bounded_count(client, monkeypatch, english_filter, english_clients):
+    cache.clear()
+    monkeypatch.setattr(ClientAdmin, "advanced_filter_count_limit", 2)
+    url = "%s?_afilter=%s" % (URL_CLIENT_CHANGELIST, english_filter.pk)
+    with CaptureQueriesContext(connection) as queries:
+        changelist, res = get_changelist(client, url)
+    assert changelist.paginator.keyset
+    assert not changelist.paginator.exact
+    assert "2+ clients" in res.content.decode("utf-8")
+    # the filtered objects aren't all counted
+    counts = [q["sql"] for q in queries.captured_queries
+              if "COUNT(" in q["sql"] and
+              '"customers_client"."language"' in q["sql"]]
+    assert counts and all("LIMIT" in sql for sql in counts)
+
+
+def test_ordering_ties(client, user, english_filter):
+    for name in ("b", "a", "b", "a", "b"):
+        ClientFactory(assigned_to=user, language="en", last_name=name)
+    expected = list(Client.objects.filter(language="en").order_by(
+        "last_name", "-pk").values_list("pk", flat=True))
+    url = "?_afilter=%s&o=2" % english_filter.pk
+    seen = []
+    while url:
+        changelist, _ = get_changelist(client, URL_CLIENT_CHANGELIST + url)
+        assert changelist.paginator.keyset
+        seen += pks(changelist)
+        url = changelist.keyset_next_url
+    assert seen == expected
+
+
+def test_falls_back_to_offsets(client, english_filter, english_clients):
+    # first_name is nullable
+    changelist, _ = get_changelist(client, "%s?_afilter=%s&o=1&p=1" % (
+        URL_CLIENT_CHANGELIST, english_filter.pk))
+    assert not changelist.paginator.keyset
+    assert len(changelist.result_list) == 2
+
+    changelist, _ = get_changelist(client, "%s?_afilter=%s&%s=garbage" % (
+        URL_CLIENT_CHANGELIST, english_filter.pk, CURSOR_VAR))
+    assert changelist.paginator.keyset
+    assert pks(changelist) == sorted(
+        (c.pk for c in english_clients), reverse=True)[:2]
+
+
+def test_not_without_filter(client, english_clients):
+    changelist, _ = get_changelist(client, URL_CLIENT_CHANGELIST)
+    assert not isinstance(changelist.paginator, KeysetPaginator)
@@ -0,0 +1,109 @@
+import django
+import pytest
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db.models import Q
+from django.urls import reverse_lazy
+
+from advanced_filters.paginator import AdvancedFilterPaginator
+from advanced_filters.tests.factories import AdvancedFilterFactory
+from tests.customers.admin import ClientAdmin
+from tests.customers.models import Client
+from tests.factories import ClientFactory
+
+URL_CLIENT_CHANGELIST = reverse_lazy("admin:customers_client_changelist")
+
+
+@pytest.fixture(autouse=True)
+def bounded_count(monkeypatch, user):
+    user.user_permissions.add(Permission.objects.get(codename="change_client"))
+    monkeypatch.setattr(ClientAdmin, "advanced_filter_count", "bounded")
+    monkeypatch.setattr(ClientAdmin, "advanced_filter_count_limit", 5)
+    monkeypatch.setattr(ClientAdmin, "list_max_show_all", 5)
+    monkeypatch.setattr(ClientAdmin, "list_per_page", 2)
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def english_filter(user):
+    af = AdvancedFilterFactory.build(created_by=user)
+    af.query = Q(language="en")
+    af.save()
+    af.users.add(user)
+    return af
+
+
+def get_changelist(client, afilter, page=1):
+    # changelist pages are numbered from 0 before Django 3.0
+    if django.VERSION < (3, 0):
+        page -= 1
+    res = client.get(URL_CLIENT_CHANGELIST, {"_afilter": afilter.pk, "p": page})
+    assert res.status_code == 200
+    return res
+
+
+def test_bounded_count(client, user, english_filter):
+    ClientFactory.create_batch(8, assigned_to=user, language="en")
+    ClientFactory.create_batch(2, assigned_to=user, language="it")
+    res = get_changelist(client, english_filter)
+    paginator = res.context_data["cl"].paginator
+    assert not paginator.exact
+    assert paginator.count == 6
+    assert "5+ clients" in res.content.decode("utf-8")
+    assert len(res.context_data["cl"].result_list) == 2
+
+
+def test_exact_count_at_bound(client, user, english_filter):
+    ClientFactory.create_batch(8, assigned_to=user, language="en")
+    ClientFactory.create_batch(2, assigned_to=user, language="it")
+    # the last page of a bounded count requires the exact count
+    res = get_changelist(client, english_filter, page=3)
+    paginator = res.context_data["cl"].paginator
+    assert paginator.exact
+    assert paginator.count == 8
+    assert "8 clients" in res.content.decode("utf-8")
+
+    # which is then cached
+    ClientFactory.create_batch(2, assigned_to=user, language="en")
+    res = get_changelist(client, english_filter)
+    assert res.context_data["cl"].paginator.exact
+    assert res.context_data["cl"].paginator.count == 8
+    cache.clear()
+    res = get_changelist(client, english_filter)
+    assert not res.context_data["cl"].paginator.exact
+
+
+def test_exact_count_within_limit(client, user, english_filter):
+    ClientFactory.create_batch(3, assigned_to=user, language="en")
+    res = get_changelist(client, english_filter)
+    paginator = res.context_data["cl"].paginator
+    assert paginator.exact
+    assert paginator.count == 3
+    assert "3 clients" in res.content.decode("utf-8")
+
+
+def test_without_filter(client, user):
+    ClientFactory.create_batch(8, assigned_to=user, language="en")
+    res = client.get(URL_CLIENT_CHANGELIST)
+    paginator = res.context_data["cl"].paginator
+    assert not isinstance(paginator, AdvancedFilterPaginator)
+    assert paginator.count == 8
+
+
+def test_estimate_falls_back_to_bounded(db, user):
+    ClientFactory.create_batch(8, assigned_to=user, language="en")
+    paginator = AdvancedFilterPaginator(
+        Client.objects.order_by("pk"), 2, filter_id=1, mode="estimate",
+        limit=5)
+    assert paginator.count == 6
+    assert paginator.display_count == "5+"
+
+
+def test_invalid_page_number(client, user, english_filter):
+    ClientFactory.create_batch(8, assigned_to=user, language="en")
+    res = client.get(URL_CLIENT_CHANGELIST,
+                     {"_afilter": english_filter.pk, "p": "x"})
+    assert res.status_code == 200
+    assert not res.context_data["cl"].paginator.exact
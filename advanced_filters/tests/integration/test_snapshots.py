@@ -0,0 +1,94 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import Permission
+from django.core.management import CommandError, call_command
+from django.db.models import Q
+from django.urls import reverse_lazy
+
+from advanced_filters.models import AdvancedFilter
+from advanced_filters.tests.factories import AdvancedFilterFactory
+from tests.factories import ClientFactory
+
+URL_CLIENT_CHANGELIST = reverse_lazy("admin:customers_client_changelist")
+URL_FILTER_CHANGELIST = reverse_lazy("admin:advanced_filters_advancedfilter_changelist")
+
+
+@pytest.fixture
+def english_filter(user):
+    af = AdvancedFilterFactory.build(created_by=user, materialize=True)
+    af.query = Q(language="en")
+    af.save()
+    af.users.add(user)
+    return af
+
+
+@pytest.fixture
+def english_clients(user):
+    ClientFactory.create_batch(2, assigned_to=user, language="it")
+    return ClientFactory.create_batch(3, assigned_to=user, language="en")
+
+
+def snapshot_pks(afilter):
+    return sorted(int(pk) for pk in afilter.results.values_list("object_pk", flat=True))
+
+
+def test_refresh_snapshot(english_filter, english_clients):
+    assert english_filter.materialized_at is None
+    assert english_filter.refresh_snapshot(chunk_size=2) == 3
+    assert snapshot_pks(english_filter) == sorted(c.pk for c in english_clients)
+    english_filter.refresh_from_db()
+    assert english_filter.materialized_at is not None
+
+    # replaced by later snapshots
+    english_clients[0].delete()
+    assert english_filter.refresh_snapshot() == 2
+    assert snapshot_pks(english_filter) == sorted(c.pk for c in english_clients[1:])
+
+
+def test_changed_query_invalidates_snapshot(english_filter, english_clients):
+    english_filter.refresh_snapshot()
+    english_filter.query = Q(language="en")
+    assert english_filter.materialized_at is not None
+    english_filter.query = Q(language="it")
+    assert english_filter.materialized_at is None
+
+
+def test_changelist_uses_snapshot(client, user, english_filter, english_clients):
+    user.user_permissions.add(Permission.objects.get(codename="change_client"))
+    url = f"{URL_CLIENT_CHANGELIST}?_afilter={english_filter.pk}"
+    # filters are applied as usual until a snapshot is taken
+    res = client.get(url)
+    assert res.context_data["cl"].result_count == 3
+    assert "Snapshot taken" not in res.content.decode("utf-8")
+
+    english_filter.refresh_snapshot()
+    ClientFactory(assigned_to=user, language="en")
+    res = client.get(url)
+    assert sorted(c.pk for c in res.context_data["cl"].result_list) == sorted(
+        c.pk for c in english_clients)
+    assert "Snapshot taken" in res.content.decode("utf-8")
+
+
+def test_command(english_filter, english_clients):
+    other = AdvancedFilterFactory.build(
+        created_by=english_filter.created_by, materialize=False)
+    other.query = Q(language="it")
+    other.save()
+    out = StringIO()
+    call_command("refresh_advanced_filters", stdout=out)
+    assert out.getvalue() == f'Refreshed "{english_filter.title}" ({english_filter.pk}): 3 objects\n'
+    assert not other.results.exists()
+
+    with pytest.raises(CommandError):
+        call_command("refresh_advanced_filters", str(other.pk))
+
+
+def test_admin_action(client, user, english_filter, english_clients):
+    user.user_permissions.add(Permission.objects.get(codename="change_advancedfilter"))
+    user.user_permissions.add(Permission.objects.get(codename="view_advancedfilter"))
+    res = client.post(URL_FILTER_CHANGELIST, {
+        "action": "refresh_snapshots", "_selected_action": [english_filter.pk]})
+    assert res.status_code == 302
+    assert snapshot_pks(english_filter) == sorted(c.pk for c in english_clients)
+    assert AdvancedFilter.objects.get(pk=english_filter.pk).materialized_at
@@ -0,0 +1,78 @@
+import pytest
+from django.contrib.auth.models import Permission
+from django.db.models import Q
+from django.urls import reverse_lazy
+
+from advanced_filters.models import AdvancedFilter
+from advanced_filters.stats import stats_buffer
+from advanced_filters.tests.factories import AdvancedFilterFactory
+from tests.factories import ClientFactory
+
+URL_CLIENT_CHANGELIST = reverse_lazy("admin:customers_client_changelist")
+URL_FILTER_CHANGELIST = reverse_lazy(
+    "admin:advanced_filters_advancedfilter_changelist")
+
+
+@pytest.fixture(autouse=True)
+def stats(settings, user):
+    settings.ADVANCED_FILTERS_STATS = True
+    settings.ADVANCED_FILTERS_STATS_FLUSH_INTERVAL = 3600
+    user.user_permissions.add(Permission.objects.get(codename="change_client"))
+    stats_buffer.clear()
+    yield
+    stats_buffer.clear()
+
+
+@pytest.fixture
+def english_filter(user):
+    af = AdvancedFilterFactory.build(created_by=user)
+    af.query = Q(language="en")
+    af.save()
+    af.users.add(user)
+    return af
+
+
+def test_changelist_records_executions(client, user, english_filter):
+    ClientFactory.create_batch(3, assigned_to=user, language="en")
+    ClientFactory.create_batch(2, assigned_to=user, language="it")
+    for _ in range(2):
+        res = client.get(URL_CLIENT_CHANGELIST, {"_afilter": english_filter.pk})
+        assert res.status_code == 200
+    # not filtered by an advanced filter
+    client.get(URL_CLIENT_CHANGELIST)
+
+    assert stats_buffer.flush() == 2
+    english_filter.refresh_from_db()
+    assert english_filter.executions == 2
+    assert english_filter.total_time > 0
+    assert english_filter.p95_time > 0
+    assert english_filter.last_count == 3
+
+
+def test_rejected_not_recorded(client, user, settings):
+    # an unindexed text search, cost 5
+    af = AdvancedFilterFactory.build(created_by=user)
+    af.query = Q(email__icontains="example")
+    af.save()
+    af.users.add(user)
+    settings.ADVANCED_FILTERS_MAX_COST = 4
+    res = client.get(URL_CLIENT_CHANGELIST, {"_afilter": af.pk})
+    assert res.status_code == 200
+    assert "This filter is too expensive to run" in res.content.decode("utf-8")
+
+    assert stats_buffer.flush() == 0
+    af.refresh_from_db()
+    assert af.executions == 0
+
+
+def test_stats_columns(client, user, english_filter):
+    user.is_superuser = True
+    user.save()
+    AdvancedFilter.objects.filter(pk=english_filter.pk).update(
+        executions=4, total_time=0.5, p95_time=0.25)
+    res = client.get(URL_FILTER_CHANGELIST, {"o": "-6"})
+    assert res.status_code == 200
+    content = res.content.decode("utf-8")
+    assert "500.0 ms" in content
+    assert "250.0 ms" in content
+    assert res.context_data["cl"].get_ordering_field_columns() == {6: "desc"}
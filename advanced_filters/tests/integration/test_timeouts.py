@@ -0,0 +1,73 @@
+import pytest
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse_lazy
+
+from advanced_filters import timeouts
+from advanced_filters.models import AdvancedFilter
+from advanced_filters.tests.factories import AdvancedFilterFactory
+from tests.customers.admin import ClientAdmin
+from tests.factories import ClientFactory
+
+URL_CLIENT_CHANGELIST = reverse_lazy("admin:customers_client_changelist")
+
+pytestmark = pytest.mark.skipif(
+    connection.vendor != "sqlite", reason="interrupts SQLite statements")
+
+
+@pytest.fixture(autouse=True)
+def setup(monkeypatch, user):
+    user.user_permissions.add(Permission.objects.get(codename="change_client"))
+    # interrupt even the quickest of queries past their budget
+    monkeypatch.setattr(timeouts, "SQLITE_PROGRESS_STEPS", 1)
+    ClientFactory.create_batch(3, assigned_to=user, language="en")
+
+
+@pytest.fixture
+def english_filter(user):
+    af = AdvancedFilterFactory.build(created_by=user, title="English")
+    af.query = Q(language="en")
+    af.save()
+    af.users.add(user)
+    return af
+
+
+def test_filter_timeout(client, english_filter):
+    AdvancedFilter.objects.filter(pk=english_filter.pk).update(timeout=1e-9)
+    res = client.get(URL_CLIENT_CHANGELIST,
+                     {"_afilter": english_filter.pk, "o": "1"})
+    assert res.status_code == 302
+    assert res.url == "%s?o=1" % URL_CLIENT_CHANGELIST
+
+    english_filter.refresh_from_db()
+    assert english_filter.timeouts == 1
+    assert english_filter.last_timeout_at is not None
+
+    res = client.get(res.url)
+    assert res.status_code == 200
+    assert ("The advanced filter &quot;English&quot; was cancelled after "
+            "exceeding its time budget of 1e-09 seconds."
+            ) in res.content.decode("utf-8")
+
+
+def test_model_admin_timeout(client, monkeypatch, english_filter):
+    monkeypatch.setattr(ClientAdmin, "advanced_filter_timeout", 1e-9)
+    res = client.get(URL_CLIENT_CHANGELIST, {"_afilter": english_filter.pk})
+    assert res.status_code == 302
+
+    # the budget of the filter overrides that of the admin
+    english_filter.timeout = 60
+    english_filter.save()
+    res = client.get(URL_CLIENT_CHANGELIST, {"_afilter": english_filter.pk})
+    assert res.status_code == 200
+    assert len(res.context_data["cl"].result_list) == 3
+
+
+def test_setting_timeout(client, settings, english_filter):
+    settings.ADVANCED_FILTERS_TIMEOUT = 60
+    res = client.get(URL_CLIENT_CHANGELIST, {"_afilter": english_filter.pk})
+    assert res.status_code == 200
+    # unfiltered changelists are not budgeted
+    settings.ADVANCED_FILTERS_TIMEOUT = 1e-9
+    assert client.get(URL_CLIENT_CHANGELIST).status_code == 200
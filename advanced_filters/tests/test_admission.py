@@ -0,0 +1,79 @@
+import pytest
+from django.core.cache import cache
+from django.db.models import Q
+from tests.customers.models import Client
+from tests.factories import SalesRepFactory
+from tests.reps.models import SalesRep
+
+from ..admission import (FilterCost, HeavyFilterSlots, count_joins,
+                         count_unindexed_scans, estimate_cost)
+
+
+@pytest.mark.parametrize("query, joins", [
+    (Q(language="en"), 0),
+    (Q(assigned_to=1), 0),
+    (Q(assigned_to__email="a@b.com"), 1),
+    (Q(assigned_to__email="a@b.com") | Q(assigned_to__username="a"), 1),
+    (Q(assigned_to__groups__name="a"), 2),
+])
+def test_count_joins(query, joins):
+    assert count_joins(Client, query) == joins
+
+
+@pytest.mark.parametrize("query, scans", [
+    (Q(email__iexact="a@b.com"), 0),
+    (Q(first_name__iin=["a", "b"]), 0),
+    (Q(first_name__iregex="^(a|b)$"), 0),
+    (Q(first_name__iregex="(a|b)"), 1),
+    (Q(email__icontains="example"), 1),
+    (Q(first_name__iregex="^a.*") & Q(assigned_to__email__contains="b"), 2),
+])
+def test_count_unindexed_scans(query, scans):
+    assert count_unindexed_scans(Client, query) == scans
+
+
+def test_estimate_cost(db):
+    cost = estimate_cost(
+        SalesRep, Q(groups__name="a") & Q(email__icontains="b"),
+        SalesRep.objects.all())
+    assert cost == FilterCost(joins=1, multivalued_hops=1, unindexed_scans=1)
+    assert cost.score == 1 + 3 + 5
+
+
+def test_limits(settings):
+    cost = FilterCost(joins=1, multivalued_hops=0, unindexed_scans=1,
+                      planner_cost=1000.0)
+    assert not cost.too_expensive and not cost.heavy
+
+    settings.ADVANCED_FILTERS_HEAVY_COST = 6
+    assert cost.heavy and not cost.too_expensive
+
+    settings.ADVANCED_FILTERS_MAX_PLANNER_COST = 500
+    assert cost.get_excesses() == ['its planner cost of 1000 exceeds 500']
+    settings.ADVANCED_FILTERS_MAX_PLANNER_COST = None
+    settings.ADVANCED_FILTERS_MAX_COST = 5
+    assert len(cost.get_excesses()) == 1
+    settings.ADVANCED_FILTERS_HEAVY_COST = None
+    assert cost.heavy and cost.too_expensive
+
+
+def test_slots(db, settings):
+    cache.clear()
+    slots = HeavyFilterSlots()
+    user = SalesRepFactory(username="user")
+    other = SalesRepFactory(username="other")
+    # unlimited
+    assert all(slots.acquire(user) for _ in range(5))
+
+    settings.ADVANCED_FILTERS_HEAVY_CONCURRENCY = 2
+    cache.clear()
+    assert slots.acquire(user)
+    assert slots.acquire(user)
+    assert not slots.acquire(user)
+    assert slots.acquire(other)
+    slots.release(user)
+    assert slots.acquire(user)
+    cache.clear()
+    # releasing an expired slot is harmless
+    slots.release(user)
+    assert slots.acquire(user)
@@ -0,0 +1,84 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db.models import Q
+from tests.factories import ClientFactory, SalesRepFactory
+
+from .factories import AdvancedFilterFactory
+
+
+@pytest.fixture
+def user(db):
+    return SalesRepFactory()
+
+
+@pytest.fixture
+def filters(user):
+    ClientFactory.create_batch(3, assigned_to=user, language="en")
+    ClientFactory.create_batch(1, assigned_to=user, language="it")
+    english = AdvancedFilterFactory.build(title="english", created_by=user)
+    english.query = Q(language="en")
+    english.save()
+    broken = AdvancedFilterFactory.build(title="broken", created_by=user)
+    broken.query = Q(no_such_field="en")
+    broken.save()
+    return english, broken
+
+
+def run(*args):
+    out = StringIO()
+    call_command("benchmark_advanced_filters", *args, stdout=out)
+    return out.getvalue()
+
+
+def test_json_report(filters):
+    english, broken = filters
+    report = {entry["id"]: entry for entry in json.loads(
+        run("--format", "json", "--sort", "id"))}
+    assert list(report) == [english.pk, broken.pk]
+
+    assert report[english.pk]["rows"] == 3
+    assert report[english.pk]["time"] > 0
+    assert '"language" = en' in report[english.pk]["sql"]
+    assert report[english.pk]["explain"]
+    assert report[english.pk]["error"] is None
+
+    assert report[broken.pk]["rows"] is None
+    assert report[broken.pk]["error"].startswith("FieldError")
+
+
+def test_table_report(filters):
+    lines = run().splitlines()
+    assert lines[0].split() == ["id", "model", "rows", "time", "(ms)", "title"]
+    assert len(lines) == 3
+    assert "english" in lines[1]
+    assert "[FieldError" in lines[2]
+
+
+def test_budget(filters):
+    report = json.loads(run("--format", "json", "--budget", "0"))
+    # a budget of 0 is no budget
+    assert not any(entry["over_budget"] for entry in report)
+    report = json.loads(run("--format", "json", "--budget", "1e-9"))
+    assert all(entry["over_budget"] for entry in report)
+
+
+def test_baseline(filters, tmp_path):
+    english, _ = filters
+    baseline = tmp_path / "baseline.json"
+    run("--output", str(baseline))
+    # (timings of tiny queries are noisy)
+    assert run("--baseline", str(baseline), "--threshold", "1e6",
+               "--fail-on-regression")
+
+    entries = json.loads(baseline.read_text())
+    for entry in entries:
+        if entry["time"]:
+            entry["time"] = 1e-9
+    baseline.write_text(json.dumps(entries))
+    report = json.loads(run("--format", "json", "--baseline", str(baseline)))
+    assert [entry["id"] for entry in report if entry["regressed"]] == [english.pk]
+    with pytest.raises(CommandError, match="Filters regressed: %d" % english.pk):
+        run("--baseline", str(baseline), "--fail-on-regression")
@@ -0,0 +1,81 @@
+"""
+Benchmarks of queries run on every changelist, comparing their current
+implementation with the previous one. They populate thousands of rows, thus
+only run when the ADVANCED_FILTERS_BENCHMARK environment variable is set:
+
+    ADVANCED_FILTERS_BENCHMARK=1 pytest -s advanced_filters/tests/test_benchmarks.py
+"""
+import os
+import random
+import timeit
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models import Q
+import pytest
+
+from ..models import AdvancedFilter
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(not os.environ.get('ADVANCED_FILTERS_BENCHMARK'),
+                       reason='ADVANCED_FILTERS_BENCHMARK is not set'),
+]
+
+FILTERS = 5000
+GROUPS = 1000
+USERS = 200
+REPEAT = 20
+
+
+def report(name, timings):
+    best = min(timings) / REPEAT * 1000
+    print(f'\n{name}: {best:.3f}ms per query (best of {len(timings)})')
+    return best
+
+
+@pytest.fixture
+def populated():
+    rand = random.Random(0)
+    User = get_user_model()
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com')
+        for i in range(USERS))
+    groups = Group.objects.bulk_create(
+        Group(name=f'group{i}') for i in range(GROUPS))
+    filters = AdvancedFilter.objects.bulk_create(
+        AdvancedFilter(title=f'filter{i}', url='', b64_query='MQ==',
+                       created_by=users[0], model='customers.Client')
+        for i in range(FILTERS))
+
+    User.groups.through.objects.bulk_create(
+        User.groups.through(salesrep=user, group=group)
+        for user in users for group in rand.sample(groups, 10))
+    AdvancedFilter.users.through.objects.bulk_create(
+        AdvancedFilter.users.through(advancedfilter=afilter, salesrep=user)
+        for afilter in filters for user in rand.sample(users, 3))
+    AdvancedFilter.groups.through.objects.bulk_create(
+        AdvancedFilter.groups.through(advancedfilter=afilter, group=group)
+        for afilter in filters for group in rand.sample(groups, 5))
+    return users
+
+
+def test_filter_by_user(populated):
+    user = populated[0]
+
+    def joined():
+        return list(AdvancedFilter.objects.filter(
+            Q(users=user) | Q(groups__in=user.groups.all())).filter(
+            model='customers.Client').values_list('id', 'title'))
+
+    def subqueries():
+        return list(AdvancedFilter.objects.filter_by_user(user).filter(
+            model='customers.Client').values_list('id', 'title'))
+
+    # the joined query yields a filter per matching user/group row
+    assert sorted(set(joined())) == sorted(subqueries())
+    assert len(joined()) > len(subqueries())
+
+    before = report('OR-ed joins', timeit.repeat(joined, number=REPEAT))
+    after = report('IN subqueries', timeit.repeat(subqueries, number=REPEAT))
+    print(f'speedup: {before / after:.1f}x')
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+from tests.customers.models import Client
+from tests.factories import ClientFactory, SalesRepFactory
+
+from ..choices_cache import choices_cache
+from ..views import GetFieldChoices
+
+
+@pytest.fixture(autouse=True)
+def enable_cache(settings):
+    settings.ADVANCED_FILTERS_CHOICES_CACHE = "default"
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def email_field():
+    return Client._meta.get_field("email")
+
+
+def get_emails(field):
+    return choices_cache.get_or_set(
+        Client, field, 10,
+        lambda: GetFieldChoices.get_distinct_values(Client, field, 10))
+
+
+def test_cached(db, email_field, django_assert_num_queries):
+    ClientFactory.create_batch(2, assigned_to=SalesRepFactory())
+    with django_assert_num_queries(1):
+        emails = get_emails(email_field)
+    with django_assert_num_queries(0):
+        assert get_emails(email_field) == emails
+
+
+def test_invalidated_on_save_and_delete(db, email_field):
+    client = ClientFactory(assigned_to=SalesRepFactory(), email="a@b.com")
+    assert get_emails(email_field) == ["a@b.com"]
+    client.email = "c@d.com"
+    client.save()
+    assert get_emails(email_field) == ["c@d.com"]
+    client.delete()
+    assert get_emails(email_field) == []
+
+
+def test_timeout_per_field(settings, email_field):
+    settings.ADVANCED_FILTERS_CHOICES_CACHE_TIMEOUT = {
+        "customers.Client.email": 10, "customers.Client": 20, "default": 30}
+    assert choices_cache.get_timeout(Client, email_field) == 10
+    first_name = Client._meta.get_field("first_name")
+    assert choices_cache.get_timeout(Client, first_name) == 20
+    rep_model = Client._meta.get_field("assigned_to").related_model
+    assert choices_cache.get_timeout(
+        rep_model, rep_model._meta.get_field("email")) == 30
+
+
+def test_single_flight(email_field):
+    computed = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_compute():
+        computed.append(1)
+        started.set()
+        release.wait(5)
+        return ["a@b.com"]
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(
+        choices_cache.get_or_set(Client, email_field, 1, slow_compute)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(
+        choices_cache.get_or_set(Client, email_field, 1, slow_compute)))
+    second.start()
+    time.sleep(0.2)  # let the second caller wait on the lock
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert results == [["a@b.com"], ["a@b.com"]]
+    assert len(computed) == 1
+
+
+def test_disabled(settings, email_field):
+    settings.ADVANCED_FILTERS_CHOICES_CACHE = None
+    calls = []
+    for _ in range(2):
+        choices_cache.get_or_set(
+            Client, email_field, 1, lambda: calls.append(1))
+    assert len(calls) == 2
@@ -0,0 +1,47 @@
+import datetime
+import json
+
+from django.db.models import Q
+from tests.customers.models import Client
+from tests.factories import ClientFactory, SalesRepFactory
+
+from ..export import iter_csv, iter_export, iter_jsonl
+
+
+def test_iter_csv():
+    lines = list(iter_csv(["id", "name"], iter([(1, "a,b"), (2, 'say "hi"')])))
+    assert lines == ['id,name\r\n', '1,"a,b"\r\n', '2,"say ""hi"""\r\n']
+
+
+def test_iter_csv_escapes_formulas(settings):
+    rows = [(-1, "=HYPERLINK(\"http://x\")"), (2, "+1"), (3, "-a"),
+            (4, "@SUM(A1)"), (5, "a=b")]
+    lines = list(iter_csv(["id", "name"], iter(rows)))
+    assert lines[1:] == ['-1,"\'=HYPERLINK(""http://x"")"\r\n', "2,'+1\r\n",
+                         "3,'-a\r\n", "4,'@SUM(A1)\r\n", "5,a=b\r\n"]
+
+    settings.ADVANCED_FILTERS_EXPORT_ESCAPE_FORMULAS = False
+    lines = list(iter_csv(["id", "name"], iter(rows)))
+    assert lines[2] == "2,+1\r\n"
+
+
+def test_iter_jsonl():
+    lines = list(iter_jsonl(
+        ["id", "joined"], iter([(1, datetime.date(2020, 1, 2)), (2, None)])))
+    assert lines == ['{"id": 1, "joined": "2020-01-02"}\n',
+                     '{"id": 2, "joined": null}\n']
+
+
+def test_iter_export(db, django_assert_num_queries):
+    rep = SalesRepFactory(email="rep@example.com")
+    clients = ClientFactory.create_batch(5, assigned_to=rep, language="en")
+    queryset = Client.objects.filter(Q(language="en"))
+    # lazy until consumed
+    with django_assert_num_queries(0):
+        lines = iter_export(queryset, ["id", "assigned_to__email"], "jsonl",
+                            chunk_size=2)
+    # (SQLite fetches chunks from a single query)
+    with django_assert_num_queries(1):
+        rows = [json.loads(line) for line in lines]
+    assert rows == [{"id": client.pk, "assigned_to__email": "rep@example.com"}
+                    for client in clients]
@@ -1,15 +1,18 @@
 from datetime import datetime
 import time
+from unittest import mock
 
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.db.models import Q
 from django.core.exceptions import FieldDoesNotExist
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import translation
 import django
 
 import pytest
 
+from ..field_index import clear_field_indexes
 from ..models import AdvancedFilter
 from ..forms import AdvancedFilterQueryForm, AdvancedFilterForm
 
@@ -176,7 +179,7 @@ class TestQueryForm(TestCase):
             {'field': 'last_name', 'negate': False, 'operator': 'lte', 'value': 'r'},
             {'field': 'last_name', 'negate': False, 'operator': 'gt', 'value': 'b'},
             {'field': 'last_name', 'negate': False, 'operator': 'gte', 'value': 'c'},
-            {'field': 'email', 'negate': False, 'operator': 'iregex', 'value': r'^(foo|bar)$'}
+            {'field': 'email', 'negate': False, 'operator': 'iregex', 'value': 'foo,bar'}
         ]
         for i, field in enumerate(af.list_fields()):
             res = AdvancedFilterQueryForm._parse_query_dict(field, Rep)
@@ -205,12 +208,61 @@ class TestQueryForm(TestCase):
         dict(field='fname', value='john', operator='isfalse'),
         {'fname': False}
     ),
+    (
+        dict(bday='birthday', fname='first name'),
+        dict(field='fname', value='john, jane', operator='iregex'),
+        {'fname__iin': ['john', 'jane']}
+    ),
+    (
+        dict(bday='birthday', fname='first name'),
+        dict(field='fname', value='john', operator='iregex'),
+        {'fname__iin': ['john']}
+    ),
+    (
+        dict(bday='birthday', fname='first name'),
+        dict(field='fname', value='john+x@a.com, jane@b.com', operator='iregex'),
+        {'fname__iin': ['john+x@a.com', 'jane@b.com']}
+    ),
 ])
 def test_build_query_dict(data, fields, expected):
     form = AdvancedFilterQueryForm(fields, data=data)
     assert form._build_query_dict() == expected
 
 
+@pytest.mark.parametrize("data, valid", [
+    (dict(field='id', value='1, 2', operator='iregex'), True),
+    (dict(field='id', value='1, abc', operator='iregex'), False),
+    (dict(field='groups', value='1, abc', operator='iregex'), False),
+    (dict(field='email', value='a@b.com, ^x', operator='iregex'), True),
+])
+def test_one_of_values_validated(data, valid):
+    fields = dict(id='id', groups='groups', email='email')
+    form = AdvancedFilterQueryForm(fields, data=data, model=get_user_model())
+    assert form.is_valid() is valid
+    if not valid:
+        assert 'value' in form.errors
+
+
+@pytest.mark.parametrize("field, expected", [
+    ({'field': 'email__iin', 'value': ['foo', 'bar'], 'negate': False},
+     {'field': 'email', 'value': 'foo,bar', 'negate': False,
+      'operator': 'iregex'}),
+    ({'field': 'email__iregex', 'value': '^(foo|bar)$', 'negate': False},
+     {'field': 'email', 'value': 'foo,bar', 'negate': False,
+      'operator': 'iregex'}),
+    # legacy regexes searching the values are kept as is
+    ({'field': 'email__iregex', 'value': '(foo|bar)', 'negate': False},
+     {'field': 'email', 'value': '(foo|bar)', 'regex': '(foo|bar)',
+      'negate': False, 'operator': 'iregex'}),
+    ({'field': 'email__iregex', 'value': 'foo', 'negate': False},
+     {'field': 'email', 'value': 'foo', 'regex': 'foo', 'negate': False,
+      'operator': 'iregex'}),
+])
+def test_parse_one_of(field, expected):
+    assert AdvancedFilterQueryForm._parse_query_dict(
+        field, get_user_model()) == expected
+
+
 class CommonFormTest(TestCase):
     mgmg_form_data = {
         'form-TOTAL_FORMS': 1,
@@ -272,6 +324,25 @@ class TestAdvancedFilterForm(CommonFormTest):
         self._assert_query_content(new_instance.query,
                                    ['first_name__iexact', 'john'])
 
+    def test_resave_legacy_one_of(self):
+        self.af.query = Q(email__iregex='(foo|bar.com)')
+        data = self._create_query_form_data(data=dict(
+            field='email', value='(foo|bar.com)', operator='iregex'),
+            **{'form-INITIAL_FORMS': 1})
+        form = AdvancedFilterForm(data, instance=self.af,
+                                  filter_fields=['email'])
+        assert form.is_valid(), (form.errors, form.fields_formset.errors)
+        # unchanged, still searching the values
+        self._assert_query_content(form.save().query,
+                                   ['email__iregex', '(foo|bar.com)'])
+
+        data['form-0-value'] = 'foo@a.com, bar@b.com'
+        form = AdvancedFilterForm(data, instance=self.af,
+                                  filter_fields=['email'])
+        assert form.is_valid(), (form.errors, form.fields_formset.errors)
+        self._assert_query_content(form.save().query,
+                                   ['email__iin', ['foo@a.com', 'bar@b.com']])
+
     def test_remove_existing_query(self):
         # add new form (last name) and delete initial 1st form (for first name)
         updated_data = {'form-1-field': 'last_name', 'form-0-DELETE': True,
@@ -353,3 +424,83 @@ class TestAdminInitialization(CommonFormTest):
 
         # the message refers to the missing implementation
         assert 'Adding new AdvancedFilter from admin is not supported' in str(excinfo.value)
+
+
+class TestFieldIndex(CommonFormTest):
+    filter_fields = ('first_name', ('email', 'E-mail address'))
+
+    def setUp(self):
+        super().setUp()
+        clear_field_indexes()
+
+    def test_shared_by_forms(self):
+        data = self._create_query_form_data(
+            form_number=1, **{'form-TOTAL_FORMS': 2})
+        form = AdvancedFilterForm(data, instance=self.af,
+                                  filter_fields=self.filter_fields)
+        other = AdvancedFilterForm(data, instance=self.af,
+                                   filter_fields=self.filter_fields)
+        fields = [f.fields['field'] for f in
+                  form.fields_formset.forms + other.fields_formset.forms]
+        assert len(fields) == 4
+        assert all(f.choices is fields[0].choices for f in fields)
+        assert [c[0] for c in fields[0].choices] == [
+            'email', 'first_name', '_OR']
+        assert fields[0].valid_values == {'email', 'first_name', '_OR'}
+
+    def test_resolved_once(self):
+        with mock.patch.object(
+                AdvancedFilterForm, 'get_fields_from_model',
+                autospec=True, return_value={'first_name': 'first name'}
+        ) as get_fields:
+            for _ in range(3):
+                AdvancedFilterForm(instance=self.af,
+                                   filter_fields=self.filter_fields)
+            assert get_fields.call_count == 1
+            # other fields, or languages, have their own index
+            AdvancedFilterForm(instance=self.af, filter_fields=['last_name'])
+            with translation.override('es'):
+                AdvancedFilterForm(instance=self.af,
+                                   filter_fields=self.filter_fields)
+            assert get_fields.call_count == 3
+
+    def test_validation(self):
+        form = AdvancedFilterForm(
+            self._create_query_form_data(), instance=self.af,
+            filter_fields=self.filter_fields)
+        assert form.is_valid(), (form.errors, form.fields_formset.errors)
+        form = AdvancedFilterForm(
+            self._create_query_form_data(data=dict(
+                self.formset_data, field='last_name')),
+            instance=self.af, filter_fields=self.filter_fields)
+        assert not form.is_valid()
+
+
+class TestAdmission(CommonFormTest):
+    def _groups_form(self):
+        data = self._create_query_form_data(data={
+            'field': 'groups__name', 'operator': 'iexact', 'value': 'bar'})
+        return AdvancedFilterForm(data, instance=self.af,
+                                  filter_fields=['groups__name'])
+
+    def test_admitted(self):
+        form = self._groups_form()
+        assert form.is_valid(), form.errors
+        with self.settings(ADVANCED_FILTERS_MAX_COST=4):
+            form = self._groups_form()
+            assert form.is_valid(), form.errors
+
+    @override_settings(ADVANCED_FILTERS_MAX_COST=3)
+    def test_rejected(self):
+        form = self._groups_form()
+        assert not form.is_valid()
+        assert form.non_field_errors() == [
+            'This filter is too expensive to run: its cost of 4 (1 joins, '
+            '1 multi-valued relations, 0 unindexed text searches) exceeds 3.']
+
+    @override_settings(ADVANCED_FILTERS_MAX_COST=3,
+                       ADVANCED_FILTERS_HEAVY_FILTERS='materialize')
+    def test_materialized(self):
+        form = self._groups_form()
+        assert form.is_valid(), form.errors
+        assert form.save().materialize
@@ -0,0 +1,179 @@
+import json
+import os
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import Permission
+from django.core.management import CommandError, call_command
+from django.db import migrations
+from django.db.models import Q
+from tests.customers.models import Client
+from tests.factories import SalesRepFactory
+
+from ..index_advisor import (COLUMN, COMPOSITE, EXPRESSION_INDEXES, UPPER,
+                             advise, existing_indexes, migrations_for)
+from ..models import AdvancedFilter
+from .factories import AdvancedFilterFactory
+
+
+@pytest.fixture
+def user(db):
+    return SalesRepFactory()
+
+
+def make_filter(user, query, title="filter"):
+    afilter = AdvancedFilterFactory.build(title=title, created_by=user)
+    afilter.query = query
+    afilter.save()
+    return afilter
+
+
+@pytest.fixture
+def filters(user):
+    return [
+        make_filter(user, Q(language="en") & Q(is_active=True)),
+        make_filter(user, Q(language="it") & Q(is_active=True)),
+        make_filter(user, Q(language="sp")),
+        make_filter(user, Q(first_name__iin=["Ann", "Bob"])),
+        make_filter(user, Q(email__icontains="example")),
+        make_filter(user, Q(assigned_to=user.pk)),
+        make_filter(user, Q(no_such_field=1)),
+    ]
+
+
+def by_columns(proposals):
+    return {proposal.columns: proposal for proposal in proposals}
+
+
+def test_existing_indexes():
+    indexed = existing_indexes(AdvancedFilter)
+    assert ("id",) in indexed
+    assert ("model",) in indexed
+    assert ("title",) not in indexed
+    assert ("assigned_to",) in existing_indexes(Client)
+
+
+def test_advise(filters):
+    proposals = by_columns(advise(filters))
+    # the foreign key is indexed already, unknown fields are skipped
+    assert set(proposals) == {("language",), ("is_active",), ("first_name",),
+                              ("email",), ("language", "is_active")}
+
+    language = proposals["language",]
+    assert (language.kind, language.weight) == (COLUMN, 3)
+    assert language.lookups == {"exact": 3}
+    # led by the most compared column
+    composite = proposals["language", "is_active"]
+    assert (composite.kind, composite.weight) == (COMPOSITE, 2)
+    # "One of" compares UPPER(first_name)
+    first_name = proposals["first_name",]
+    if EXPRESSION_INDEXES:
+        assert first_name.kind == UPPER
+        assert "Upper(F(first_name))" in repr(first_name.index)
+    else:
+        assert first_name.kind is None and first_name.index is None
+    # no index serves icontains on SQLite
+    email = proposals["email",]
+    assert email.kind is None and email.index is None
+    assert "scan" in email.note
+
+    assert len(language.index.name) <= 30
+    assert language.index.name != composite.index.name
+
+
+def test_advise_weights(filters):
+    weights = {filters[0].pk: 5, filters[2].pk: 1, filters[4].pk: 1}
+    proposals = advise(filters, weights, min_weight=2)
+    assert [(p.columns, p.weight) for p in proposals] == [
+        (("language",), 6), (("is_active",), 5),
+        (("language", "is_active"), 5)]
+
+
+def test_no_composite_of_ored_rules(user):
+    proposals = advise([make_filter(user, Q(language="en") | Q(is_active=True))])
+    assert set(by_columns(proposals)) == {("language",), ("is_active",)}
+
+
+def test_migrations_for(filters):
+    result = migrations_for(advise(filters))
+    assert list(result) == ["customers"]
+    migration = result["customers"]
+    assert migration.dependencies == [("customers", "0001_initial")]
+    assert migration.name.startswith("0002_")
+    assert all(isinstance(operation, migrations.AddIndex)
+               for operation in migration.operations)
+    assert len(migration.operations) == (4 if EXPRESSION_INDEXES else 3)
+
+
+def run(*args):
+    out = StringIO()
+    call_command("advise_advanced_filter_indexes", *args, stdout=out)
+    return out.getvalue()
+
+
+def test_command(filters):
+    report = json.loads(run("--format", "json", "--model", "customers.Client"))
+    assert report[0]["model"] == "customers.Client"
+    assert report[0]["columns"] == ["language"]
+    assert report[0]["weight"] == 3
+
+    text = run("--min-weight", "2")
+    assert "language, is_active" in text
+    assert "first_name" not in text
+
+    migration = run("--migrations")
+    assert "migrations.AddIndex(" in migration
+    assert "('customers', '0001_initial')" in migration
+
+
+def test_command_nothing_to_propose(db):
+    assert run() == "No index to propose.\n"
+
+
+def test_command_weights_executions(filters):
+    AdvancedFilter.objects.filter(pk=filters[3].pk).update(executions=10)
+    report = json.loads(run("--format", "json"))
+    assert report[0]["columns"] == ["first_name"]
+    assert report[0]["weight"] == 10
+
+
+def test_command_writes_project_apps_only(user, settings):
+    make_filter(user, Q(assigned_to__user_permissions__codename="x"))
+    stdout, stderr = StringIO(), StringIO()
+    call_command("advise_advanced_filter_indexes", "--write",
+                 stdout=stdout, stderr=stderr)
+    assert "Not writing migrations of auth" in stderr.getvalue()
+    # printed instead
+    assert "migrations.AddIndex(" in stdout.getvalue()
+    auth_migrations = os.path.join(
+        os.path.dirname(Permission._meta.app_config.module.__file__),
+        "migrations")
+    assert not [name for name in os.listdir(auth_migrations)
+                if "advanced_filters_indexes" in name]
+
+
+CONFLICTING_MIGRATION = """from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [("customers", "0001_initial")]
+"""
+
+
+def test_conflicting_migrations(filters, settings, tmp_path, monkeypatch):
+    package = tmp_path / "conflicted_migrations"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    initial = os.path.join(os.path.dirname(Client._meta.app_config.path),
+                           "customers", "migrations", "0001_initial.py")
+    with open(initial) as initial_file:
+        (package / "0001_initial.py").write_text(initial_file.read())
+    (package / "0002_a.py").write_text(CONFLICTING_MIGRATION)
+    (package / "0002_b.py").write_text(CONFLICTING_MIGRATION)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    settings.MIGRATION_MODULES = {"customers": "conflicted_migrations"}
+
+    with pytest.raises(ValueError, match="makemigrations --merge"):
+        migrations_for(advise(filters))
+    with pytest.raises(CommandError, match="0002_a, 0002_b"):
+        run("--migrations")
@@ -41,6 +41,31 @@ class AdvancedFilterPermissions(TestCase):
 
         self.assertEqual(qs.count(), 1)
 
+    def test_filter_by_user_users_and_groups(self):
+        from django.contrib.auth.models import Group
+        other_group = Group.objects.create(name='other')
+        self.user.groups.add(other_group)
+        self.advancedfilter.users.add(self.user)
+        self.advancedfilter.groups.add(self.group, other_group)
+
+        qs = AdvancedFilter.objects.filter_by_user(user=self.user)
+
+        # no duplicates, without resorting to DISTINCT
+        self.assertEqual(list(qs), [self.advancedfilter])
+        self.assertFalse(qs.query.distinct)
+
+    def test_filter_by_user_other_users(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Group
+        other_user = get_user_model().objects.create(
+            username='other', email='test2@example.com')
+        self.advancedfilter.users.add(other_user)
+        self.advancedfilter.groups.add(Group.objects.create(name='other'))
+
+        qs = AdvancedFilter.objects.filter_by_user(user=self.user)
+
+        self.assertEqual(qs.count(), 0)
+
     def test_list_fields(self):
         self.advancedfilter.query = Q(some_field__iexact='some_value')
         fields = self.advancedfilter.list_fields()
@@ -59,3 +84,19 @@ class AdvancedFilterPermissions(TestCase):
             'value_to': 10,
             'negate': True,
         }]
+
+    def test_query_no_size_limit(self):
+        query = Q(some_field__iregex='(%s)' % '|'.join(
+            'value%d' % i for i in range(2000)))
+        self.advancedfilter.query = query
+        self.advancedfilter.save()
+        self.advancedfilter.refresh_from_db()
+        self.assertEqual(self.advancedfilter.query.children,
+                         [['some_field__iregex', query.children[0][1]]])
+
+    def test_legacy_base64_query(self):
+        self.advancedfilter.b64_query = (
+            'eyJjb25uZWN0b3IiOiAiQU5EIiwgIm5lZ2F0ZWQiOiBmYWxzZSwgImNoaWxkcmVu'
+            'IjogW1sibGFuZ3VhZ2UiLCAicnUiXV19')
+        self.assertEqual(self.advancedfilter.query.children,
+                         [['language', 'ru']])
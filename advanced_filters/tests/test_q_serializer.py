@@ -1,3 +1,4 @@
+from django.core.serializers.base import SerializationError
 from django.db.models import Q
 from django.test import TestCase
 import json
@@ -37,3 +38,28 @@ class QSerializerTest(TestCase):
         qres = self.s.loads('{"connector": "AND", "negated": false, "children"'
                             ' :[["test", 1234]], "subtree_parents": []}')
         self.assertIsInstance(qres, Q)
+
+    def test_compressed_envelope(self):
+        s = QSerializer(base64=True, compress=True)
+        query = Q(test=1234) | ~Q(another__iregex='(a|b|c)')
+        res = s.dumps(query)
+        self.assertTrue(res.startswith('~1'))
+        self.assertEqual(s.loads(res), QSerializer(base64=True).loads(
+            QSerializer(base64=True).dumps(query)))
+
+    def test_compressed_envelope_smaller(self):
+        query = Q(field__iregex='(%s)' % '|'.join(
+            'value%d' % i for i in range(200)))
+        legacy = QSerializer(base64=True).dumps(query)
+        compressed = QSerializer(base64=True, compress=True).dumps(query)
+        self.assertLess(len(compressed), len(legacy) / 2)
+
+    def test_loads_legacy_base64(self):
+        legacy = QSerializer(base64=True).dumps(self.query_a)
+        s = QSerializer(base64=True, compress=True)
+        self.assertEqual(s.loads(legacy, raw=True)['children'],
+                         [['test', 1234]])
+
+    def test_loads_unknown_envelope_version(self):
+        with self.assertRaises(SerializationError):
+            self.s.loads('~9abc')
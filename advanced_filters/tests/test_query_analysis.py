@@ -0,0 +1,58 @@
+from django.db import connection
+from django.db.models import Q
+from tests.customers.models import Client
+
+from ..query_analysis import (
+    explain_plan,
+    get_multivalued_hops,
+    iter_lookups,
+    needs_distinct,
+    resolve_lookup,
+)
+
+
+def test_iter_lookups():
+    query = Q(language="en") | (Q(email__iexact="a") & ~Q(first_name=None))
+    assert list(iter_lookups(query)) == [
+        ("language", "en"), ("email__iexact", "a"), ("first_name", None)]
+
+
+def test_resolve_lookup():
+    fields, rest = resolve_lookup(Client, "assigned_to__email__iexact")
+    assert [f.name for f in fields] == ["assigned_to", "email"]
+    assert rest == ["iexact"]
+
+    fields, rest = resolve_lookup(Client, "pk__in")
+    assert [f.name for f in fields] == ["id"]
+    assert rest == ["in"]
+
+    fields, rest = resolve_lookup(Client, "date_joined__year__gte")
+    assert [f.name for f in fields] == ["date_joined"]
+    assert rest == ["year", "gte"]
+
+
+def test_local_and_forward_relations_not_multivalued():
+    query = Q(language__iexact="en") & Q(assigned_to__email__icontains="a")
+    assert get_multivalued_hops(Client, query) == frozenset()
+    assert not needs_distinct(Client, query)
+
+
+def test_multivalued_relations():
+    query = Q(language="en") | Q(assigned_to__groups__name__iexact="a")
+    assert get_multivalued_hops(Client, query) == frozenset(
+        ["assigned_to__groups"])
+    assert needs_distinct(Client, query)
+
+    rep_model = Client._meta.get_field("assigned_to").related_model
+    query = Q(client__email__icontains="foo")
+    assert get_multivalued_hops(rep_model, query) == frozenset(["client"])
+
+
+def test_explain_plan(db):
+    plan = explain_plan(Client.objects.filter(language="en"))
+    if connection.vendor != "postgresql":
+        # the planner is only asked on PostgreSQL
+        assert plan is None
+    else:
+        assert plan["Total Cost"] > 0
+        assert plan["Plan Rows"] >= 0
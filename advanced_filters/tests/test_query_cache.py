@@ -0,0 +1,136 @@
+import time
+
+import pytest
+from django.db.models import Q
+from tests.factories import SalesRepFactory
+
+from ..admin import AdvancedListFilters
+from ..models import AdvancedFilter
+from ..query_cache import query_cache
+from .factories import AdvancedFilterFactory
+
+
+def language_of(query):
+    """Decoded queries hold rules as lists rather than tuples"""
+    [(field, value)] = query.children
+    assert field == "language"
+    return value
+
+
+@pytest.fixture
+def advanced_filter(db):
+    af = AdvancedFilterFactory.build(
+        title="Russian speakers", url="foo", model="customers.Client",
+        created_by=SalesRepFactory(),
+    )
+    af.query = Q(language="ru")
+    af.save()
+    return af
+
+
+def test_cached_query_skips_fetch(advanced_filter, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        query = AdvancedListFilters.get_query(advanced_filter.pk)
+    assert language_of(query) == "ru"
+
+    with django_assert_num_queries(0):
+        assert language_of(AdvancedListFilters.get_query(advanced_filter.pk)) == "ru"
+
+
+def test_cached_filter_options(advanced_filter, rf,
+                               django_assert_num_queries):
+    request = rf.get("/")
+    with django_assert_num_queries(1):
+        options = AdvancedListFilters.get_filter_options(
+            request, advanced_filter.pk)
+    assert options["title"] == "Russian speakers"
+    assert not options["materialize"]
+
+    # neither the options nor the query are fetched again
+    with django_assert_num_queries(0):
+        assert AdvancedListFilters.get_filter_options(
+            rf.get("/"), advanced_filter.pk) == options
+        assert language_of(AdvancedListFilters.get_query(
+            advanced_filter.pk)) == "ru"
+
+    advanced_filter.refresh_snapshot()
+    assert query_cache.get_options(advanced_filter.pk) is None
+    assert AdvancedListFilters.get_filter_options(
+        rf.get("/"), advanced_filter.pk)["materialized_at"]
+
+
+def test_missing_filter_options(db, rf):
+    assert AdvancedListFilters.get_filter_options(rf.get("/"), 0) == {}
+
+
+def test_cached_query_is_a_copy(advanced_filter):
+    query = advanced_filter.query
+    query.children.append(("email", "foo@bar.com"))
+    assert language_of(query_cache.get(advanced_filter.pk)) == "ru"
+
+
+def test_invalidated_on_save(advanced_filter):
+    assert language_of(AdvancedListFilters.get_query(advanced_filter.pk)) == "ru"
+    advanced_filter.query = Q(language="en")
+    advanced_filter.save()
+    assert query_cache.get(advanced_filter.pk) is None
+    assert language_of(AdvancedListFilters.get_query(advanced_filter.pk)) == "en"
+
+
+def test_invalidated_on_delete(advanced_filter):
+    pk = advanced_filter.pk
+    assert AdvancedListFilters.get_query(pk) is not None
+    advanced_filter.delete()
+    assert AdvancedListFilters.get_query(pk) is None
+
+
+def test_stale_entry_ignored_by_instance(advanced_filter):
+    advanced_filter.query  # populate cache
+    AdvancedFilter.objects.filter(pk=advanced_filter.pk).update(
+        b64_query=AdvancedFilterFactory.build(query=Q(language="en")).b64_query)
+    fresh = AdvancedFilter.objects.get(pk=advanced_filter.pk)
+    assert language_of(fresh.query) == "en"
+
+
+def test_size_bound(db, settings):
+    settings.ADVANCED_FILTERS_QUERY_CACHE_SIZE = 2
+    user = SalesRepFactory()
+    filters = []
+    for lang in ("en", "ru", "it"):
+        af = AdvancedFilterFactory.build(
+            title=lang, url="foo", model="customers.Client", created_by=user)
+        af.query = Q(language=lang)
+        af.save()
+        filters.append(af)
+    assert query_cache.warm(AdvancedFilter.objects.order_by("pk")) == 3
+    assert query_cache.get(filters[0].pk) is None
+    assert language_of(query_cache.get(filters[2].pk)) == "it"
+
+
+def test_disabled(advanced_filter, settings):
+    settings.ADVANCED_FILTERS_QUERY_CACHE_SIZE = 0
+    assert language_of(advanced_filter.query) == "ru"
+    assert query_cache.get(advanced_filter.pk) is None
+
+
+def test_django_cache_backend(advanced_filter, settings):
+    settings.ADVANCED_FILTERS_QUERY_CACHE_BACKEND = "default"
+    assert language_of(advanced_filter.query) == "ru"
+    assert language_of(query_cache.get(advanced_filter.pk)) == "ru"
+    advanced_filter.save()
+    assert query_cache.get(advanced_filter.pk) is None
+
+
+def test_local_entries_expire(advanced_filter, settings, monkeypatch):
+    settings.ADVANCED_FILTERS_QUERY_CACHE_LOCAL_TIMEOUT = 60
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    advanced_filter.query  # populate cache
+    # i.e: saved by another process
+    AdvancedFilter.objects.filter(pk=advanced_filter.pk).update(
+        b64_query=AdvancedFilterFactory.build(query=Q(language="en")).b64_query)
+    assert language_of(AdvancedListFilters.get_query(advanced_filter.pk)) == "ru"
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert query_cache.get(advanced_filter.pk) is None
+    assert language_of(AdvancedListFilters.get_query(advanced_filter.pk)) == "en"
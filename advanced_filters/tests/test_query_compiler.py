@@ -0,0 +1,146 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models import Exists, Q
+from tests.customers.models import Client
+from tests.factories import ClientFactory, SalesRepFactory
+
+from ..query_compiler import EXISTS_IN_Q, compile_query
+
+requires_exists = pytest.mark.skipif(
+    not EXISTS_IN_Q, reason="Exists() in Q requires Django 3.0")
+
+
+@pytest.fixture
+def reps(db):
+    staff, sales = Group.objects.create(name="staff"), Group.objects.create(
+        name="sales")
+    alice = SalesRepFactory(username="alice", email="alice@example.com")
+    bob = SalesRepFactory(username="bob", email="bob@example.com")
+    carol = SalesRepFactory(username="carol", email="carol@example.com")
+    alice.groups.add(staff, sales)
+    bob.groups.add(sales)
+    ClientFactory.create_batch(3, assigned_to=alice, language="en")
+    ClientFactory(assigned_to=alice, language="it", email="foo@it.com")
+    ClientFactory(assigned_to=bob, language="it", email="bar@it.com")
+    # different clients of dave match each rule of the negated queries below
+    dave = SalesRepFactory(username="dave", email="dave@example.com")
+    ClientFactory(assigned_to=dave, language="it", email="baz@it.com",
+                  first_name="q")
+    ClientFactory(assigned_to=dave, language="en", email="bar@en.com",
+                  first_name="p")
+    return alice, bob, carol
+
+
+def exists_count(query):
+    """Number of Exists() expressions in a compiled query"""
+    count = 0
+    for child in query.children:
+        if isinstance(child, Q):
+            count += exists_count(child)
+        elif isinstance(child, Exists):
+            count += 1
+    return count
+
+
+QUERIES = [
+    Q(groups__name__iexact="sales"),
+    Q(groups__name__iexact="sales") & Q(groups__name__iexact="staff"),
+    Q(client__language__iexact="it") & Q(client__email__icontains="foo"),
+    Q(client__language__iexact="it") | Q(groups__name="staff"),
+    ~Q(client__language__iexact="it") & Q(email__icontains="example"),
+    Q(client__language="it") & ~Q(client__email__icontains="bar"),
+    Q(client__language="en") & ~Q(client__first_name="p"),
+    ~Q(client__first_name="p") & Q(client__language="en"),
+    ~Q(client__first_name="p") & ~Q(client__language="it"),
+    ~(Q(client__language="it") & Q(client__email__icontains="bar")),
+    Q(client__isnull=True),
+    Q(groups__in=[1, 2]),
+    Q(client__language="it") & (Q(client__email="x") | Q(username="bob")),
+]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_same_results(reps, query):
+    SalesRep = get_user_model()
+    expected = set(SalesRep.objects.filter(query).values_list(
+        "username", flat=True))
+    compiled = compile_query(SalesRep, query)
+    assert set(SalesRep.objects.filter(compiled).values_list(
+        "username", flat=True)) == expected
+
+
+@requires_exists
+def test_grouped_relation_rules(reps):
+    SalesRep = get_user_model()
+    query = Q(client__language__iexact="it") & Q(
+        client__email__icontains="foo")
+    compiled = compile_query(SalesRep, query)
+    assert exists_count(compiled) == 1
+    assert list(SalesRep.objects.filter(compiled).values_list(
+        "username", flat=True)) == ["alice"]
+
+
+@requires_exists
+def test_forward_then_multivalued(reps):
+    query = Q(assigned_to__groups__name="staff") & Q(language="en")
+    compiled = compile_query(Client, query)
+    assert exists_count(compiled) == 1
+    assert Client.objects.filter(compiled).count() == 3
+
+
+def test_not_rewritten(reps):
+    SalesRep = get_user_model()
+    for query in (Q(client__isnull=True), Q(email__iexact="a"),
+                  Q(client__language="it") & (
+                      Q(client__email="x") | Q(username="bob")),
+                  Q(client__language="it") & ~Q(client__email="x")):
+        assert exists_count(compile_query(SalesRep, query)) == 0
+
+
+def test_disabled(reps, settings):
+    settings.ADVANCED_FILTERS_EXISTS_SUBQUERIES = False
+    query = Q(groups__name="staff")
+    assert compile_query(get_user_model(), query) is query
+
+
+def test_one_of_compiled(reps):
+    query = Q(email__iin=["FOO@it.com", "bar@IT.com"]) | Q(language__iin=["en"])
+    compiled = compile_query(Client, query)
+    assert compiled.children == [
+        ("email__iin", ["FOO@it.com", "bar@IT.com"]), ("language__in", ["en"])]
+    assert "UPPER" in str(Client.objects.filter(compiled).query)
+    assert Client.objects.filter(compiled).count() == 6
+
+
+def test_one_of_lookup_not_global(reps):
+    alice, _, _ = reps
+    assert Client._meta.get_field("email").get_lookup("iin")
+    # only registered on text fields
+    assert Client._meta.get_field("id").get_lookup("iin") is None
+    query = Q(assigned_to__iin=[alice.pk])
+    assert compile_query(Client, query).children == [
+        ("assigned_to__in", [alice.pk])]
+    assert Client.objects.filter(compile_query(Client, query)).exists()
+
+
+def test_one_of_regex_upgraded(reps):
+    alice, bob, _ = reps
+    query = Q(first_name__iregex="^(FOO|bar)$") & ~Q(
+        assigned_to__iregex="^(%d|%d)$" % (alice.pk, bob.pk))
+    compiled = compile_query(Client, query)
+    assert compiled.children[0] == ("first_name__iin", ["FOO", "bar"])
+    assert compiled.children[1].children == [
+        ("assigned_to__in", [str(alice.pk), str(bob.pk)])]
+    assert not Client.objects.filter(compiled).exists()
+
+
+def test_unanchored_one_of_regex_kept(reps):
+    # older "One of" patterns search the values, their dots match anything
+    query = Q(email__iregex="(FOO@it|bar@it.com)") & Q(
+        email__iregex="^(foo@it.com|x)$")
+    compiled = compile_query(Client, query)
+    assert compiled.children == query.children
+    emails = Client.objects.filter(
+        email__iregex="(FOO@it|bar@it.com)").values_list("email", flat=True)
+    assert set(emails) == {"foo@it.com", "bar@it.com"}
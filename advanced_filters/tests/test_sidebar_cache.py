@@ -0,0 +1,100 @@
+import pytest
+from django.contrib.admin import site
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import RequestFactory
+from tests.customers.models import Client
+from tests.factories import SalesRepFactory
+
+from ..admin import AdvancedListFilters
+from ..tests.factories import AdvancedFilterFactory
+
+
+@pytest.fixture(autouse=True)
+def enable_cache(settings):
+    settings.ADVANCED_FILTERS_SIDEBAR_CACHE = "default"
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return SalesRepFactory()
+
+
+@pytest.fixture
+def group(db):
+    return Group.objects.create(name="reps")
+
+
+@pytest.fixture
+def afilter(user):
+    return AdvancedFilterFactory(title="spanish", created_by=user,
+                                 b64_query="MQ==")
+
+
+def lookups(user):
+    request = RequestFactory().get("/")
+    request.user = user
+    return list(AdvancedListFilters.lookups(
+        None, request, site._registry[Client]))
+
+
+def test_cached(user, afilter, django_assert_num_queries):
+    afilter.users.add(user)
+    with django_assert_num_queries(1):
+        assert lookups(user) == [(afilter.pk, "spanish")]
+    with django_assert_num_queries(0):
+        assert lookups(user) == [(afilter.pk, "spanish")]
+
+
+def test_invalidated_on_save_and_delete(user, afilter):
+    afilter.users.add(user)
+    assert lookups(user) == [(afilter.pk, "spanish")]
+    afilter.title = "italian"
+    afilter.save()
+    assert lookups(user) == [(afilter.pk, "italian")]
+    afilter.delete()
+    assert lookups(user) == []
+
+
+def test_invalidated_on_sharing(user, group, afilter):
+    assert lookups(user) == []
+    afilter.users.add(user)
+    assert lookups(user) == [(afilter.pk, "spanish")]
+    afilter.users.clear()
+    assert lookups(user) == []
+    user.groups.add(group)
+    afilter.groups.add(group)
+    assert lookups(user) == [(afilter.pk, "spanish")]
+    afilter.groups.remove(group)
+    assert lookups(user) == []
+
+
+def test_invalidated_on_group_membership(user, group, afilter):
+    afilter.groups.add(group)
+    assert lookups(user) == []
+    user.groups.add(group)
+    assert lookups(user) == [(afilter.pk, "spanish")]
+    group.user_set.remove(user)
+    assert lookups(user) == []
+    user.groups.add(group)
+    assert lookups(user) == [(afilter.pk, "spanish")]
+    group.delete()
+    assert lookups(user) == []
+
+
+def test_per_user(user, afilter):
+    other = SalesRepFactory(username="other", email="other@example.com")
+    afilter.users.add(user)
+    assert lookups(user) == [(afilter.pk, "spanish")]
+    assert lookups(other) == []
+
+
+def test_disabled(settings, user, afilter, django_assert_num_queries):
+    settings.ADVANCED_FILTERS_SIDEBAR_CACHE = None
+    afilter.users.add(user)
+    for _ in range(2):
+        with django_assert_num_queries(1):
+            assert lookups(user) == [(afilter.pk, "spanish")]
@@ -0,0 +1,100 @@
+import pytest
+from django.db.models import Q
+from tests.customers.models import Client
+from tests.factories import ClientFactory, SalesRepFactory
+
+from ..sql_cache import SQLCache, get_schema_version, sql_cache
+from .factories import AdvancedFilterFactory
+
+
+@pytest.fixture
+def user(db):
+    return SalesRepFactory()
+
+
+@pytest.fixture(autouse=True)
+def enabled(settings):
+    settings.ADVANCED_FILTERS_SQL_CACHE_SIZE = 128
+
+
+@pytest.fixture
+def cache():
+    cache = SQLCache()
+    yield cache
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clients(user):
+    ClientFactory.create_batch(3, assigned_to=user, language="en")
+    ClientFactory.create_batch(2, assigned_to=user, language="it")
+
+
+def test_filter(cache):
+    query = Q(language="en")
+    queryset = cache.filter(Client.objects.all(), 1, query)
+    assert "IN (SELECT" in str(queryset.query)
+    assert "IN ((SELECT" not in str(queryset.query)
+    assert queryset.count() == 3
+    assert len(queryset) == 3
+
+    # the compiled SQL is reused for the same query
+    entry = cache._store.get(cache._key(1))
+    assert cache.filter(Client.objects.all(), 1, Q(language="en")).count() == 3
+    assert cache._store.get(cache._key(1)) is entry
+    assert cache.filter(Client.objects.all(), 2, Q(language="it")).count() == 2
+
+
+def test_changed_query(cache):
+    # i.e: saved by another process, or through QuerySet.update()
+    cache.filter(Client.objects.all(), 1, Q(language="en"))
+    entry = cache._store.get(cache._key(1))
+    assert cache.filter(Client.objects.all(), 1, Q(language="it")).count() == 2
+    assert cache._store.get(cache._key(1)) != entry
+
+
+def test_multivalued_relations_without_distinct(cache, user):
+    user.groups.create(name="a")
+    user.groups.create(name="b")
+    queryset = cache.filter(Client.objects.all(), 1,
+                            Q(assigned_to__groups__name__in=["a", "b"]))
+    assert not queryset.query.distinct
+    assert queryset.count() == 5
+
+
+def test_stale_entry(cache, settings):
+    cache.filter(Client.objects.all(), 1, Q(language="en"))
+    stamp = cache._store.get(cache._key(1))[0]
+    # entries of another migration state (or setting) are recompiled
+    settings.ADVANCED_FILTERS_EXISTS_SUBQUERIES = False
+    assert cache.filter(
+        Client.objects.all(), 1, Q(language="en")).count() == 3
+    assert cache._store.get(cache._key(1))[0] != stamp
+
+
+def test_disabled(cache, settings):
+    del settings.ADVANCED_FILTERS_SQL_CACHE_SIZE
+    queryset = cache.filter(Client.objects.all(), 1, Q(language="en"))
+    assert "IN (SELECT" not in str(queryset.query)
+    assert queryset.count() == 3
+    assert cache._store.get(cache._key(1)) is None
+
+
+def test_schema_version():
+    assert get_schema_version() == get_schema_version()
+    assert len(get_schema_version()) == 32
+
+
+def test_invalidated_on_save(user):
+    afilter = AdvancedFilterFactory.build(created_by=user)
+    afilter.query = Q(language="en")
+    afilter.save()
+    sql_cache.filter(Client.objects.all(), afilter.pk, afilter.query)
+    assert sql_cache._store.get(sql_cache._key(afilter.pk))
+    afilter.query = Q(language="it")
+    afilter.save()
+    assert sql_cache._store.get(sql_cache._key(afilter.pk)) is None
+    assert sql_cache.filter(
+        Client.objects.all(), afilter.pk, afilter.query).count() == 2
+    afilter.delete()
+    assert sql_cache._store.get(sql_cache._key(afilter.pk)) is None
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+from django.db.models import Q
+from tests.factories import SalesRepFactory
+
+from ..models import AdvancedFilter
+from ..stats import StatsBuffer, percentile
+from .factories import AdvancedFilterFactory
+
+
+@pytest.fixture
+def stats(settings):
+    settings.ADVANCED_FILTERS_STATS = True
+    settings.ADVANCED_FILTERS_STATS_FLUSH_INTERVAL = 3600
+    return StatsBuffer()
+
+
+@pytest.fixture
+def afilter(db):
+    afilter = AdvancedFilterFactory.build(created_by=SalesRepFactory())
+    afilter.query = Q(language="en")
+    afilter.save()
+    return afilter
+
+
+def test_percentile():
+    assert percentile([], 0.95) is None
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile(list(range(1, 101)), 0.95) == 95
+
+
+def test_disabled(settings, afilter):
+    stats = StatsBuffer()
+    stats.record(afilter.pk, 0.5, 3)
+    assert stats.flush() == 0
+
+
+def test_flush(stats, afilter, django_assert_max_num_queries):
+    stats.record(afilter.pk, 0.1, 3)
+    stats.record(str(afilter.pk), 0.3, None)
+    stats.record("invalid", 0.3, None)
+    # buffered
+    afilter.refresh_from_db()
+    assert afilter.executions == 0
+
+    with django_assert_max_num_queries(4):
+        assert stats.flush() == 2
+    afilter.refresh_from_db()
+    assert afilter.executions == 2
+    assert afilter.total_time == pytest.approx(0.4)
+    assert afilter.get_recent_times() == [0.1, 0.3]
+    assert afilter.p95_time == 0.3
+    # the last known count
+    assert afilter.last_count == 3
+    assert afilter.last_used_at is not None
+    assert stats.flush() == 0
+
+
+def test_flush_accumulates(stats, afilter, settings):
+    settings.ADVANCED_FILTERS_STATS_SAMPLES = 2
+    for elapsed in (0.1, 0.2, 0.3):
+        stats.record(afilter.pk, elapsed, 1)
+        stats.flush()
+    afilter.refresh_from_db()
+    assert afilter.executions == 3
+    assert afilter.total_time == pytest.approx(0.6)
+    assert afilter.get_recent_times() == [0.2, 0.3]
+
+
+def test_flush_merges_processes(stats, afilter, settings):
+    # i.e: the buffers of two processes flushing the same filter
+    other = StatsBuffer()
+    stats.record(afilter.pk, 0.1, 1)
+    other.record(afilter.pk, 0.2, 2)
+    other.record(afilter.pk, 0.3, 2)
+    stats.flush()
+    other.flush()
+    afilter.refresh_from_db()
+    assert afilter.executions == 3
+    assert afilter.total_time == pytest.approx(0.6)
+    assert afilter.get_recent_times() == [0.1, 0.2, 0.3]
+    assert afilter.last_count == 2
+
+
+def test_flushed_in_background(stats, afilter, settings, monkeypatch):
+    settings.ADVANCED_FILTERS_STATS_FLUSH_INTERVAL = 0
+    flushed = []
+
+    def flush():
+        flushed.append((threading.current_thread(), len(stats._executions)))
+        stats.clear()
+
+    monkeypatch.setattr(stats, "flush", flush)
+    stats.record(afilter.pk, 0.1, 1)
+    flusher = stats._flusher
+    flusher.join(5)
+    # not by the request which recorded the execution
+    assert flushed == [(flusher, 1)]
+    assert stats._flusher is None
+
+
+def test_deleted_filter(stats, afilter):
+    stats.record(afilter.pk, 0.1, 1)
+    afilter.delete()
+    # nothing to write, but flushed nonetheless
+    assert stats.flush() == 1
@@ -0,0 +1,79 @@
+import pytest
+from django.db import OperationalError, connection, transaction
+
+from .. import timeouts
+from ..timeouts import StatementTimeout, statement_timeout
+
+# a query taking long enough to be interrupted, on SQLite
+SLOW_QUERY = """
+    WITH RECURSIVE numbers(n) AS (
+        SELECT 1 UNION ALL SELECT n + 1 FROM numbers WHERE n < 1000000
+    ) SELECT COUNT(*) FROM numbers
+"""
+
+sqlite_only = pytest.mark.skipif(
+    connection.vendor != "sqlite", reason="interrupts SQLite statements")
+postgresql_only = pytest.mark.skipif(
+    connection.vendor != "postgresql", reason="sets statement_timeout")
+
+
+@pytest.fixture(autouse=True)
+def progress_steps(monkeypatch):
+    monkeypatch.setattr(timeouts, "SQLITE_PROGRESS_STEPS", 10)
+
+
+def execute(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchone()
+
+
+@sqlite_only
+def test_timeout(db):
+    with pytest.raises(StatementTimeout) as excinfo:
+        with statement_timeout("default", 0.001):
+            execute(SLOW_QUERY)
+    assert excinfo.value.budget == 0.001
+    assert isinstance(excinfo.value, OperationalError)
+    # the progress handler is removed
+    assert execute("SELECT 1") == (1,)
+
+
+@sqlite_only
+def test_within_budget(db):
+    with statement_timeout("default", 10):
+        assert execute("SELECT 1") == (1,)
+    with statement_timeout("default", None):
+        assert execute("SELECT 2") == (2,)
+
+
+@sqlite_only
+def test_other_errors(db):
+    with pytest.raises(OperationalError) as excinfo:
+        with statement_timeout("default", 10):
+            execute("SELECT * FROM no_such_table")
+    assert not isinstance(excinfo.value, StatementTimeout)
+
+
+def show_statement_timeout():
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW statement_timeout")
+        return cursor.fetchone()[0]
+
+
+@postgresql_only
+@pytest.mark.django_db(transaction=True)
+def test_restored_within_outer_transaction():
+    # i.e: ATOMIC_REQUESTS
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = '7s'")
+        with statement_timeout("default", 2):
+            assert show_statement_timeout() == "2s"
+        assert show_statement_timeout() == "7s"
+
+    with transaction.atomic():
+        with pytest.raises(StatementTimeout):
+            with statement_timeout("default", 0.01):
+                execute("SELECT pg_sleep(1)")
+        assert show_statement_timeout() == "0"
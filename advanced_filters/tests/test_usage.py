@@ -6,6 +6,7 @@ from tests.factories import ClientFactory, SalesRepFactory
 
 from ..admin import AdvancedListFilters
 from ..models import AdvancedFilter
+from ..query_compiler import EXISTS_IN_Q
 from .factories import AdvancedFilterFactory
 
 
@@ -63,6 +64,18 @@ def test_filters_available_to_users(client, user, advanced_filter):
         assert cl.queryset.count() == 2
 
 
+def test_filters_by_compiled_sql(client, user, advanced_filter, settings):
+    settings.ADVANCED_FILTERS_SQL_CACHE_SIZE = 128
+    advanced_filter.users.add(user)
+    url = reverse(URL_NAME_CLIENT_CHANGELIST)
+    for _ in range(2):
+        res = client.get(url, data={"_afilter": advanced_filter.pk})
+        assert res.status_code == 200
+        queryset = res.context_data["cl"].queryset
+        assert "IN (SELECT" in str(queryset.query)
+        assert len(queryset) == 2
+
+
 def test_filters_available_to_groups(client, user, advanced_filter):
     group = user.groups.create()
     advanced_filter.groups.add(group)
@@ -73,3 +86,47 @@ def test_filters_available_to_groups(client, user, advanced_filter):
     assert cl.filter_specs
     if hasattr(cl, "queryset"):
         assert cl.queryset.count() == 2
+
+
+def test_distinct_only_for_multivalued_relations(client, user, advanced_filter,
+                                                 settings):
+    # filtering by the query itself, rather than its compiled SQL
+    settings.ADVANCED_FILTERS_SQL_CACHE_SIZE = 0
+    advanced_filter.users.add(user)
+    url = reverse(URL_NAME_CLIENT_CHANGELIST)
+    res = client.get(url, data={"_afilter": advanced_filter.pk})
+    assert not res.context_data["cl"].queryset.query.distinct
+
+    advanced_filter.query = Q(assigned_to__groups__isnull=True)
+    advanced_filter.save()
+    res = client.get(url, data={"_afilter": advanced_filter.pk})
+    assert res.context_data["cl"].queryset.query.distinct
+
+
+@pytest.mark.skipif(not EXISTS_IN_Q, reason="Exists() in Q requires Django 3.0")
+def test_multivalued_relations_semi_join(client, user, advanced_filter):
+    advanced_filter.users.add(user)
+    user.groups.create(name="staff")
+    advanced_filter.query = Q(assigned_to__groups__name="staff")
+    advanced_filter.save()
+    url = reverse(URL_NAME_CLIENT_CHANGELIST)
+    res = client.get(url, data={"_afilter": advanced_filter.pk})
+    queryset = res.context_data["cl"].queryset
+    assert not queryset.query.distinct
+    assert "EXISTS" in str(queryset.query)
+    assert queryset.count() == 10
+
+
+def test_invalid_filter_id(client, user, settings):
+    settings.ADVANCED_FILTERS_TIMEOUT = 10
+    url = reverse(URL_NAME_CLIENT_CHANGELIST)
+    res = client.get(url, data={"_afilter": "abc"})
+    assert res.status_code == 200
+
+
+@pytest.mark.parametrize("value, filter_id", [
+    ("12", "12"), ("", None), ("abc", None), ("-1", None), ("1.5", None)])
+def test_get_filter_id(rf, value, filter_id):
+    request = rf.get("/", {"_afilter": value})
+    assert AdvancedListFilters.get_filter_id(request) == filter_id
+    assert AdvancedListFilters.get_filter_id(rf.get("/")) is None
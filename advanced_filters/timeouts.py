@@ -0,0 +1,88 @@
+"""
+Time budget of the statements executing a saved filter.
+
+On PostgreSQL, statements are run in a transaction (or savepoint) setting a
+local ``statement_timeout``, restored to its previous value on exit. On
+SQLite, a progress handler interrupts statements running past the budget.
+Other databases run statements unbounded.
+"""
+from contextlib import contextmanager
+import logging
+import time
+
+from django.db import OperationalError, connections, transaction
+
+logger = logging.getLogger('advanced_filters.timeouts')
+
+# the SQLite VM instructions between calls of the progress handler
+SQLITE_PROGRESS_STEPS = 1000
+# SQLSTATE of statements cancelled by PostgreSQL (query_canceled)
+QUERY_CANCELED = '57014'
+
+
+class StatementTimeout(OperationalError):
+    """A statement was cancelled for running past its time budget"""
+    def __init__(self, budget):
+        self.budget = budget
+        super().__init__(
+            'Statement cancelled after exceeding its budget of %ss' % budget)
+
+
+def _is_canceled(error):
+    cause = error.__cause__
+    return QUERY_CANCELED in (getattr(cause, 'pgcode', None),
+                              getattr(cause, 'sqlstate', None))
+
+
+@contextmanager
+def statement_timeout(using, budget):
+    """
+    Cancel statements executed on the using database within the block after
+    budget seconds (no budget if falsy), raising StatementTimeout
+    """
+    connection = connections[using]
+    if not budget:
+        yield
+    elif connection.vendor == 'postgresql':
+        try:
+            with transaction.atomic(using=using):
+                with connection.cursor() as cursor:
+                    cursor.execute('SHOW statement_timeout')
+                    previous = cursor.fetchone()[0]
+                    cursor.execute('SET LOCAL statement_timeout = %s',
+                                   [max(int(budget * 1000), 1)])
+                yield
+                # within an outer transaction (i.e: ATOMIC_REQUESTS) the
+                # timeout would last until it ends, otherwise. Rolling back
+                # the block reverts it already.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL statement_timeout = %s',
+                                   [previous])
+        except OperationalError as e:
+            if _is_canceled(e):
+                raise StatementTimeout(budget) from e
+            raise
+    elif connection.vendor == 'sqlite':
+        deadline = time.monotonic() + budget
+        exceeded = []
+
+        def abort():
+            if time.monotonic() > deadline:
+                exceeded.append(True)
+                return 1  # interrupts the statement
+            return 0
+
+        connection.ensure_connection()
+        connection.connection.set_progress_handler(
+            abort, SQLITE_PROGRESS_STEPS)
+        try:
+            yield
+        except OperationalError as e:
+            if exceeded:
+                raise StatementTimeout(budget) from e
+            raise
+        finally:
+            connection.connection.set_progress_handler(None, 0)
+    else:
+        logger.debug('No statement timeout on %s', connection.vendor)
+        yield
@@ -1,12 +1,16 @@
 from django.urls import path
 
-from advanced_filters.views import GetFieldChoices
+from advanced_filters.views import GetFieldChoices, GetFieldChoicesBatch
 
 urlpatterns = [
     path('field_choices/<model>/<field_name>/',
         GetFieldChoices.as_view(),
         name='afilters_get_field_choices'),
 
+    path('field_choices/<model>/',
+        GetFieldChoicesBatch.as_view(),
+        name='afilters_get_fields_choices'),
+
     # only to allow building dynamically
     path('field_choices/',
         GetFieldChoices.as_view(),
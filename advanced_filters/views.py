@@ -1,13 +1,20 @@
+import hashlib
 import logging
 
 from django.apps import apps
 from django.conf import settings
-from django.contrib.admin.utils import get_fields_from_path
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
 from django.core.exceptions import FieldDoesNotExist
 from django.db import models
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
 from django.utils.encoding import force_str
 from django.views.generic import View
 
+from advanced_filters.choices_cache import choices_cache, get_field_setting
 from advanced_filters.mixins import (
     CsrfExemptMixin,
     JSONResponseMixin,
@@ -16,6 +23,10 @@ from advanced_filters.mixins import (
 
 logger = logging.getLogger('advanced_filters.views')
 
+# static field choices only change with the code (or translations), cache
+# them for a while before revalidating them by their ETag
+STATIC_CHOICES_MAX_AGE = 60 * 5
+
 
 class GetFieldChoices(CsrfExemptMixin, StaffuserRequiredMixin,
                       JSONResponseMixin, View):
@@ -28,6 +39,19 @@ class GetFieldChoices(CsrfExemptMixin, StaffuserRequiredMixin,
     all distinct entries in the DB are presented, unless field name is in
     ADVANCED_FILTERS_DISABLE_FOR_FIELDS and limited to display only results
     under ADVANCED_FILTERS_MAX_CHOICES.
+
+    Fields with too many distinct values to list are flagged as "lazy", their
+    choices are then searched: when passed a "term" query parameter, only
+    choices matching the term are returned, a page at a time (using the
+    "page" and "page_size" parameters), along with a "more" flag when more
+    pages follow. Relation fields can't be searched, only the fields of the
+    related model (i.e: "assigned_to__email" rather than "assigned_to").
+
+    Choices are served with an ETag (honouring If-None-Match) and private
+    Cache-Control headers: distinct values may be cached by browsers for
+    ADVANCED_FILTERS_CHOICES_MAX_AGE seconds (default 0, always revalidate),
+    static choices for ADVANCED_FILTERS_STATIC_CHOICES_MAX_AGE (5 minutes).
+    As labels of choices are translated, responses vary on Accept-Language.
     """
     def get(self, request, model=None, field_name=None):
         if model is field_name is None:
@@ -48,32 +72,213 @@ class GetFieldChoices(CsrfExemptMixin, StaffuserRequiredMixin,
             return self.render_json_response(
                 {'error': force_str(e)}, status=400)
 
-        choices = field.choices
+        if 'term' in request.GET:
+            return self.search(request, model_obj, field)
+
+        if field.choices:
+            return self.render_cacheable_response(
+                request, {'results': self.get_static_choices(field)},
+                max_age=getattr(
+                    settings, 'ADVANCED_FILTERS_STATIC_CHOICES_MAX_AGE',
+                    STATIC_CHOICES_MAX_AGE))
+
         # if no choices, populate with distinct values from instances
-        if not choices:
-            choices = []
-            disabled = getattr(settings, 'ADVANCED_FILTERS_DISABLE_FOR_FIELDS',
-                               tuple())
-            max_choices = getattr(settings, 'ADVANCED_FILTERS_MAX_CHOICES', 254)
-            if field.name in disabled:
-                logger.debug('Skipped lookup of choices for disabled fields')
-            elif isinstance(field, (models.BooleanField, models.DateField,
-                                    models.TimeField)):
-                logger.debug('No choices calculated for field %s of type %s',
-                             field, type(field))
-            else:
-                # the order_by() avoids ambiguity with values() and distinct()
-                choices = model_obj.objects.order_by(field.name).values_list(
-                    field.name, flat=True).distinct()
-                # additional query is ok to avoid fetching too many values
-                if choices.count() <= max_choices:
-                    choices = zip(choices, choices)
-                    logger.debug('Choices found for field %s: %s',
-                                 field.name, choices)
-                else:
-                    choices = []
+        etag = None
+        max_age = get_field_setting(
+            'ADVANCED_FILTERS_CHOICES_MAX_AGE', model_obj, field, 0)
+        cached = self.lookup_allowed(field) and choices_cache.enabled
+        max_choices = getattr(settings, 'ADVANCED_FILTERS_MAX_CHOICES', 254)
+        if cached:
+            # skip looking up values altogether if the client has them
+            etag = choices_cache.get_etag(model_obj, field, max_choices)
+            if etag is not None:
+                not_modified = get_conditional_response(request, etag=etag)
+                if not_modified is not None:
+                    return self.set_cache_headers(not_modified, etag, max_age)
+
+        results = self.get_database_choices(model_obj, field)
+        if cached and etag is None:
+            # the ETag of the entry just computed
+            etag = choices_cache.get_etag(model_obj, field, max_choices)
+        context = {'results': results or []}
+        if results is None:
+            context['lazy'] = True
+        return self.render_cacheable_response(
+            request, context, etag=etag, max_age=max_age)
+
+    @staticmethod
+    def get_static_choices(field):
+        return [{'id': c[0], 'text': force_str(c[1])} for c in sorted(
+                field.choices, key=lambda x: (x[0] is not None, x[0]))]
+
+    def get_database_choices(self, model, field):
+        """
+        Return the distinct values of field as choices, no choices if the
+        field is disabled, or None if it has too many distinct values.
+        """
+        if not self.lookup_allowed(field):
+            return []
+        max_choices = getattr(settings, 'ADVANCED_FILTERS_MAX_CHOICES', 254)
+        values = choices_cache.get_or_set(
+            model, field, max_choices,
+            lambda: self.get_distinct_values(model, field, max_choices))
+        if values is None:
+            return None
+        logger.debug('Choices found for field %s: %s', field.name, values)
+        return [{'id': v, 'text': force_str(v)} for v in values]
+
+    @staticmethod
+    def set_cache_headers(response, etag, max_age):
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=max_age)
+        patch_vary_headers(response, ('Accept-Language',))
+        return response
+
+    def render_cacheable_response(self, request, context_dict, etag=None,
+                                  max_age=0):
+        """
+        Render a JSON response with caching headers, or a 304 (Not Modified)
+        response if it matches the request's If-None-Match header. Without
+        an etag, one is derived from the content of the response.
+        """
+        response = self.render_json_response(context_dict)
+        if etag is None:
+            etag = '"%s"' % hashlib.md5(response.content).hexdigest()
+        self.set_cache_headers(response, etag, max_age)
+        return get_conditional_response(request, etag=etag, response=response)
+
+    @staticmethod
+    def lookup_allowed(field):
+        """Whether distinct values of field may be looked up in the DB"""
+        disabled = getattr(settings, 'ADVANCED_FILTERS_DISABLE_FOR_FIELDS',
+                           tuple())
+        if field.name in disabled:
+            logger.debug('Skipped lookup of choices for disabled fields')
+            return False
+        elif isinstance(field, (models.BooleanField, models.DateField,
+                                models.TimeField)):
+            logger.debug('No choices calculated for field %s of type %s',
+                         field, type(field))
+            return False
+        return True
+
+    @staticmethod
+    def get_distinct_values(model, field, max_choices):
+        """
+        Return the (ordered) distinct values of field, or None if there are
+        more than max_choices of them, using a single bounded query.
+        """
+        # the order_by() avoids ambiguity with values() and distinct()
+        values = list(model._default_manager.order_by(field.name).values_list(
+            field.name, flat=True).distinct()[:max_choices + 1])
+        if len(values) > max_choices:
+            return None
+        # NULL is sorted either first or last depending on the database
+        if values and values[-1] is None:
+            values.insert(0, values.pop())
+        return values
+
+    @staticmethod
+    def get_page_params(request):
+        """Return the (1-based) page number and page size of a search"""
+        max_choices = getattr(settings, 'ADVANCED_FILTERS_MAX_CHOICES', 254)
+        default_size = getattr(
+            settings, 'ADVANCED_FILTERS_CHOICES_PAGE_SIZE', 20)
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+            page_size = int(request.GET.get('page_size', default_size))
+        except ValueError:
+            page, page_size = 1, default_size
+        return page, min(max(page_size, 1), max_choices)
+
+    def search(self, request, model, field):
+        """
+        Respond with a page of the choices of field matching the "term"
+        parameter (by ADVANCED_FILTERS_CHOICES_SEARCH_LOOKUP, istartswith by
+        default), fetching a single extra row to tell if more pages follow.
+        """
+        if field.is_relation:
+            return self.render_json_response(
+                {'error': "Cannot search relation field %s, search one of "
+                          "the fields of %s instead" % (
+                              field.name, field.related_model._meta.label)},
+                status=400)
+        term = request.GET.get('term', '').strip()
+        page, page_size = self.get_page_params(request)
+        offset = (page - 1) * page_size
+
+        if field.choices:
+            matches = [(k, force_str(v)) for k, v in field.choices
+                       if term.lower() in force_str(v).lower()]
+            results = [{'id': k, 'text': v}
+                       for k, v in matches[offset:offset + page_size + 1]]
+        elif self.lookup_allowed(field):
+            lookup = getattr(settings, 'ADVANCED_FILTERS_CHOICES_SEARCH_LOOKUP',
+                             'istartswith')
+            queryset = model._default_manager.filter(**{
+                '{}__isnull'.format(field.name): False}).order_by(field.name)
+            if term:
+                queryset = queryset.filter(**{
+                    '{}__{}'.format(field.name, lookup): term})
+            values = queryset.values_list(field.name, flat=True).distinct()
+            results = [{'id': v, 'text': force_str(v)}
+                       for v in values[offset:offset + page_size + 1]]
+        else:
+            results = []
+
+        more = len(results) > page_size
+        return self.render_json_response(
+            {'results': results[:page_size], 'more': more})
+
 
-        results = [{'id': c[0], 'text': force_str(c[1])} for c in sorted(
-                   choices, key=lambda x: (x[0] is not None, x[0]))]
+class GetFieldChoicesBatch(GetFieldChoices):
+    """
+    A JSONResponse view that accepts a model and a list of fields (paths to
+    fields, as "field" query parameters) and returns the choices of all of
+    them at once, mapped by field path, i.e:
+
+        {"results": {"language": [...], "assigned_to__email": [...]}}
+
+    Paths of fields with too many distinct values to list are listed under
+    "lazy", paths which can't be resolved are mapped to an error under
+    "errors".
+    Fields resolving to the same model field are looked up once.
+    """
+    def get(self, request, model=None):
+        field_names = list(dict.fromkeys(request.GET.getlist('field')))
+        if model is None or not field_names:
+            return self.render_json_response(
+                {'error': "GetFieldChoicesBatch view requires a model and "
+                          "at least one field"}, status=400)
+        try:
+            app_label, model_name = model.split('.', 1)
+            model_obj = apps.get_model(app_label, model_name)
+        except (ValueError, LookupError) as e:
+            logger.debug("Invalid kwargs passed to view: %s", e)
+            return self.render_json_response(
+                {'error': force_str(e)}, status=400)
+
+        results, errors, lazy, looked_up = {}, {}, [], {}
+        for field_name in field_names:
+            try:
+                field = get_fields_from_path(model_obj, field_name)[-1]
+            except (FieldDoesNotExist, NotRelationField) as e:
+                errors[field_name] = force_str(e)
+                continue
+            key = (field.model._meta.label, field.name)
+            if key not in looked_up:
+                if field.choices:
+                    looked_up[key] = self.get_static_choices(field)
+                else:
+                    looked_up[key] = self.get_database_choices(
+                        field.model, field)
+            if looked_up[key] is None:
+                lazy.append(field_name)
+            results[field_name] = looked_up[key] or []
 
-        return self.render_json_response({'results': results})
+        context = {'results': results}
+        if lazy:
+            context['lazy'] = lazy
+        if errors:
+            context['errors'] = errors
+        return self.render_cacheable_response(request, context)